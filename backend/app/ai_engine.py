@@ -1,12 +1,115 @@
 import os
+import asyncio
+import json
+import time
+import httpx
 import requests
-from typing import Dict, Optional
-import re
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import logging
 from dotenv import load_dotenv
 
+from .cache import GenerationCache, make_cache_key
+from .similar_prompts import SimilarPromptIndex
+from .singleflight import SingleFlight
+from .circuit_breaker import backoff_delay
+from .mermaid import MermaidDocument, MermaidParser, parse_mermaid
+from .mermaid_repair import needs_repair, repair_mermaid
+from .observability import stage
+from .prompts import PROMPT_VERSION, CompactedPrompt, fit_prompt, get_system_prompt
+from .metrics import (
+    FALLBACKS_SERVED,
+    GENERATIONS_IN_FLIGHT,
+    LLM_HEDGES,
+    LLM_REQUEST_DURATION,
+    LLM_RESPONSES,
+    LLM_RETRIES,
+    MERMAID_REPAIRS,
+    MERMAID_REPAIRS_APPLIED,
+    PROMPT_COMPACTIONS,
+    PROMPT_TOKENS,
+    fallback_reason,
+)
+from .providers import (
+    Provider,
+    ProviderSelector,
+    load_providers,
+    AI_HEDGE_ENABLED,
+    AI_HEDGE_MAX_PARALLEL,
+)
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Shared async HTTP client settings (connection pool + timeouts)
+AI_HTTP_TIMEOUT = float(os.getenv("AI_HTTP_TIMEOUT", "120"))
+AI_HTTP_CONNECT_TIMEOUT = float(os.getenv("AI_HTTP_CONNECT_TIMEOUT", "10"))
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "100"))
+AI_HTTP_MAX_KEEPALIVE = int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "20"))
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", "30"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "4"))
+# Upstream outputs longer than this (characters) are parsed in a worker thread, off the event loop
+AI_PARSE_OFFLOAD_CHARS = int(os.getenv("AI_PARSE_OFFLOAD_CHARS", "10000"))
+
+# Part of every cache key; changes with the prompt templates and token budget (see prompts.py)
+SYSTEM_PROMPT_VERSION = PROMPT_VERSION
+
+
+class MermaidStreamCleaner:
+    """
+    Streaming front end for MermaidParser
+    
+    Feed raw model output chunk by chunk; Mermaid lines are returned as soon
+    as the parser accepts them. Lines it cannot place yet (possible trailing
+    prose) are held back until a later statement confirms them, and are
+    dropped if none does. finish() returns the last lines and sets
+    `document` for validation.
+    """
+    
+    def __init__(self):
+        self._buffer = ""
+        self._chunks: List[str] = []
+        self._parser = MermaidParser()
+        self.lines: List[str] = []
+        self.document: Optional[MermaidDocument] = None
+    
+    @property
+    def started(self) -> bool:
+        return self._parser.started
+    
+    def feed(self, chunk: str) -> List[str]:
+        """Consume a chunk and return the newly confirmed Mermaid lines"""
+        self._chunks.append(chunk)
+        self._buffer += chunk
+        if "\n" not in self._buffer:
+            return []
+        *complete, self._buffer = self._buffer.split("\n")
+        out = []
+        for line in complete:
+            out.extend(self._parser.feed(line))
+        self.lines.extend(out)
+        return out
+    
+    def finish(self) -> List[str]:
+        """Flush the trailing partial line, close the parse and return any remaining lines"""
+        out = self._parser.feed(self._buffer) if self._buffer else []
+        self._buffer = ""
+        self.lines.extend(out)
+        self.document = self._parser.finish()
+        return out
+    
+    @property
+    def mermaid_code(self) -> str:
+        return "\n".join(self.lines).rstrip()
+    
+    @property
+    def text(self) -> str:
+        """Raw output received so far"""
+        return "".join(self._chunks)
+
+
 class AIEngine:
     """
     AI Engine optimized for ApiFreeLLM.com
@@ -14,95 +117,588 @@ class AIEngine:
     POST https://apifreellm.com/api/v1/chat
     Body: { "message": "string" }
     Response: { "success": true, "response": "string", ... }
+    
+    Several endpoints can be registered via AI_PROVIDERS (see providers.py);
+    calls go to the best-scoring provider and are hedged to the next one
+    when the primary is slower than its own p95.
     """
     
-    def __init__(self):
-        self.api_key = os.getenv("OPENROUTER_API_KEY")
-        # Default to correct endpoint if env is messed up, but pref from env
-        self.api_url = os.getenv("OPENROUTER_API_URL", "https://apifreellm.com/api/v1/chat")
+    def __init__(
+        self,
+        cache: Optional[GenerationCache] = None,
+        providers: Optional[List[Provider]] = None,
+        similar: Optional[SimilarPromptIndex] = None
+    ):
+        self.selector = ProviderSelector(load_providers() if providers is None else providers)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.cache = cache or GenerationCache()
+        self.similar = similar or SimilarPromptIndex()
+        self.inflight = SingleFlight()
+
+    def start(self) -> None:
+        """Create the shared keep-alive client (called on app startup)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(AI_HTTP_TIMEOUT, connect=AI_HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=AI_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=AI_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=AI_HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+
+    async def aclose(self) -> None:
+        """Close the shared client and its pooled connections (called on app shutdown)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared pooled client, created lazily if startup did not run"""
+        if self._client is None or self._client.is_closed:
+            self.start()
+        return self._client
+
+    def _parse_result(self, content: str, diagram_type: Optional[str]) -> Tuple[Optional[Dict[str, str]], str]:
+        """
+        Turn generated text into a generation result
         
-    def generate_uml(self, user_prompt: str, diagram_type: Optional[str] = None) -> Dict[str, str]:
+        Returns:
+            (result, error) - result is None when the output is not a diagram
         """
-        Generate UML diagram using ApiFreeLLM with Retry Logic
+        with stage("mermaid"):
+            document, repairs = self._repair(content, parse_mermaid(content, ast=False))
+            error = self._document_error(document)
+            if error:
+                return None, error
+            mermaid_code = document.code
+            detected_type = document.diagram_type or self._detect_diagram_type(mermaid_code)
+        
+        return {
+            "mermaid_code": mermaid_code,
+            "diagram_type": diagram_type or detected_type,
+            "success": True,
+            "repairs": repairs
+        }, ""
+
+    async def _aparse_result(self, content: str, diagram_type: Optional[str]) -> Tuple[Optional[Dict[str, str]], str]:
+        """_parse_result(), in a worker thread for outputs over AI_PARSE_OFFLOAD_CHARS"""
+        if len(content) > AI_PARSE_OFFLOAD_CHARS:
+            return await asyncio.to_thread(self._parse_result, content, diagram_type)
+        return self._parse_result(content, diagram_type)
+
+    def _repair(self, content: str, document: MermaidDocument) -> Tuple[MermaidDocument, List[str]]:
         """
-        import time
+        Fix known failure classes locally (see mermaid_repair.py) before
+        treating the output as a failed attempt
         
-        if not self.api_key:
-            return self._fallback_response(user_prompt, diagram_type, "Missing API Key")
+        Returns:
+            (document, repairs) - the repaired document, or the original one
+            with no repairs when there was nothing to do or repair failed
+        """
+        if not needs_repair(document):
+            return document, []
+        repaired, repairs = repair_mermaid(content, document)
+        if not repaired.valid:
+            MERMAID_REPAIRS.inc(outcome="failed")
+            return document, []
+        MERMAID_REPAIRS.inc(outcome="repaired")
+        for repair in repairs:
+            MERMAID_REPAIRS_APPLIED.inc(repair=repair)
+        logger.info("Repaired Mermaid output locally: %s", ", ".join(repairs))
+        return repaired, repairs
 
-        # Build prompt
-        system_instruction = self._build_system_prompt(diagram_type)
-        full_prompt = f"{system_instruction}\n\nUSER REQUEST:\n{user_prompt}"
+    def _document_error(self, document: MermaidDocument) -> str:
+        """Why parsed output cannot be returned ("" when it can); a non-empty error triggers retry / fallback"""
+        if document.header is None:
+            return "No Mermaid diagram in response"
+        if not document.valid:
+            logger.info("Rejecting invalid Mermaid output: %s", "; ".join(document.errors[:3]))
+            return f"Invalid Mermaid output ({document.errors[0]})"
+        return ""
         
-        payload = { "message": full_prompt }
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+    def cache_key(self, user_prompt: str, diagram_type: Optional[str] = None) -> str:
+        """Cache key for a request (prompt + type + system prompt version)"""
+        return make_cache_key(user_prompt, diagram_type, SYSTEM_PROMPT_VERSION)
+
+    def _similar_result(self, result: Dict[str, str], score: float) -> Dict[str, str]:
+        """A near-duplicate prompt hit, returned like a cache hit plus its similarity score"""
+        logger.info("Serving result of a similar prompt (score %.3f)", score)
+        return {**result, "success": True, "cached": True, "match_score": score}
+
+    def generate_uml(
+        self,
+        user_prompt: str,
+        diagram_type: Optional[str] = None,
+        use_cache: bool = True,
+        user_id: Optional[int] = None
+    ) -> Dict[str, str]:
+        """
+        Generate UML diagram using ApiFreeLLM with Retry Logic
         
-        max_retries = 2
+        Blocking variant kept for scripts; the API uses agenerate_uml.
+        Providers are tried in ranked order without hedging.
+        """
+        key = self.cache_key(user_prompt, diagram_type)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached:
+                return {**cached, "success": True, "cached": True}
+            similar = self.similar.lookup(user_prompt, diagram_type, user_id)
+            if similar:
+                return self._similar_result(*similar)
+
+        if not self.selector.providers:
+            return self._fallback_response(user_prompt, diagram_type, "Missing API Key")
+
+        system_prompt = self._build_system_prompt(diagram_type)
+        fitted = self._prepare_prompt(user_prompt, diagram_type)
         last_error = ""
 
-        for attempt in range(max_retries):
-            try:
-                print(f"[AI] Request attempt {attempt+1} to {self.api_url}")
+        for attempt in range(AI_MAX_RETRIES):
+            retry_after = None
+            for provider in self.selector.ranked():
+                if not provider.breaker.allow_request():
+                    continue
+                payload, headers = provider.build_request(system_prompt, fitted.text)
+                started = time.monotonic()
+                status_label = "error"
+                try:
+                    logger.debug("Request attempt %d to %s", attempt + 1, provider.name)
+                    
+                    with stage("upstream"):
+                        response = requests.post(
+                            provider.url,
+                            json=payload,
+                            headers=headers,
+                            timeout=AI_HTTP_TIMEOUT
+                        )
+                    status_label = str(response.status_code)
+                    
+                    if response.status_code == 429:
+                        logger.warning("Rate limited (429) by %s", provider.name)
+                        last_error = "Rate limit (429)"
+                        retry_after = response.headers.get("Retry-After")
+                    elif response.status_code != 200:
+                        last_error = f"Status {response.status_code}"
+                        logger.warning("Upstream %s returned %s: %s", provider.name, response.status_code, response.text[:200])
+                    else:
+                        content, last_error = provider.extract_content(response.json())
+                        parsed, last_error = self._parse_result(content, diagram_type) if content else (None, last_error)
+                        if parsed:
+                            logger.info("Generation succeeded via %s", provider.name)
+                            self._record_call(provider, started, status_label, ok=True)
+                            parsed["prompt_compaction"] = fitted.steps
+                            self.cache.set(key, parsed)
+                            self.similar.add_result(key, user_prompt, parsed)
+                            return parsed
+
+                except requests.exceptions.Timeout:
+                    last_error = "Timeout"
+                    status_label = "timeout"
+                except Exception as e:
+                    last_error = str(e)
+                    logger.warning("Upstream %s call failed: %s", provider.name, e)
                 
-                response = requests.post(
-                    self.api_url,
-                    json=payload,
-                    headers=headers,
-                    timeout=120
+                self._record_call(provider, started, status_label, ok=False)
+            else:
+                last_error = last_error or "Circuit open"
+            
+            if attempt + 1 < AI_MAX_RETRIES:
+                delay = backoff_delay(attempt, retry_after)
+                if delay is None:
+                    break
+                LLM_RETRIES.inc(mode="sync")
+                time.sleep(delay)
+        
+        # If loop finishes without return
+        return self._fallback_response(user_prompt, diagram_type, last_error)
+
+    async def agenerate_uml(
+        self,
+        user_prompt: str,
+        diagram_type: Optional[str] = None,
+        use_cache: bool = True,
+        user_id: Optional[int] = None
+    ) -> Dict[str, str]:
+        """
+        Generate UML diagram without blocking a worker thread
+        
+        Uses the shared pooled client so connections are reused across requests.
+        With use_cache=False the cache lookup is skipped but the fresh result
+        still replaces the cached one. Concurrent identical requests share a
+        single upstream call.
+        
+        After an exact cache miss, a paraphrase of an earlier prompt (or of
+        one of user_id's saved diagrams) is served from the similar-prompt
+        index, with its similarity as "match_score".
+        """
+        key = self.cache_key(user_prompt, diagram_type)
+        if use_cache:
+            cached = await self.cache.aget(key)
+            if cached:
+                return {**cached, "success": True, "cached": True}
+            similar = await self.similar.alookup(user_prompt, diagram_type, user_id)
+            if similar:
+                return self._similar_result(*similar)
+
+        with GENERATIONS_IN_FLIGHT.track(mode="generate"):
+            result = await self.inflight.do(
+                key, lambda: self._agenerate_upstream(user_prompt, diagram_type, key)
+            )
+        return dict(result)
+
+    async def agenerate_batch(
+        self,
+        items: List[Tuple[str, Optional[str], bool]],
+        concurrency: int = AI_BATCH_CONCURRENCY,
+        user_id: Optional[int] = None
+    ) -> List[object]:
+        """
+        Generate several diagrams with at most `concurrency` upstream calls at once
+        
+        Args:
+            items: (user_prompt, diagram_type, use_cache) tuples
+            concurrency: Maximum simultaneous generations
+            user_id: Requesting user (see agenerate_uml)
+        
+        Returns:
+            Results in request order; a failed item is its exception instead of a dict
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def run(user_prompt, diagram_type, use_cache):
+            async with semaphore:
+                return await self.agenerate_uml(user_prompt, diagram_type, use_cache, user_id)
+        
+        return await asyncio.gather(
+            *(run(*item) for item in items),
+            return_exceptions=True
+        )
+
+    async def _agenerate_upstream(self, user_prompt: str, diagram_type: Optional[str], key: str) -> Dict[str, str]:
+        """Upstream call with hedging and retries; caches the result on success"""
+        if not self.selector.providers:
+            return self._fallback_response(user_prompt, diagram_type, "Missing API Key")
+
+        system_prompt = self._build_system_prompt(diagram_type)
+        fitted = self._prepare_prompt(user_prompt, diagram_type)
+        last_error = ""
+
+        for attempt in range(AI_MAX_RETRIES):
+            candidates = self.selector.ranked()
+            if not candidates:
+                last_error = last_error or "Circuit open"
+                break
+            
+            parsed, last_error, retry_after = await self._hedged_call(
+                candidates, system_prompt, fitted.text, diagram_type
+            )
+            if parsed:
+                parsed["prompt_compaction"] = fitted.steps
+                await self.cache.aset(key, parsed)
+                self.similar.add_result(key, user_prompt, parsed)
+                return parsed
+            
+            if attempt + 1 < AI_MAX_RETRIES:
+                delay = backoff_delay(attempt, retry_after)
+                if delay is None:
+                    break
+                LLM_RETRIES.inc(mode="async")
+                await asyncio.sleep(delay)
+        
+        return self._fallback_response(user_prompt, diagram_type, last_error)
+
+    async def _hedged_call(
+        self,
+        candidates: List[Provider],
+        system_prompt: str,
+        user_prompt: str,
+        diagram_type: Optional[str]
+    ) -> Tuple[Optional[Dict[str, str]], str, Optional[str]]:
+        """
+        Race providers for one attempt
+        
+        The best provider starts first. If it has not answered within its
+        p95 latency (or fails), the next provider is started; the first valid
+        diagram wins and the remaining calls are cancelled.
+        
+        Returns:
+            (result, last_error, retry_after)
+        """
+        remaining = list(candidates)
+        running: Dict[asyncio.Task, Provider] = {}
+        last_error, retry_after = "Circuit open", None
+        max_parallel = AI_HEDGE_MAX_PARALLEL if AI_HEDGE_ENABLED else 1
+
+        def launch_next() -> Optional[Provider]:
+            while remaining:
+                provider = remaining.pop(0)
+                if provider.breaker.allow_request():
+                    task = asyncio.ensure_future(
+                        self._call_provider(provider, system_prompt, user_prompt, diagram_type)
+                    )
+                    running[task] = provider
+                    return provider
+            return None
+
+        newest = launch_next()
+        try:
+            while running:
+                can_hedge = remaining and len(running) < max_parallel
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=newest.hedge_delay() if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
                 )
-                
-                if response.status_code == 429:
-                    print(f"[AI] Rate limited (429). Waiting 6 seconds...")
-                    time.sleep(6)
-                    last_error = "Rate limit (429)"
+                if not done:
+                    logger.info("%s slower than p95, hedging", newest.name)
+                    hedge = launch_next()
+                    if hedge is not None:
+                        LLM_HEDGES.inc(provider=hedge.name)
+                    newest = hedge or newest
                     continue
                 
-                if response.status_code != 200:
-                    last_error = f"Status {response.status_code}"
-                    print(f"[AI] Error: {response.text}")
-                    continue
+                for task in done:
+                    running.pop(task)
+                    parsed, error, task_retry_after = task.result()
+                    if parsed:
+                        return parsed, "", None
+                    last_error = error
+                    retry_after = task_retry_after or retry_after
                 
-                # Success path
-                result = response.json()
-                if not result.get("success", True):
-                    last_error = f"API success=false: {result}"
-                    continue
+                if not running:
+                    # Everything in flight failed - fail over immediately
+                    newest = launch_next() or newest
+        finally:
+            for task in running:
+                task.cancel()
+        
+        return None, last_error, retry_after
+
+    async def _call_provider(
+        self,
+        provider: Provider,
+        system_prompt: str,
+        user_prompt: str,
+        diagram_type: Optional[str]
+    ) -> Tuple[Optional[Dict[str, str]], str, Optional[str]]:
+        """One request to one provider, recording latency and breaker outcome"""
+        payload, headers = provider.build_request(system_prompt, user_prompt)
+        started = time.monotonic()
+        retry_after = None
+        status_label = "error"
+        try:
+            logger.debug("Request to %s", provider.name)
+            
+            with stage("upstream"):
+                response = await self.client.post(provider.url, json=payload, headers=headers)
+            status_label = str(response.status_code)
+            
+            if response.status_code == 429:
+                logger.warning("Rate limited (429) by %s", provider.name)
+                last_error = "Rate limit (429)"
+                retry_after = response.headers.get("Retry-After")
+            elif response.status_code != 200:
+                last_error = f"Status {response.status_code}"
+                logger.warning("Upstream %s returned %s: %s", provider.name, response.status_code, response.text[:200])
+            else:
+                content, last_error = provider.extract_content(response.json())
+                parsed, last_error = await self._aparse_result(content, diagram_type) if content else (None, last_error)
+                if parsed:
+                    logger.info("Generation succeeded via %s", provider.name)
+                    self._record_call(provider, started, status_label, ok=True)
+                    return parsed, "", None
+
+        except httpx.TimeoutException:
+            last_error = "Timeout"
+            status_label = "timeout"
+        except asyncio.CancelledError:
+            # Lost a hedge race; not a provider failure
+            LLM_RESPONSES.inc(provider=provider.name, status="cancelled")
+            raise
+        except Exception as e:
+            last_error = str(e)
+            logger.warning("Upstream %s call failed: %s", provider.name, e)
+        
+        self._record_call(provider, started, status_label, ok=False)
+        return None, last_error, retry_after
+
+    def _record_call(self, provider: Provider, started: float, status_label: str, ok: bool) -> None:
+        """Feed one upstream call into provider stats, its breaker and /metrics"""
+        elapsed = time.monotonic() - started
+        provider.record(elapsed, ok=ok)
+        if ok:
+            provider.breaker.record_success()
+        else:
+            provider.breaker.record_failure()
+        LLM_RESPONSES.inc(provider=provider.name, status=status_label)
+        LLM_REQUEST_DURATION.observe(elapsed, provider=provider.name, outcome="success" if ok else "failure")
+
+    async def astream_uml(
+        self,
+        user_prompt: str,
+        diagram_type: Optional[str] = None,
+        use_cache: bool = True,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Stream a diagram as (event, data) pairs
+        
+        Yields ("line", {"line": ...}) for each cleaned Mermaid line as it
+        arrives from upstream, then a single ("done", {...}) carrying the full
+        code and detected diagram_type. Upstream SSE (OpenAI-style deltas) is
+        consumed incrementally; a plain JSON body is cleaned in one go.
+        Streams are not hedged; a provider that fails before producing any
+        output is failed over to the next one.
+        """
+        key = self.cache_key(user_prompt, diagram_type)
+        if use_cache:
+            cached = await self.cache.aget(key)
+            if cached:
+                for line in cached["mermaid_code"].split("\n"):
+                    yield "line", {"line": line}
+                yield "done", {**cached, "success": True, "cached": True}
+                return
+            similar = await self.similar.alookup(user_prompt, diagram_type, user_id)
+            if similar:
+                result = self._similar_result(*similar)
+                for line in result["mermaid_code"].split("\n"):
+                    yield "line", {"line": line}
+                yield "done", result
+                return
+
+        with GENERATIONS_IN_FLIGHT.track(mode="stream"):
+            async for event in self._astream_upstream(user_prompt, diagram_type, key):
+                yield event
+
+    async def _astream_upstream(
+        self,
+        user_prompt: str,
+        diagram_type: Optional[str],
+        key: str
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """Upstream half of astream_uml: stream with failover, then fall back"""
+        last_error = "Missing API Key"
+        if self.selector.providers:
+            system_prompt = self._build_system_prompt(diagram_type)
+            fitted = self._prepare_prompt(user_prompt, diagram_type)
+            last_error = ""
+            
+            for attempt in range(AI_MAX_RETRIES):
+                retry_after = None
+                for provider in self.selector.ranked():
+                    if not provider.breaker.allow_request():
+                        continue
+                    payload, headers = provider.build_request(system_prompt, fitted.text, stream=True)
+                    cleaner = MermaidStreamCleaner()
+                    started = time.monotonic()
+                    status_label = "error"
+                    try:
+                        logger.debug("Stream attempt %d to %s", attempt + 1, provider.name)
+                        async with self.client.stream("POST", provider.url, json=payload, headers=headers) as response:
+                            status_label = str(response.status_code)
+                            if response.status_code == 429:
+                                last_error = "Rate limit (429)"
+                                retry_after = response.headers.get("Retry-After")
+                            elif response.status_code != 200:
+                                await response.aread()
+                                last_error = f"Status {response.status_code}"
+                                logger.warning("Upstream %s returned %s: %s", provider.name, response.status_code, response.text[:200])
+                            else:
+                                async for text in self._iter_stream_text(response, provider):
+                                    for line in cleaner.feed(text):
+                                        yield "line", {"line": line}
+                                
+                                for line in cleaner.finish():
+                                    yield "line", {"line": line}
+                                with stage("mermaid"):
+                                    if len(cleaner.text) > AI_PARSE_OFFLOAD_CHARS:
+                                        document, repairs = await asyncio.to_thread(self._repair, cleaner.text, cleaner.document)
+                                    else:
+                                        document, repairs = self._repair(cleaner.text, cleaner.document)
+                                last_error = self._document_error(document)
+                        
+                        if response.status_code == 200 and not last_error:
+                            self._record_call(provider, started, status_label, ok=True)
+                            # The done event carries the full (possibly repaired) code
+                            result = {
+                                "mermaid_code": document.code,
+                                "diagram_type": diagram_type or document.diagram_type or self._detect_diagram_type(document.code),
+                                "success": True,
+                                "repairs": repairs,
+                                "prompt_compaction": fitted.steps
+                            }
+                            await self.cache.aset(key, result)
+                            self.similar.add_result(key, user_prompt, result)
+                            yield "done", {**result, "cached": False}
+                            return
+                    
+                    except httpx.TimeoutException:
+                        last_error = "Timeout"
+                        status_label = "timeout"
+                    except Exception as e:
+                        last_error = str(e)
+                        logger.warning("Upstream %s call failed: %s", provider.name, e)
                     
-                content = result.get("response", "")
-                if not content:
-                     last_error = "Empty response"
-                     continue
-
-                mermaid_code = self._clean_mermaid_code(content)
-                detected_type = self._detect_diagram_type(mermaid_code)
-                print(f"[AI] Success!")
+                    self._record_call(provider, started, status_label, ok=False)
+                    if cleaner.lines:
+                        # Lines already reached the client; a retry would duplicate them
+                        yield "error", {"error": last_error}
+                        return
+                else:
+                    last_error = last_error or "Circuit open"
                 
-                return {
-                    "mermaid_code": mermaid_code,
-                    "diagram_type": diagram_type or detected_type,
-                    "success": True
-                }
-
-            except requests.exceptions.Timeout:
-                last_error = "Timeout"
-            except Exception as e:
-                last_error = str(e)
-                print(f"[AI] Exception: {e}")
+                if attempt + 1 < AI_MAX_RETRIES:
+                    delay = backoff_delay(attempt, retry_after)
+                    if delay is None:
+                        break
+                    LLM_RETRIES.inc(mode="stream")
+                    await asyncio.sleep(delay)
         
-        # If loop finishes without return
-        return self._fallback_response(user_prompt, diagram_type, last_error)
+        fallback = self._fallback_response(user_prompt, diagram_type, last_error)
+        for line in fallback["mermaid_code"].split("\n"):
+            yield "line", {"line": line}
+        yield "done", {**fallback, "cached": False}
+
+    async def _iter_stream_text(self, response: httpx.Response, provider: Provider) -> AsyncIterator[str]:
+        """Extract generated text from an upstream streaming (or plain JSON) response"""
+        if "text/event-stream" not in response.headers.get("content-type", ""):
+            body = await response.aread()
+            content, error = provider.extract_content(json.loads(body))
+            if error:
+                raise ValueError(error)
+            yield content
+            return
+        
+        async for raw in response.aiter_lines():
+            if not raw.startswith("data:"):
+                continue
+            data = raw[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                event = json.loads(data)
+            except ValueError:
+                yield data
+                continue
+            if "choices" in event:
+                delta = event["choices"][0].get("delta") or event["choices"][0].get("message") or {}
+                yield delta.get("content") or ""
+            else:
+                yield event.get("response", "")
 
     def _fallback_response(self, user_prompt, diagram_type, error_msg):
         """Helper to return static fallback"""
-        print(f"[AI] Triggering static fallback due to: {error_msg}")
+        logger.warning("Serving static fallback: %s", error_msg)
+        FALLBACKS_SERVED.inc(reason=fallback_reason(error_msg))
         fallback_code = self._generate_static_fallback(user_prompt, diagram_type)
         return {
             "mermaid_code": fallback_code,
             "diagram_type": diagram_type or "class",
             "success": True,
+            "fallback": True,
             "note": f"Offline mode: {error_msg}"
         }
 
@@ -123,15 +719,15 @@ class AIEngine:
     Note right of System: Offline generated (AI unavailable)"""
             
         elif diagram_type == "usecase":
-            return """usecaseDiagram
-    actor User
-    actor Admin
+            return """flowchart LR
+    User(("User"))
+    Admin(("Admin"))
     
-    package System {
-        usecase "Login" as UC1
-        usecase "Perform Action" as UC2
-        usecase "View Reports" as UC3
-    }
+    subgraph System ["System"]
+        UC1(["Login"])
+        UC2(["Perform Action"])
+        UC3(["View Reports"])
+    end
 
     User --> UC1
     User --> UC2
@@ -154,64 +750,35 @@ class AIEngine:
     note "AI Service Unavailable\nShowing template diagram" """
 
     def _build_system_prompt(self, diagram_type: Optional[str] = None) -> str:
-        """Build the system prompt for AI model"""
-        base_prompt = """You are a UML diagram code generator. Output ONLY valid Mermaid syntax.
-
-IMPORTANT INSTRUCTIONS:
-1. DO NOT explain your thinking
-2. DO NOT write any text before the code
-3. DO NOT write any text after the code
-4. DO NOT use markdown code blocks
-5. Start IMMEDIATELY with the diagram keyword (classDiagram, sequenceDiagram, etc.)
+        """Precompiled system prompt for the diagram type (see prompts.py)"""
+        return get_system_prompt(diagram_type)
 
-Your ENTIRE response must be ONLY the Mermaid code.
+    def _prepare_prompt(self, user_prompt: str, diagram_type: Optional[str] = None) -> CompactedPrompt:
+        """
+        User prompt as sent upstream: compacted to AI_PROMPT_TOKEN_BUDGET together with the system prompt
 
-CORRECT example:
-classDiagram
-    class User {
-        +String name
-    }
-"""
-        if diagram_type == "class":
-            return base_prompt + "\nGenerate a Class Diagram."
-        elif diagram_type == "sequence":
-            return base_prompt + "\nGenerate a Sequence Diagram."
-        elif diagram_type == "usecase":
-            return base_prompt + "\nGenerate a Use Case Diagram."
-        elif diagram_type == "activity":
-            return base_prompt + "\nGenerate an Activity Diagram."
-        else:
-            return base_prompt + "\nDetermine the diagram type from the user prompt."
+        The steps applied are returned with the result as "prompt_compaction",
+        so clients can warn when part of a long prompt was left out.
+        """
+        with stage("prompt"):
+            fitted = fit_prompt(user_prompt, diagram_type)
+        PROMPT_TOKENS.observe(fitted.original_tokens, stage="original")
+        PROMPT_TOKENS.observe(fitted.tokens, stage="sent")
+        if fitted.steps:
+            for step in fitted.steps:
+                PROMPT_COMPACTIONS.inc(step=step)
+            logger.info(
+                "Compacted prompt from ~%d to ~%d tokens (%s)",
+                fitted.original_tokens, fitted.tokens, ", ".join(fitted.steps)
+            )
+        return fitted
 
     def _clean_mermaid_code(self, code: str) -> str:
-        """Clean up the AI output to extract only the mermaid code"""
-        # Remove mermaid markdown blocks
-        code = re.sub(r'```mermaid\s*', '', code)
-        code = re.sub(r'```', '', code)
-        
-        # Simple extraction of diagram lines
-        lines = code.split('\n')
-        vm_code_lines = []
-        started = False
-        
-        diagram_keywords = ['classDiagram', 'sequenceDiagram', 'erDiagram', 'flowchart', 'graph', 'gantt', 'pie', 'stateDiagram', 'journey', 'usecaseDiagram']
-        
-        for line in lines:
-            stripped = line.strip()
-            if not started:
-                for kw in diagram_keywords:
-                    # Check if line starts with keyword
-                    if stripped.startswith(kw) or (kw == 'graph' and 'graph' in stripped): 
-                        started = True
-                        vm_code_lines.append(line)
-                        break
-            else:
-                vm_code_lines.append(line)
-        
-        if vm_code_lines:
-            return '\n'.join(vm_code_lines)
-            
-        return code.strip()
+        """Extract the diagram from AI output: fences, preamble and trailing prose removed"""
+        document = parse_mermaid(code, ast=False)
+        if document.header is not None:
+            return document.code
+        return code.replace("```mermaid", "").replace("```", "").strip()
 
     def _detect_diagram_type(self, code: str) -> str:
         """Detect diagram type from code"""
@@ -8,19 +8,32 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 import os
+import logging
 from dotenv import load_dotenv
 
-from .database import get_db
+from .database import get_async_db
+from .cache import TTLCache
+from .observability import stage
 from . import models
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+# Hot-path caches: verified token -> user id, user id -> detached User row
+_token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+_user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -84,7 +97,7 @@ def decode_access_token(token: str) -> dict:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
     except JWTError as e:
-        print(f"[AUTH] JWT decode error: {type(e).__name__}: {str(e)}")
+        logger.info("JWT decode error: %s: %s", type(e).__name__, e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Could not validate credentials: {str(e)}",
@@ -92,16 +105,19 @@ def decode_access_token(token: str) -> dict:
         )
 
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> models.User:
     """
     Dependency to get current authenticated user
     
+    Verified tokens and user rows are cached for AUTH_CACHE_TTL seconds, so
+    the hot path usually skips both jwt.decode and the users SELECT.
+    
     Args:
         credentials: HTTP Bearer credentials
-        db: Database session
+        db: Async database session
     
     Returns:
         Current user model
@@ -109,19 +125,42 @@ def get_current_user(
     Raises:
         HTTPException: If authentication fails
     """
-    token = credentials.credentials
-    print(f"[AUTH] Received token: {token[:20]}..." if token else "[AUTH] No token received")
-    
-    try:
+    with stage("auth"):
+        return await _resolve_user(credentials.credentials, db)
+
+
+async def _resolve_user(token: str, db: AsyncSession) -> models.User:
+    """Token -> User, consulting the token and user caches first"""
+    user_id = _token_cache.get(token)
+    if user_id is None:
         payload = decode_access_token(token)
-        print(f"[AUTH] Token decoded successfully. Payload: {payload}")
-    except Exception as e:
-        print(f"[AUTH] Token decode failed: {e}")
-        raise
+        user_id = _user_id_from_payload(payload)
+        # Never trust a cached token beyond its own expiry
+        ttl = min(AUTH_CACHE_TTL, payload.get("exp", 0) - datetime.utcnow().timestamp())
+        if ttl > 0:
+            _token_cache.set(token, user_id, ttl=ttl)
     
-    user_id: int = payload.get("sub")
+    user = _user_cache.get(user_id)
+    if user is None:
+        result = await db.execute(select(models.User).where(models.User.id == user_id))
+        user = result.scalar_one_or_none()
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        # Detach so the row can be shared across requests without a session
+        db.expunge(user)
+        _user_cache.set(user_id, user)
+    
+    return user
+
+
+def _user_id_from_payload(payload: dict) -> int:
+    """Extract the integer user id from a decoded token payload"""
+    user_id = payload.get("sub")
     if user_id is None:
-        print("[AUTH] No user_id in token payload")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -129,48 +168,43 @@ def get_current_user(
         )
     
     # Convert to int if it's a string (JWT spec requires sub to be string)
-    if isinstance(user_id, str):
-        try:
-            user_id = int(user_id)
-        except ValueError:
-            print(f"[AUTH] Invalid user_id format: {user_id}")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token format",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
-        print(f"[AUTH] User not found for id: {user_id}")
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
+            detail="Invalid token format",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    print(f"[AUTH] User authenticated: {user.email}")
-    return user
 
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[models.User]:
+def invalidate_user_cache(user_id: int) -> None:
+    """Drop a cached user (call after deleting a user or changing their plan/role)"""
+    _user_cache.pop(user_id)
+
+
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[models.User]:
     """
     Authenticate a user by email and password
     
+    bcrypt is CPU-bound, so the hash check runs in the threadpool instead of
+    blocking the event loop.
+    
     Args:
-        db: Database session
+        db: Async database session
         email: User email
         password: Plain text password
     
     Returns:
         User model if authentication succeeds, None otherwise
     """
-    user = db.query(models.User).filter(models.User.email == email).first()
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    user = result.scalar_one_or_none()
     
     if not user:
         return None
     
-    if not verify_password(password, user.password_hash):
+    if not await run_in_threadpool(verify_password, password, user.password_hash):
         return None
     
     return user
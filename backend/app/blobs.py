@@ -0,0 +1,190 @@
+"""
+Content-addressed blob storage - deduplicated, compressed prompt and Mermaid text
+"""
+
+import hashlib
+import logging
+import os
+import zlib
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import inspect, select, text, update
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+BLOB_COMPRESSION_LEVEL = int(os.getenv("BLOB_COMPRESSION_LEVEL", "6"))
+BLOB_MIGRATION_BATCH = int(os.getenv("BLOB_MIGRATION_BATCH", "500"))
+
+RAW = "raw"
+ZLIB = "zlib"
+
+
+def content_hash(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def encode(value: str) -> Tuple[str, bytes]:
+    """(codec, data) for a text; short texts that don't shrink are kept raw"""
+    raw = value.encode("utf-8")
+    compressed = zlib.compress(raw, BLOB_COMPRESSION_LEVEL)
+    if len(compressed) < len(raw):
+        return ZLIB, compressed
+    return RAW, raw
+
+
+def decode(codec: str, data: bytes) -> str:
+    if codec == ZLIB:
+        data = zlib.decompress(data)
+    return bytes(data).decode("utf-8")
+
+
+def acquire(connection, value: str) -> str:
+    """
+    Store `value` (or take another reference to the identical stored text)
+
+    Runs on the flushing connection, so the reference commits or rolls back
+    with the row that holds it.
+
+    Returns:
+        The content hash to store on the referencing row
+    """
+    from .models import Blob
+
+    digest = content_hash(value)
+    blobs = Blob.__table__
+    bumped = connection.execute(
+        update(blobs).where(blobs.c.hash == digest).values(refcount=blobs.c.refcount + 1)
+    )
+    if bumped.rowcount:
+        return digest
+
+    codec, data = encode(value)
+    insert = _upsert(connection.dialect.name, blobs).values(
+        hash=digest, codec=codec, data=data, size=len(value), refcount=1
+    )
+    connection.execute(insert.on_conflict_do_update(
+        index_elements=[blobs.c.hash], set_={"refcount": blobs.c.refcount + 1}
+    ) if hasattr(insert, "on_conflict_do_update") else insert)
+    return digest
+
+
+def acquire_many(connection, values: List[str]) -> List[str]:
+    """
+    acquire() for a batch of texts in one executemany upsert
+
+    Duplicates within the batch collapse into one row whose refcount grows
+    by the number of references.
+
+    Returns:
+        Content hashes in the order of `values`
+    """
+    from .models import Blob
+
+    blobs = Blob.__table__
+    insert = _upsert(connection.dialect.name, blobs)
+    if not hasattr(insert, "on_conflict_do_update"):
+        return [acquire(connection, value) for value in values]
+
+    digests = [content_hash(value) for value in values]
+    references = Counter(digests)
+    texts = dict(zip(digests, values))
+    rows = []
+    for digest, count in references.items():
+        codec, data = encode(texts[digest])
+        rows.append({"hash": digest, "codec": codec, "data": data, "size": len(texts[digest]), "refcount": count})
+    connection.execute(
+        insert.on_conflict_do_update(
+            index_elements=[blobs.c.hash], set_={"refcount": blobs.c.refcount + insert.excluded.refcount}
+        ),
+        rows
+    )
+    return digests
+
+
+def release(connection, digest: Optional[str]) -> None:
+    """Drop one reference; the blob is deleted when nothing refers to it"""
+    if not digest:
+        return
+    from .models import Blob
+
+    blobs = Blob.__table__
+    connection.execute(
+        update(blobs).where(blobs.c.hash == digest).values(refcount=blobs.c.refcount - 1)
+    )
+    connection.execute(blobs.delete().where(blobs.c.hash == digest, blobs.c.refcount <= 0))
+
+
+def _upsert(dialect: str, table):
+    """INSERT that supports ON CONFLICT where the dialect has it (races on new blobs)"""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table)
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table)
+    return table.insert()
+
+
+def migrate_diagram_storage() -> int:
+    """
+    Move inline diagram text into blobs
+
+    Adds the prompt_hash / code_hash / preview columns to an existing
+    diagrams table, then moves rows in batches of BLOB_MIGRATION_BATCH:
+    each row's text is stored (deduplicated) as blobs and its inline
+    prompt / mermaid_code columns are emptied. Safe to re-run; rows already
+    moved are skipped. On Postgres run VACUUM afterwards to reclaim space.
+
+    Returns:
+        Number of rows moved
+    """
+    from .database import engine
+    from .models import Diagram, PREVIEW_LENGTH
+
+    existing = {column["name"] for column in inspect(engine).get_columns("diagrams")}
+    with engine.begin() as conn:
+        for name, ddl in (
+            ("prompt_hash", "VARCHAR(64)"),
+            ("code_hash", "VARCHAR(64)"),
+            ("preview", f"VARCHAR({PREVIEW_LENGTH})"),
+        ):
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE diagrams ADD COLUMN {name} {ddl}"))
+
+    diagrams = Diagram.__table__
+    moved = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(diagrams.c.id, diagrams.c.prompt, diagrams.c.mermaid_code)
+                .where(diagrams.c.prompt_hash.is_(None))
+                .order_by(diagrams.c.id)
+                .limit(BLOB_MIGRATION_BATCH)
+            ).all()
+            for row in rows:
+                conn.execute(update(diagrams).where(diagrams.c.id == row.id).values(
+                    prompt_hash=acquire(conn, row.prompt),
+                    code_hash=acquire(conn, row.mermaid_code),
+                    preview=row.prompt[:PREVIEW_LENGTH],
+                    prompt="",
+                    mermaid_code=""
+                ))
+        if not rows:
+            break
+        moved += len(rows)
+        logger.info("Moved %d diagrams into blob storage", moved)
+    return moved
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from .database import init_db
+    from . import models  # noqa: F401 - register tables
+
+    init_db()
+    print(f"Migrated {migrate_diagram_storage()} diagrams")
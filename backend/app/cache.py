@@ -0,0 +1,216 @@
+"""
+Generation result cache - bounded in-process LRU with TTL plus an optional DB tier
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "1024"))
+GENERATION_CACHE_TTL = int(os.getenv("GENERATION_CACHE_TTL", "86400"))
+GENERATION_CACHE_DB = os.getenv("GENERATION_CACHE_DB", "false").lower() in ("1", "true", "yes")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share a key"""
+    return " ".join(prompt.split()).casefold()
+
+
+def make_cache_key(prompt: str, diagram_type: Optional[str], prompt_version: str) -> str:
+    """
+    Content-addressed key for a generation request
+
+    Args:
+        prompt: Raw user prompt
+        diagram_type: Requested diagram type (None for auto-detect)
+        prompt_version: Version of the system prompt used upstream
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    material = f"{prompt_version}\x00{diagram_type or ''}\x00{normalize_prompt(prompt)}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU dict with per-entry expiry
+
+    Used as the memory tier of GenerationCache and for short-lived lookups
+    elsewhere (e.g. verified tokens and users in auth).
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[object, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the live value for key, or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        """Store value, evicting the least recently used entries beyond max_size"""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class GenerationCache:
+    """
+    Two-tier cache of successful generation results
+
+    Tier 1 is a thread-safe LRU dict bounded by max_size with per-entry TTL.
+    Tier 2 (optional) is the generation_cache table, used when a session
+    factory is supplied; DB hits are promoted into the LRU.
+    """
+
+    def __init__(
+        self,
+        max_size: int = GENERATION_CACHE_SIZE,
+        ttl: int = GENERATION_CACHE_TTL,
+        session_factory: Optional[Callable] = None
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self._memory = TTLCache(max_size, ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @property
+    def persistent(self) -> bool:
+        return self.session_factory is not None
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        """Look up a result, checking memory first and then the DB tier"""
+        value = self._memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return dict(value)
+
+        value = self._db_get(key) if self.persistent else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+        self._memory.set(key, value)
+        return dict(value)
+
+    def set(self, key: str, value: Dict[str, str]) -> None:
+        """Store a result in both tiers"""
+        value = {"mermaid_code": value["mermaid_code"], "diagram_type": value["diagram_type"]}
+        self._memory.set(key, value)
+        if self.persistent:
+            self._db_set(key, value)
+
+    async def aget(self, key: str) -> Optional[Dict[str, str]]:
+        """Async lookup; the DB tier is queried off the event loop"""
+        if self.persistent:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, value: Dict[str, str]) -> None:
+        """Async store; the DB tier is written off the event loop"""
+        if self.persistent:
+            await asyncio.to_thread(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def clear(self) -> None:
+        """Drop all in-memory entries (the DB tier is left untouched)"""
+        self._memory.clear()
+
+    def stats(self) -> Dict[str, object]:
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                "size": len(self._memory),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "persistent": self.persistent,
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+    def _db_get(self, key: str) -> Optional[Dict[str, str]]:
+        from .models import GenerationCacheEntry
+
+        db = self.session_factory()
+        try:
+            entry = db.get(GenerationCacheEntry, key)
+            if entry is None:
+                return None
+            if entry.created_at < datetime.utcnow() - timedelta(seconds=self.ttl):
+                db.delete(entry)
+                db.commit()
+                return None
+            return {"mermaid_code": entry.mermaid_code, "diagram_type": entry.diagram_type}
+        except Exception as e:
+            logger.warning("Generation cache DB lookup failed: %s", e)
+            return None
+        finally:
+            db.close()
+
+    def _db_set(self, key: str, value: Dict[str, str]) -> None:
+        from .models import GenerationCacheEntry
+
+        db = self.session_factory()
+        try:
+            db.merge(GenerationCacheEntry(
+                key=key,
+                mermaid_code=value["mermaid_code"],
+                diagram_type=value["diagram_type"],
+                created_at=datetime.utcnow()
+            ))
+            db.commit()
+        except Exception as e:
+            logger.warning("Generation cache DB write failed: %s", e)
+            db.rollback()
+        finally:
+            db.close()
@@ -0,0 +1,148 @@
+"""
+Circuit breaker and retry backoff for upstream LLM calls
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+AI_BREAKER_FAILURE_THRESHOLD = int(os.getenv("AI_BREAKER_FAILURE_THRESHOLD", "5"))
+AI_BREAKER_RECOVERY_TIMEOUT = float(os.getenv("AI_BREAKER_RECOVERY_TIMEOUT", "30"))
+AI_BACKOFF_BASE = float(os.getenv("AI_BACKOFF_BASE", "0.5"))
+AI_BACKOFF_MAX = float(os.getenv("AI_BACKOFF_MAX", "10"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker shared by every request
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    callers are refused immediately. Once `recovery_timeout` has passed it
+    goes half-open and lets one probe through per timeout window: a success
+    closes it, a failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = AI_BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout: float = AI_BREAKER_RECOVERY_TIMEOUT
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a call may go upstream right now"""
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_half_open(now)
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and (
+                self._probe_started_at is None
+                or now - self._probe_started_at >= self.recovery_timeout
+            ):
+                self._probe_started_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.times_opened += 1
+                    logger.warning("Circuit opened after %d consecutive failures", self._failures)
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started_at = None
+
+    def snapshot(self) -> Dict[str, object]:
+        """State for /health"""
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "retry_in_seconds": round(max(0.0, self._opened_at + self.recovery_timeout - now), 1)
+                if self._state == OPEN else 0.0,
+            }
+
+    def _maybe_half_open(self, now: float) -> None:
+        if self._state == OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probe_started_at = None
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(
+    attempt: int,
+    retry_after: Optional[str] = None,
+    base: float = AI_BACKOFF_BASE,
+    cap: float = AI_BACKOFF_MAX
+) -> Optional[float]:
+    """
+    Seconds to wait before retry number attempt+1
+
+    Honors Retry-After when present; otherwise exponential backoff with
+    full jitter. Returns None when the server asks for a longer wait than
+    `cap`, meaning the caller should stop retrying.
+    """
+    requested = parse_retry_after(retry_after)
+    if requested is not None:
+        return requested if requested <= cap else None
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -2,12 +2,18 @@
 Database configuration and session management
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
+from .metrics import register_pool_metrics
+from .observability import instrument_engine
+
 load_dotenv()
 
 # Get database URL from environment
@@ -20,11 +26,87 @@ if not DATABASE_URL:
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL, echo=True)
+# Connection pool settings (ignored for SQLite, which uses its own pool classes)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+
+
+def _async_url(url: str) -> str:
+    """
+    Map the sync DATABASE_URL onto its async driver
+
+    postgresql -> postgresql+asyncpg, sqlite -> sqlite+aiosqlite. libpq's
+    sslmode query parameter is translated to asyncpg's ssl.
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        query = dict(parsed.query)
+        sslmode = query.pop("sslmode", None)
+        if sslmode:
+            query["ssl"] = sslmode
+        return parsed.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return url
+
 
-# Create session factory
+def _engine_options(url: str) -> dict:
+    options = {"echo": SQL_ECHO, "pool_pre_ping": DB_POOL_PRE_PING}
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+# Sync engine: scripts (create_admin.py), init_db and thread-offloaded background work
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+instrument_engine(engine)
+
+# Engines reported by the db_pool_* gauges; the async engine joins when created
+_pool_engines = {"sync": engine}
+register_pool_metrics(_pool_engines)
+
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+_async_engine: Optional[AsyncEngine] = None
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Async engine used by request handlers
+
+    Created on first use so sync-only entry points (create_admin.py) do not
+    need the async driver installed.
+    """
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+        instrument_engine(_async_engine.sync_engine)
+        _pool_engines["async"] = _async_engine.sync_engine
+    return _async_engine
+
+
+async def dispose_async_engine() -> None:
+    """Close pooled async connections (on shutdown)"""
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _pool_engines.pop("async", None)
+        _async_engine = None
+
 
 # Base class for models
 Base = declarative_base()
@@ -42,6 +124,26 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    Dependency function to get an async database session
+    Use with FastAPI Depends in async routes
+    """
+    async with AsyncSessionLocal(bind=get_async_engine()) as db:
+        yield db
+
+
 def init_db():
-    """Initialize database tables"""
+    """Initialize database tables and any indexes added since they were created"""
     Base.metadata.create_all(bind=engine)
+    _create_missing_indexes()
+
+
+def _create_missing_indexes():
+    """create_all skips existing tables, so add indexes declared later by hand"""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
@@ -0,0 +1,266 @@
+"""
+Background generation jobs - persisted queue executed by an in-process worker pool
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from .ai_engine import AIEngine
+from .models import GenerationJob, JobStatus, User
+from .rate_limit import is_unbilled, refund_unbilled
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ACTIVE_PER_USER = int(os.getenv("JOB_MAX_ACTIVE_PER_USER", "5"))
+
+ACTIVE_STATUSES = (JobStatus.PENDING, JobStatus.RUNNING)
+
+
+class JobLimitExceeded(Exception):
+    """Raised when a user already has the maximum number of active jobs"""
+
+
+class JobQueue:
+    """
+    Persisted generation job queue
+
+    Jobs are stored in generation_jobs and their ids pushed onto an asyncio
+    queue consumed by `workers` tasks that call AIEngine.agenerate_uml.
+    On start, jobs left pending or running by a previous process are
+    re-queued. DB work runs in threads to keep the event loop free.
+    """
+
+    def __init__(
+        self,
+        engine: AIEngine,
+        session_factory: Callable,
+        workers: int = JOB_WORKERS,
+        max_active_per_user: int = JOB_MAX_ACTIVE_PER_USER
+    ):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.workers = workers
+        self.max_active_per_user = max_active_per_user
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._events: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}
+        self._submit_locks: Dict[int, asyncio.Lock] = {}
+        self._submitters: Dict[int, int] = {}
+
+    async def start(self) -> None:
+        """Re-queue unfinished jobs and start the worker pool"""
+        self._queue = asyncio.Queue()
+        for job_id in await asyncio.to_thread(self._requeue_unfinished):
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stop workers; running jobs stay RUNNING and are re-queued on next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(
+        self,
+        user_id: int,
+        prompt: str,
+        diagram_type: Optional[str] = None,
+        title: Optional[str] = None,
+        use_cache: bool = True
+    ) -> GenerationJob:
+        """
+        Persist a new job and queue it
+
+        Submits from one user are serialised, so concurrent requests cannot
+        all pass the active-job count before any of them inserts.
+
+        Raises:
+            JobLimitExceeded: If the user has too many pending/running jobs
+        """
+        lock = self._submit_locks.setdefault(user_id, asyncio.Lock())
+        self._submitters[user_id] = self._submitters.get(user_id, 0) + 1
+        try:
+            async with lock:
+                job = await asyncio.to_thread(
+                    self._create, user_id, prompt, diagram_type, title, use_cache
+                )
+        finally:
+            remaining = self._submitters.pop(user_id) - 1
+            if remaining:
+                self._submitters[user_id] = remaining
+            else:
+                del self._submit_locks[user_id]
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._queue.put_nowait(job.id)
+        return job
+
+    async def get(self, job_id: str) -> Optional[GenerationJob]:
+        """Load a job (detached from its session)"""
+        return await asyncio.to_thread(self._load, job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[GenerationJob]:
+        """
+        Long-poll a job until it finishes or timeout elapses
+
+        Returns:
+            The job in its latest state, or None if it does not exist
+        """
+        # The event only lives while someone waits on it; the worker pops and
+        # sets it when the job finishes, the last waiter drops it otherwise
+        event = self._events.setdefault(job_id, asyncio.Event())
+        self._waiters[job_id] = self._waiters.get(job_id, 0) + 1
+        try:
+            job = await self.get(job_id)
+            if job is None or job.status not in ACTIVE_STATUSES or timeout <= 0:
+                return job
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return job
+            return await self.get(job_id)
+        finally:
+            self._release_waiter(job_id, event)
+
+    def _release_waiter(self, job_id: str, event: asyncio.Event) -> None:
+        remaining = self._waiters.pop(job_id) - 1
+        if remaining:
+            self._waiters[job_id] = remaining
+        elif self._events.get(job_id) is event:
+            del self._events[job_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.exception("Job %s crashed", job_id)
+                await asyncio.to_thread(
+                    self._update, job_id, status=JobStatus.FAILED, error=str(e)
+                )
+            finally:
+                self._queue.task_done()
+                event = self._events.pop(job_id, None)
+                if event:
+                    event.set()
+
+    async def _run(self, job_id: str) -> None:
+        job = await self.get(job_id)
+        if job is None or job.status not in ACTIVE_STATUSES:
+            return
+        await asyncio.to_thread(self._update, job_id, status=JobStatus.RUNNING)
+
+        result = await self.engine.agenerate_uml(
+            user_prompt=job.prompt,
+            diagram_type=job.requested_type,
+            use_cache=job.use_cache,
+            user_id=job.user_id
+        )
+        if result.get("success", False) and is_unbilled(result):
+            await asyncio.to_thread(self._refund_unbilled, job.user_id, result)
+        if result.get("success", False):
+            await asyncio.to_thread(
+                self._update,
+                job_id,
+                status=JobStatus.SUCCEEDED,
+                mermaid_code=result["mermaid_code"],
+                diagram_type=result["diagram_type"],
+                note=result.get("note")
+            )
+        else:
+            await asyncio.to_thread(
+                self._update,
+                job_id,
+                status=JobStatus.FAILED,
+                error=result.get("error", "Unknown error")
+            )
+
+    def _create(self, user_id, prompt, diagram_type, title, use_cache) -> GenerationJob:
+        db = self.session_factory()
+        try:
+            # Row lock on the user: serialises submits across processes where the backend supports it
+            db.query(User.id).filter(User.id == user_id).with_for_update().first()
+            active = db.query(GenerationJob).filter(
+                GenerationJob.user_id == user_id,
+                GenerationJob.status.in_(ACTIVE_STATUSES)
+            ).count()
+            if active >= self.max_active_per_user:
+                raise JobLimitExceeded(
+                    f"At most {self.max_active_per_user} active jobs allowed per user"
+                )
+            job = GenerationJob(
+                id=uuid.uuid4().hex,
+                user_id=user_id,
+                prompt=prompt,
+                requested_type=diagram_type,
+                title=title,
+                use_cache=use_cache
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+            return job
+        finally:
+            db.close()
+
+    def _load(self, job_id: str) -> Optional[GenerationJob]:
+        db = self.session_factory()
+        try:
+            job = db.get(GenerationJob, job_id)
+            if job is not None:
+                db.expunge(job)
+            return job
+        finally:
+            db.close()
+
+    def _update(self, job_id: str, **values) -> None:
+        db = self.session_factory()
+        try:
+            job = db.get(GenerationJob, job_id)
+            if job is None:
+                return
+            for name, value in values.items():
+                setattr(job, name, value)
+            db.commit()
+        finally:
+            db.close()
+
+    def _refund_unbilled(self, user_id: int, result: Dict) -> None:
+        db = self.session_factory()
+        try:
+            user = db.get(User, user_id)
+            if user is not None:
+                refund_unbilled(user, [result])
+        finally:
+            db.close()
+
+    def _requeue_unfinished(self) -> List[str]:
+        db = self.session_factory()
+        try:
+            jobs = db.query(GenerationJob.id).filter(
+                GenerationJob.status.in_(ACTIVE_STATUSES)
+            ).order_by(GenerationJob.created_at).all()
+            if jobs:
+                logger.info("Re-queueing %d unfinished jobs", len(jobs))
+            return [job_id for (job_id,) in jobs]
+        finally:
+            db.close()
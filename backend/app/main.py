@@ -3,16 +3,23 @@ FastAPI Main Application
 AI UML Generator - SaaS MVP
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
 
-from .database import init_db
-from .routes import auth, diagrams, admin
+from .blobs import migrate_diagram_storage
+from .database import dispose_async_engine, init_db
+from .metrics import CONTENT_TYPE, Gauge, registry, render_metrics
+from .observability import configure_logging, RequestTimingMiddleware
+from .rate_limit import rate_limiter
+from .search import search_index
+from .stats import admin_stats
+from .routes import auth, diagrams, admin, jobs
 
 # Load environment variables
 load_dotenv()
+configure_logging()
 
 # Create FastAPI app
 app = FastAPI(
@@ -34,16 +41,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request ids + one structured timing line per request (outermost middleware)
+app.add_middleware(RequestTimingMiddleware)
+
 # Include routers
 app.include_router(auth.router)
+app.include_router(jobs.router)
 app.include_router(diagrams.router)
 app.include_router(admin.router)
 
+# Scrape-time gauges for work shared across requests
+registry.register(Gauge(
+    "generation_upstream_in_flight", "Distinct upstream generations in flight after coalescing",
+    collect=lambda: [({}, diagrams.ai_engine.inflight.in_flight())]
+))
+registry.register(Gauge(
+    "generation_jobs_queued", "Background generation jobs waiting for a worker",
+    collect=lambda: [({}, jobs.job_queue.stats()["queued"])]
+))
+
 
 @app.on_event("startup")
-def on_startup():
-    """Initialize database on startup"""
+async def on_startup():
+    """Initialize database, the shared AI HTTP client, quotas, job workers and admin stats on startup"""
     init_db()
+    migrate_diagram_storage()
+    search_index.init()
+    diagrams.ai_engine.similar.seed_history()
+    diagrams.ai_engine.start()
+    await rate_limiter.start()
+    await jobs.job_queue.start()
+    await admin_stats.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Stop job workers, persist quotas and release pooled upstream and DB connections"""
+    await admin_stats.stop()
+    await jobs.job_queue.stop()
+    await rate_limiter.stop()
+    await diagrams.ai_engine.aclose()
+    await dispose_async_engine()
 
 
 @app.get("/")
@@ -59,8 +97,14 @@ def root():
 
 @app.get("/health")
 def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy"}
+    """Health check endpoint (includes per-provider latency and circuit breaker state)"""
+    return {"status": "healthy", "ai_providers": diagrams.ai_engine.selector.snapshot()}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
 
 
 if __name__ == "__main__":
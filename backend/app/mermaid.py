@@ -0,0 +1,627 @@
+"""
+Mermaid parser - single-pass, line-based parsing and validation of generated diagrams
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Header keyword -> our diagram type (None: recognised but parsed without a grammar)
+HEADERS: Dict[str, Optional[str]] = {
+    "classDiagram": "class",
+    "classDiagram-v2": "class",
+    "sequenceDiagram": "sequence",
+    "flowchart": "activity",
+    "graph": "activity",
+    "usecaseDiagram": "usecase",
+    "erDiagram": None,
+    "stateDiagram": None,
+    "stateDiagram-v2": None,
+    "gantt": None,
+    "pie": None,
+    "journey": None,
+}
+
+_DIRECTIONS = {"TB", "TD", "BT", "RL", "LR"}
+_FENCE = "```"
+
+# Block delimiters
+BRACE = "}"
+END = "end"
+
+# An unrecognised line shaped like a statement, `id <arrow> id`, e.g.
+# "classC --() classD" or "User#1->>API: hi"; never dropped as trailing prose
+_STATEMENT_LIKE = re.compile(
+    r"^[^\s.]\S*?\s*(?:\"[^\"]*\"\s*)?(?:[<*o]|\|)?(?:--|(?<!\.)\.\.(?!\.)|==|~~~|-[>x)])[-.=>x)(o|*]*"
+    r"\s*(?:\"[^\"]*\"\s*)?[\w\"'(\[]"
+)
+
+
+class MermaidNode:
+    """One statement; blocks (class bodies, loops, subgraphs, packages) hold their statements as children"""
+
+    __slots__ = ("kind", "line", "args", "children")
+
+    def __init__(self, kind: str, line: int, args: Tuple = ()):
+        self.kind = kind
+        self.line = line
+        self.args = args
+        self.children: List["MermaidNode"] = []
+
+    def __repr__(self):
+        return f"<MermaidNode({self.kind}, line={self.line}, args={self.args})>"
+
+
+class MermaidDocument:
+    """
+    Result of parsing model output
+
+    Attributes:
+        diagram_type: class / sequence / activity / usecase, or None for
+            other recognised headers (or no header at all)
+        header: Header keyword, None when the text holds no diagram
+        nodes: Top-level statements
+        errors: "line N: message" strings; empty when the diagram is valid
+        lines: Diagram source kept (fences, preamble and trailing prose removed)
+        dropped: Number of trailing lines dropped as prose
+        start: Input line number of the header (1-based, 0 without one)
+        rejected: Input line numbers the grammar did not accept, whether
+            reported as errors or dropped as trailing prose
+    """
+
+    __slots__ = ("diagram_type", "header", "nodes", "errors", "lines", "dropped", "start", "rejected")
+
+    def __init__(self):
+        self.diagram_type: Optional[str] = None
+        self.header: Optional[str] = None
+        self.nodes: List[MermaidNode] = []
+        self.errors: List[str] = []
+        self.lines: List[str] = []
+        self.dropped = 0
+        self.start = 0
+        self.rejected: List[int] = []
+
+    @property
+    def valid(self) -> bool:
+        return self.header is not None and not self.errors
+
+    @property
+    def code(self) -> str:
+        return "\n".join(self.lines).rstrip()
+
+    def walk(self):
+        """All statements, depth first"""
+        stack = list(reversed(self.nodes))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+
+# Grammars
+#
+# A rule is (kind, pattern, effect): effect opens a block closed by BRACE /
+# END, closes the innermost block, is only valid inside a block (ELSE), or
+# is None. Each grammar maps a statement's first word to the rules to try,
+# with DEFAULT rules for statements that don't start with a keyword, so a
+# line usually costs a single regex match.
+
+OPEN_BRACE = "open_brace"
+OPEN_END = "open_end"
+CLOSE = "close"
+ELSE = "else"
+DEFAULT = ""
+
+Rule = Tuple[str, "re.Pattern", Optional[str]]
+Grammar = Dict[str, List[Rule]]
+
+_NAME = r"[\w`~<>.,-]+"
+
+
+def _grammar(rules: List[Tuple[Tuple[str, ...], str, str, Optional[str]]]) -> Grammar:
+    grammar: Grammar = {}
+    for keywords, kind, pattern, effect in rules:
+        rule = (kind, re.compile(pattern), effect)
+        for keyword in keywords:
+            grammar.setdefault(keyword, []).append(rule)
+    return grammar
+
+
+_CLASS = _grammar([
+    (("class",), "class",
+     r"^class\s+(" + _NAME + r")(?:\s*\[\"[^\"]*\"\])?(?::::[\w-]+)?\s*(\{)?\s*(\})?$", None),
+    (("namespace",), "namespace", r"^namespace\s+([\w.]+)\s*\{$", OPEN_BRACE),
+    (("note",), "note", r"^note(?:\s+for\s+(" + _NAME + r"))?\s+\"([^\"]*)\"$", None),
+    (("direction", "classDef", "cssClass", "style", "click", "link", "callback"), "directive", r"^(\w+)\s+(.+)$", None),
+    ((DEFAULT,), "relation",
+     r"^(" + _NAME + r")\s*(?:\"[^\"]*\"\s*)?((?:<\||\*|o|<)?(?:--|\.\.)(?:\|>|\*|o|>)?)"
+     r"\s*(?:\"[^\"]*\"\s*)?(" + _NAME + r")\s*(?::\s*(.*))?$", None),
+    ((DEFAULT,), "member_of", r"^(" + _NAME + r")\s*:\s*(.+)$", None),
+    ((DEFAULT,), "annotation", r"^<<[\w ]+>>\s*(" + _NAME + r")$", None),
+])
+
+_SEQUENCE = _grammar([
+    (("end",), "end", r"^end$", CLOSE),
+    (("loop", "alt", "opt", "par", "critical", "break", "rect", "box"), "block", r"^(\w+)\s*(.*)$", OPEN_END),
+    (("else", "and", "option"), "else", r"^(\w+)\s*(.*)$", ELSE),
+    (("participant", "actor", "create"), "participant",
+     r"^(?:create\s+)?(participant|actor)\s+(.+?)(?:\s+as\s+(.+))?$", None),
+    (("Note", "note", "NOTE"), "note", r"^(?i:note)\s+(left of|right of|over)\s+([^:]+?)\s*:\s*(.*)$", None),
+    (("autonumber", "activate", "deactivate", "destroy", "title", "title:", "link", "links", "accTitle:", "accDescr:"),
+     "directive", r"^([\w]+):?\s*(.*)$", None),
+    ((DEFAULT,), "message",
+     r"^([\w .'\"()]+?)\s*(-->>|->>|-->|->|--x|-x|--\)|-\))\s*([+-]?)\s*([\w .'\"()]+?)\s*(?::(.*))?$", None),
+])
+
+_USECASE = _grammar([
+    (("}",), "close", r"^\}$", CLOSE),
+    (("package", "rectangle"), "package", r"^(package|rectangle)\s+(.+?)\s*\{$", OPEN_BRACE),
+    (("actor",), "actor", r"^actor\s+(.+?)(?:\s+as\s+(\w+))?$", None),
+    (("usecase",), "usecase", r"^usecase\s+(?:\"([^\"]+)\"|(\w+))(?:\s+as\s+(\w+))?$", None),
+    (("left", "top", "title"), "directive", r"^(left to right direction|top to bottom direction|title\s+.+)$", None),
+    ((DEFAULT,), "relation",
+     r"^([\w\"][\w\" ]*?)\s*(-->|->|--|\.\.>|<\.\.|<--|<-)\s*([\w\"][\w\" ]*?)\s*(?::\s*(.*))?$", None),
+])
+
+_FLOWCHART = _grammar([
+    (("end",), "end", r"^end$", CLOSE),
+    (("subgraph",), "subgraph", r"^subgraph\b\s*(.*)$", OPEN_END),
+    (("direction", "classDef", "class", "style", "linkStyle", "click"), "directive", r"^(\w+)\s+(.+)$", None),
+])
+
+GRAMMARS: Dict[str, Grammar] = {
+    "class": _CLASS,
+    "sequence": _SEQUENCE,
+    "activity": _FLOWCHART,
+    "usecase": _USECASE,
+}
+
+# Flowchart statements: node (link node)* where a node may be "a & b" and
+# carry a shape label, e.g. A[Start] -->|yes| B{Valid?} & C
+_FLOW_ID = r"\w+(?:[.-]\w+)*"
+
+
+def _flow_shape(opener: str, closer: str) -> str:
+    """Shape pattern whose label may hold the closing bracket inside "quotes" """
+    plain = r'[^"' + re.escape(closer[0]) + r"]*"
+    return re.escape(opener) + plain + r'(?:"[^"]*"' + plain + ")*" + re.escape(closer)
+
+
+_FLOW_SHAPES = (
+    ("(((", ")))"), ("((", "))"), ("([", "])"), ("[[", "]]"), ("[(", ")]"), ("{{", "}}"),
+    ("[/", "]"), ("[\\", "]"), ("[", "]"), ("(", ")"), ("{", "}"), (">", "]"),
+)
+# Grouped by first character so a node costs one branch, not a scan of every shape
+_FLOW_SHAPE = "(?:" + "|".join(
+    f"(?={re.escape(first)})(?:" + "|".join(
+        _flow_shape(opener, closer) for opener, closer in _FLOW_SHAPES if opener[0] == first
+    ) + ")"
+    for first in dict.fromkeys(opener[0] for opener, _ in _FLOW_SHAPES)
+) + ")"
+_FLOW_NODE = re.compile(
+    r"\s*(" + _FLOW_ID + r")\s*(" + _FLOW_SHAPE + r")?(?::::[\w-]+)?"
+    r"(?:\s*&\s*" + _FLOW_ID + r"\s*(?:" + _FLOW_SHAPE + r")?(?::::[\w-]+)?)*\s*"
+)
+_FLOW_LINK = re.compile(
+    r"\s*(<?--\s*[^->\s][^-]*?\s*--[->xo]|<?==\s*[^=>\s][^=]*?\s*==[=>xo]|<?(?:-{2,}|={2,})[>xo]?|<?-\.+-[>xo]?|~~~)"
+    r"\s*(?:\|([^|]*)\|\s*)?"
+)
+
+
+def _parse_flow_statement(text: str) -> Optional[Tuple[str, Tuple]]:
+    position, nodes, links = 0, [], []
+    while True:
+        node = _FLOW_NODE.match(text, position)
+        if node is None or node.end() == position:
+            return None
+        nodes.append(node.group(1))
+        position = node.end()
+        if position == len(text):
+            break
+        link = _FLOW_LINK.match(text, position)
+        if link is None:
+            return None
+        links.append(link.group(1))
+        position = link.end()
+    return ("edge" if links else "node"), tuple(nodes)
+
+
+def _header_keyword(line: str) -> Optional[str]:
+    """Header keyword if `line` is a diagram header"""
+    words = line.rstrip().rstrip(";").split()
+    if not words or words[0] not in HEADERS:
+        return None
+    keyword = words[0]
+    if keyword in ("flowchart", "graph"):
+        if len(words) > 2 or (len(words) == 2 and words[1] not in _DIRECTIONS):
+            return None
+    elif len(words) > 1 and HEADERS[keyword] is not None:
+        return None
+    return keyword
+
+
+class MermaidParser:
+    """
+    Incremental single-pass parser
+
+    feed() takes one line of model output at a time and returns the lines
+    confirmed as part of the diagram. Lines the grammar does not accept are
+    held back: if a valid statement follows they become errors, and if
+    nothing valid follows (trailing prose) they are dropped, unless they
+    look like statements (see _STATEMENT_LIKE). Text before the
+    header and anything after a closing code fence is ignored. finish()
+    closes the parse and returns the MermaidDocument.
+    """
+
+    def __init__(self):
+        self.document = MermaidDocument()
+        self._grammar: Optional[Grammar] = None
+        self._stack: List[Tuple[MermaidNode, str]] = []
+        self._pending: List[Tuple[int, str, bool]] = []  # (line number, raw line, is_blank)
+        self._classes: set = set()
+        self._line_no = 0
+        self._closed = False
+
+    @property
+    def started(self) -> bool:
+        return self.document.header is not None
+
+    def feed(self, line: str) -> List[str]:
+        lines = self.document.lines
+        before = len(lines)
+        self.push(line)
+        return lines[before:]
+
+    def push(self, line: str) -> None:
+        """feed() without collecting the confirmed lines"""
+        self._line_no += 1
+        if self._closed:
+            return
+        if "`" in line and _FENCE in line:
+            before = line.split(_FENCE, 1)[0]
+            if self.started:
+                # Closing fence: whatever follows is commentary
+                self._closed = True
+                if before.strip():
+                    self.push(before)
+                    self._line_no -= 1
+                return
+            line = re.sub(r"^\s*```\s*mermaid", "", line).replace(_FENCE, "")
+
+        if self.document.header is None:
+            self._header(line)
+            return
+
+        stripped = line.strip()
+        if not stripped or stripped.startswith("%%"):
+            self._pending.append((self._line_no, line, True))
+        elif self._accept(stripped.rstrip(";").rstrip() if stripped[-1] == ";" else stripped):
+            if self._pending:
+                self._flush_pending()
+            self.document.lines.append(line)
+        else:
+            self._pending.append((self._line_no, line, False))
+
+    def finish(self) -> MermaidDocument:
+        document = self.document
+        if not self.started:
+            return document
+        # Held-back lines up to the last statement-like one are part of the diagram, not prose
+        last = max(
+            (index for index, (_, raw, blank) in enumerate(self._pending) if not blank and _STATEMENT_LIKE.match(raw.strip())),
+            default=-1
+        )
+        if last >= 0:
+            prose = self._pending[last + 1:]
+            del self._pending[last + 1:]
+            self._flush_pending()
+            self._pending = prose
+        document.rejected.extend(number for number, _, blank in self._pending if not blank)
+        document.dropped = sum(1 for _, _, blank in self._pending if not blank)
+        self._pending.clear()
+        for node, closer in reversed(self._stack):
+            document.errors.append(f"line {node.line}: '{node.kind}' block is never closed with '{closer}'")
+        if len(document.lines) == 1:
+            document.errors.append("line 1: diagram has no statements")
+        return document
+
+    def _header(self, line: str) -> None:
+        keyword = _header_keyword(line)
+        if keyword is None:
+            return
+        self.document.header = keyword
+        self.document.diagram_type = HEADERS[keyword]
+        self.document.start = self._line_no
+        self.document.lines.append(line.strip())
+        self._grammar = GRAMMARS.get(HEADERS[keyword])
+
+    def _flush_pending(self) -> None:
+        """A statement followed held-back lines, so they were not trailing prose"""
+        for number, raw, blank in self._pending:
+            if not blank:
+                self.document.errors.append(f"line {number}: unrecognised statement '{raw.strip()[:80]}'")
+                self.document.rejected.append(number)
+            self.document.lines.append(raw)
+        self._pending.clear()
+
+    def _add(self, node: MermaidNode) -> None:
+        if self._stack:
+            self._stack[-1][0].children.append(node)
+        else:
+            self.document.nodes.append(node)
+
+    def _accept(self, text: str) -> bool:
+        """Parse one statement into the AST; False if the grammar rejects it"""
+        grammar = self._grammar
+        if grammar is None:
+            self._add(MermaidNode("line", self._line_no, (text,)))
+            return True
+
+        top = self._stack[-1] if self._stack else None
+        if grammar is _CLASS:
+            if text == BRACE:
+                if top is None:
+                    return False
+                self._stack.pop()
+                return True
+            if top is not None and top[0].kind == "class":
+                # Mermaid treats members as free text (defaults, quotes, generics...)
+                if "{" in text or BRACE in text:
+                    return False
+                top[0].children.append(MermaidNode("member", self._line_no, (text,)))
+                return True
+
+        space = text.find(" ")
+        rules = grammar.get(text if space < 0 else text[:space]) or grammar.get(DEFAULT)
+        for kind, pattern, effect in rules or ():
+            match = pattern.match(text)
+            if match is None:
+                continue
+            if effect == CLOSE:
+                if top is None:
+                    return False
+                self._stack.pop()
+                return True
+            if effect == ELSE and (top is None or top[0].kind != "block"):
+                return False
+            if kind == "member_of" and not self._is_member_of(match):
+                continue
+            node = MermaidNode(kind, self._line_no, match.groups())
+            self._add(node)
+            if kind == "class":
+                self._classes.add(match.group(1))
+                if match.group(2) and not match.group(3):
+                    self._stack.append((node, BRACE))
+            elif kind == "relation" and grammar is _CLASS:
+                self._classes.update((match.group(1), match.group(3)))
+            elif effect == OPEN_BRACE:
+                self._stack.append((node, BRACE))
+            elif effect == OPEN_END:
+                self._stack.append((node, END))
+            return True
+
+        if grammar is _FLOWCHART:
+            parsed = _parse_flow_statement(text)
+            if parsed is not None:
+                self._add(MermaidNode(parsed[0], self._line_no, parsed[1]))
+                return True
+        return False
+
+    def _is_member_of(self, match) -> bool:
+        """`Name : member` outside a class body; guards against prose such as "Note: ..." """
+        name, member = match.group(1), match.group(2).strip()
+        return name in self._classes or member[:1] in "+-#~" or "(" in member
+
+
+# Fast validation
+#
+# Well-formed output, the common case, is checked without building the AST.
+# Each grammar's rules are compiled into one statement pattern that mirrors
+# the first-word dispatch of _accept(), all lines are matched through map()
+# (no Python code per line), and only block lines (braces, loop / alt /
+# subgraph ... end) are walked to check nesting. Whatever it cannot confirm
+# as valid is left to MermaidParser.
+
+def _rule_patterns(rules: List[Rule], effects: Optional[Tuple[str, ...]] = None) -> str:
+    return "|".join(
+        pattern.pattern[1:-1] for kind, pattern, effect in rules
+        if kind != "member_of" and (effects is None or effect in effects)
+    )
+
+
+def _dispatch(grammar: Grammar, effects: Optional[Tuple[str, ...]] = None) -> List[str]:
+    """Keyword alternatives: words sharing the same rules are grouped behind one lookahead"""
+    groups: Dict[Tuple[int, ...], List[str]] = {}
+    for word, rules in grammar.items():
+        if word != DEFAULT:
+            groups.setdefault(tuple(map(id, rules)), []).append(word)
+    alternatives = []
+    for words in groups.values():
+        patterns = _rule_patterns(grammar[words[0]], effects)
+        if patterns:
+            alternatives.append(f"(?=(?:{'|'.join(map(re.escape, words))})(?: |$))(?:{patterns})")
+    return alternatives
+
+
+def _statement_pattern(grammar: Grammar, extra: Optional[str] = None) -> "re.Pattern":
+    """Statements _accept() takes regardless of block state (match with fullmatch); `Name : member` excluded"""
+    alternatives = _dispatch(grammar)
+    default = _rule_patterns(grammar.get(DEFAULT, []))
+    if default:
+        keywords = "|".join(re.escape(word) for word in grammar if word != DEFAULT)
+        alternatives.append(f"(?!(?:{keywords})(?: |$))(?:{default})")
+    if extra:
+        alternatives.append(extra)
+    alternatives += ["", "%%.*"]
+    return re.compile("|".join(f"(?:{alternative})" for alternative in alternatives))
+
+
+def _effect_pattern(grammar: Grammar, effects: Tuple[str, ...]) -> "re.Pattern":
+    """Keyword statements with one of the given block effects"""
+    return re.compile("|".join(_dispatch(grammar, effects)))
+
+
+# _parse_flow_statement() as one pattern; atomic groups keep its no-backtracking semantics
+_FLOW_STATEMENT = (
+    f"(?>{_FLOW_NODE.pattern})(?:(?>{_FLOW_LINK.pattern})(?>{_FLOW_NODE.pattern}))*"
+)
+_FAST_STATEMENTS: Dict[str, "re.Pattern"] = {
+    "class": _statement_pattern(_CLASS),
+    "sequence": _statement_pattern(_SEQUENCE),
+    "activity": _statement_pattern(_FLOWCHART, _FLOW_STATEMENT),
+}
+# (any block statement, opens, closes) for grammars whose blocks end with END
+_FAST_BLOCKS: Dict[str, Tuple["re.Pattern", "re.Pattern", "re.Pattern"]] = {
+    diagram_type: tuple(
+        _effect_pattern(GRAMMARS[diagram_type], effects) for effects in ((OPEN_END, ELSE, CLOSE), (OPEN_END,), (CLOSE,))
+    )
+    for diagram_type in ("sequence", "activity")
+}
+_CLASS_OPEN = _CLASS["class"][0][1]
+_NAMESPACE_OPEN = _CLASS["namespace"][0][1]
+# `Name : member` depends on the classes declared before it, so the scan leaves it to the parser
+_MEMBER_OF = next(pattern for kind, pattern, _ in _CLASS[DEFAULT] if kind == "member_of")
+
+_HEADER_CANDIDATE = re.compile(r"^[^\S\n]*(?:" + "|".join(map(re.escape, HEADERS)) + ")", re.MULTILINE)
+_FENCE_LINE = re.compile(r"^[^\S\n]*```[^\S\n]*(?:mermaid)?[^\S\n]*$", re.MULTILINE)
+_SEMICOLON_END = re.compile(r";[^\S\n]*$", re.MULTILINE)
+
+
+def _blocks_balanced(stripped: List[str], patterns: Tuple["re.Pattern", "re.Pattern", "re.Pattern"]) -> bool:
+    """Blocks closed in order, else / and / option only inside one"""
+    blocks, opens, closes = patterns
+    depth = 0
+    for text in [text for text, match in zip(stripped, map(blocks.fullmatch, stripped)) if match]:
+        if opens.fullmatch(text):
+            depth += 1
+        elif closes.fullmatch(text):
+            if not depth:
+                return False
+            depth -= 1
+        elif not depth:
+            return False
+    return depth == 0
+
+
+def _class_bodies_valid(stripped: List[str], statement: "re.Pattern") -> bool:
+    """Class bodies hold free-text members; everything outside them must be a statement"""
+    ranges: List[Tuple[int, int]] = []
+    stack: List[bool] = []  # True for a class body, False for a namespace
+    start = 0
+    for index in [i for i, text in enumerate(stripped) if "{" in text or BRACE in text]:
+        text = stripped[index]
+        if stack and stack[-1]:
+            if text != BRACE:
+                return False
+            stack.pop()
+            start = index + 1
+        elif text == BRACE:
+            if not stack:
+                return False
+            stack.pop()
+            ranges.append((start, index))
+            start = index + 1
+        elif text.startswith("class "):
+            match = _CLASS_OPEN.match(text)
+            if match and match.group(2) and not match.group(3):
+                ranges.append((start, index + 1))
+                stack.append(True)
+                start = index + 1
+        elif text.startswith("namespace ") and _NAMESPACE_OPEN.match(text):
+            stack.append(False)
+    if stack:
+        return False
+    ranges.append((start, len(stripped)))
+    return all(all(map(statement.fullmatch, stripped[first:last])) for first, last in ranges)
+
+
+def scan_mermaid(text: str) -> Optional[MermaidDocument]:
+    """
+    Validate well-formed class / sequence / flowchart output without building the AST
+
+    Returns:
+        The document parse_mermaid() would return, with empty `nodes`, when
+        the diagram is valid; None when it is not or the scan cannot tell
+    """
+    for candidate in _HEADER_CANDIDATE.finditer(text):
+        line_end = text.find("\n", candidate.start())
+        line_end = len(text) if line_end < 0 else line_end
+        header_line = text[candidate.start():line_end]
+        keyword = _header_keyword(header_line)
+        if keyword is not None:
+            break
+    else:
+        return None
+    diagram_type = HEADERS[keyword]
+    if diagram_type not in _FAST_STATEMENTS or "`" in header_line:
+        return None
+    # Only a plain opening fence may precede the header: fences elsewhere change what the parser sees
+    preamble = text[:candidate.start()]
+    if "`" in preamble and "`" in _FENCE_LINE.sub("", preamble):
+        return None
+
+    body_start = line_end + 1
+    fence = text.find(_FENCE, body_start)
+    if fence >= 0:
+        fence_line = text.rfind("\n", 0, fence) + 1
+        if text[fence_line:fence].strip():
+            return None
+        body = text[body_start:fence_line]
+    else:
+        body = text[body_start:]
+    if _SEMICOLON_END.search(body):
+        return None
+
+    raw = body.split("\n")
+    stripped = list(map(str.strip, raw))
+    statement = _FAST_STATEMENTS[diagram_type]
+
+    # Trailing prose: lines after the last statement, as long as none could be part of the diagram
+    start = text.count("\n", 0, candidate.start()) + 1
+    last, rejected = len(stripped) - 1, []
+    while last >= 0:
+        line = stripped[last]
+        if line and not line.startswith("%%"):
+            if (
+                statement.fullmatch(line) or "{" in line or BRACE in line
+                or (diagram_type == "class" and _MEMBER_OF.match(line))
+            ):
+                break
+            if _STATEMENT_LIKE.match(line):
+                return None
+            rejected.append(start + 1 + last)
+        last -= 1
+    if last < 0:
+        return None
+    del stripped[last + 1:]
+
+    if diagram_type == "class":
+        if not _class_bodies_valid(stripped, statement):
+            return None
+    elif not all(map(statement.fullmatch, stripped)) or not _blocks_balanced(stripped, _FAST_BLOCKS[diagram_type]):
+        return None
+
+    document = MermaidDocument()
+    document.header = keyword
+    document.diagram_type = diagram_type
+    document.start = start
+    document.lines = [header_line.strip()] + raw[:last + 1]
+    document.dropped = len(rejected)
+    document.rejected = rejected[::-1]
+    return document
+
+
+def parse_mermaid(text: str, ast: bool = True) -> MermaidDocument:
+    """
+    Parse model output in one pass; see MermaidParser
+
+    With ast=False, output that scan_mermaid() confirms as valid is
+    returned without `nodes`; anything else is fully parsed.
+    """
+    if not ast:
+        document = scan_mermaid(text)
+        if document is not None:
+            return document
+    parser = MermaidParser()
+    for line in text.split("\n"):
+        parser.push(line)
+    return parser.finish()
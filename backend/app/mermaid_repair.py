@@ -0,0 +1,342 @@
+"""
+Mermaid repair - deterministic fixes for common malformed model output
+
+Near-misses (smart quotes, markdown bullets, wrong or missing arrows,
+unbalanced blocks) and usecaseDiagram, which Mermaid cannot render, are
+fixed locally instead of costing another upstream call. Every repair is
+validated by re-parsing, and rejected if the result is still invalid or
+lost any statement of the original diagram; the caller then goes back
+upstream as before.
+"""
+
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from .mermaid import BRACE, DEFAULT, END, GRAMMARS, MermaidDocument, MermaidNode, parse_mermaid
+
+# Repair names, as recorded on results and in metrics
+SMART_QUOTES = "smart_quotes"
+MARKDOWN = "markdown"
+ARROWS = "arrows"
+MISSING_ARROWS = "missing_arrows"
+UNBALANCED_BLOCKS = "unbalanced_blocks"
+USECASE_FLOWCHART = "usecase_flowchart"
+
+USECASE_HEADER = "usecaseDiagram"
+
+_QUOTES = str.maketrans({
+    "“": '"', "”": '"', "„": '"', "‟": '"', "″": '"',
+    "‘": "'", "’": "'", "‚": "'", "‛": "'", "′": "'",
+})
+_BULLET = re.compile(r"^(\s*)(?:[-*+•]|\d+[.)])\s+(?=\S)")
+_HEADING = re.compile(r"^\s*#{1,6}\s")
+_EMPHASIS = re.compile(r"\*\*(.+?)\*\*")
+_UNICODE_ARROW = re.compile(r"\s*(?:→|⟶|➔|➜|➝|⇒|⟹|[–—]+>)\s*")
+_SINGLE_ARROW = re.compile(r"(?<=[\w\])}\"'\s])\s*->(?!>)\s*")
+_BARE_PAIR = re.compile(r"^(\s*)(\w+)\s+(\w+)\s*(:.*)?$")
+
+# Arrow each diagram type uses for a plain association / message
+_ARROW = {"class": " --> ", "activity": " --> ", "usecase": " --> ", "sequence": "->>"}
+
+_SEQUENCE_BLOCKS = {"loop", "alt", "opt", "par", "critical", "break", "rect", "box"}
+# Class diagram statements that never appear inside a class body
+_CLASS_TOP_LEVEL = {"class", "namespace", "note", "relation", "annotation"}
+
+
+def needs_repair(document: MermaidDocument) -> bool:
+    """Whether parsed output is a diagram that repair_mermaid() could still turn into a renderable one"""
+    return document.header is not None and (not document.valid or document.header == USECASE_HEADER)
+
+
+def repair_mermaid(content: str, document: MermaidDocument) -> Tuple[MermaidDocument, List[str]]:
+    """
+    Apply the repairs `document` needs and re-parse
+
+    Line fixes only touch the statements the parser rejected (smart quotes
+    are normalised throughout the diagram), block balancing works on the
+    cleaned diagram, and a valid usecaseDiagram is rewritten as a
+    flowchart that keeps diagram_type "usecase".
+
+    Args:
+        content: Raw model output that `document` was parsed from
+        document: parse_mermaid(content)
+
+    Returns:
+        (document, repairs) - the re-parsed document (check .valid) and the
+        names of the repairs that changed the text, in the order applied;
+        the original document and no repairs if a repair dropped or
+        rejected a line of the original diagram
+    """
+    original = document
+    repairs: List[str] = []
+    diagram_type = document.diagram_type
+    # Non-blank diagram statements (as fixed line by line) that must survive
+    expected = Counter(line.strip() for line in document.lines if line.strip())
+    closers_removed = closers_added = 0
+
+    if not document.valid:
+        lines = content.split("\n")
+        rejected = [number - 1 for number in document.rejected if number - 1 < len(lines)]
+        names = _known_names(document)
+        for name, fix in (
+            (SMART_QUOTES, lambda: _smart_quotes(lines, document.start)),
+            (MARKDOWN, lambda: _markdown(lines, rejected)),
+            (ARROWS, lambda: _arrows(lines, rejected, diagram_type)),
+            (MISSING_ARROWS, lambda: _missing_arrows(lines, rejected, diagram_type, names)),
+        ):
+            if fix():
+                repairs.append(name)
+        if repairs:
+            diagram = lines[max(document.start - 1, 0):max(document.start - 1, 0) + len(document.lines)]
+            expected = Counter(line.strip() for line in diagram if line.strip())
+            document = parse_mermaid("\n".join(lines))
+
+    if document.header is not None and not document.valid:
+        balanced = _balance_blocks(document.lines, diagram_type)
+        if balanced is not None:
+            balanced, closers_removed, closers_added = balanced
+            document = parse_mermaid("\n".join(balanced))
+            repairs.append(UNBALANCED_BLOCKS)
+
+    if repairs and _lost_statements(expected, document, diagram_type, closers_removed, closers_added):
+        return original, []
+
+    if document.valid and document.header == USECASE_HEADER:
+        document = parse_mermaid(_usecase_to_flowchart(document))
+        document.diagram_type = "usecase"
+        repairs.append(USECASE_FLOWCHART)
+
+    return document, repairs
+
+
+# Line fixes: edit `lines` in place and return whether anything changed
+
+def _smart_quotes(lines: List[str], start: int) -> bool:
+    changed = False
+    for index in range(max(start - 1, 0), len(lines)):
+        fixed = lines[index].translate(_QUOTES)
+        if fixed != lines[index]:
+            lines[index] = fixed
+            changed = True
+    return changed
+
+
+def _markdown(lines: List[str], rejected: List[int]) -> bool:
+    """Bullets, numbered-list markers, headings and **bold** around statements"""
+    changed = False
+    for index in rejected:
+        line = lines[index]
+        if _HEADING.match(line):
+            fixed = ""
+        else:
+            fixed = _EMPHASIS.sub(r"\1", _BULLET.sub(r"\1", line, count=1))
+        if fixed != line:
+            lines[index] = fixed
+            changed = True
+    return changed
+
+
+def _arrows(lines: List[str], rejected: List[int], diagram_type: str) -> bool:
+    """Unicode arrows, and `->` where the diagram type needs `-->`"""
+    arrow = _ARROW.get(diagram_type)
+    if arrow is None:
+        return False
+    changed = False
+    for index in rejected:
+        line = lines[index]
+        fixed = _UNICODE_ARROW.sub(arrow, line)
+        if diagram_type in ("class", "activity"):
+            fixed = _SINGLE_ARROW.sub(arrow, fixed)
+        if fixed != line:
+            lines[index] = fixed
+            changed = True
+    return changed
+
+
+def _missing_arrows(lines: List[str], rejected: List[int], diagram_type: str, names: Set[str]) -> bool:
+    """`A B : label` between two names the diagram already declares"""
+    arrow = _ARROW.get(diagram_type)
+    if arrow is None:
+        return False
+    changed = False
+    for index in rejected:
+        match = _BARE_PAIR.match(lines[index])
+        if match is None or match.group(2) not in names or match.group(3) not in names:
+            continue
+        indent, source, target, label = match.groups()
+        label = label or ""
+        if label and diagram_type != "sequence":
+            label = " " + label
+        lines[index] = f"{indent}{source}{arrow}{target}{label}"
+        changed = True
+    return changed
+
+
+def _known_names(document: MermaidDocument) -> Set[str]:
+    """Classes, participants and node ids the accepted statements refer to"""
+    names: Set[str] = set()
+    for node in document.walk():
+        if node.kind in ("class", "actor"):
+            names.add(node.args[0])
+        elif node.kind in ("edge", "node"):
+            names.update(node.args)
+        elif node.kind == "relation":
+            names.update((node.args[0], node.args[2]))
+        elif node.kind == "participant":
+            names.add(node.args[2] or node.args[1])
+        elif node.kind == "message":
+            names.update((node.args[0], node.args[3]))
+        elif node.kind == "usecase":
+            names.add(node.args[2] or node.args[1])
+    names.discard(None)
+    return names
+
+
+def _lost_statements(
+    expected: Counter,
+    document: MermaidDocument,
+    diagram_type: Optional[str],
+    closers_removed: int,
+    closers_added: int
+) -> bool:
+    """Whether a statement of the original diagram is missing from (or rejected in) the repaired one"""
+    rejected = set(document.rejected)
+    kept = Counter(
+        line.strip() for number, line in enumerate(document.lines, document.start)
+        if line.strip() and number not in rejected
+    )
+    closer = BRACE if diagram_type in ("class", "usecase") else END
+    expected = expected.copy()
+    expected[closer] -= closers_removed
+    kept[closer] -= closers_added
+    return bool(expected - kept)
+
+
+# Block balancing
+
+def _balance_blocks(lines: List[str], diagram_type: Optional[str]) -> Optional[Tuple[List[str], int, int]]:
+    """
+    Drop stray closers and close blocks left open
+
+    A class body left open is closed just before the next line that opens
+    a block or parses as a top-level statement (see _is_class_statement);
+    anything still open at the end is closed there.
+
+    Returns:
+        (balanced lines, closers removed, closers added), or None when
+        nothing needed changing
+    """
+    if diagram_type in ("class", "usecase"):
+        closer = BRACE
+    elif diagram_type in ("sequence", "activity"):
+        closer = END
+    else:
+        return None
+
+    out = lines[:1]
+    stack: List[Tuple[str, str]] = []  # (kind, indent)
+    removed = added = 0
+    for line in lines[1:]:
+        stripped = line.strip()
+        indent = line[:len(line) - len(line.lstrip())]
+        # Class members are free text, so only a block opening or a top-level statement ends a body early
+        if stack and stack[-1][0] == "class" and (
+            (stripped.endswith("{") and not stripped.startswith("%%")) or _is_class_statement(stripped)
+        ):
+            out.append(stack.pop()[1] + BRACE)
+            added += 1
+        word = stripped.split(" ", 1)[0]
+        if stripped == closer:
+            if not stack:
+                removed += 1
+                continue
+            stack.pop()
+        elif closer == BRACE and stripped.endswith("{") and "}" not in stripped:
+            stack.append((word, indent))
+        elif closer == END and (word in _SEQUENCE_BLOCKS if diagram_type == "sequence" else word == "subgraph"):
+            stack.append((word, indent))
+        out.append(line)
+    for _, indent in reversed(stack):
+        out.append(indent + closer)
+        added += 1
+    return (out, removed, added) if removed or added else None
+
+
+def _is_class_statement(text: str) -> bool:
+    """Whether a line inside a class body is really a class, relation, note or direction statement"""
+    if not text or text[0] in "+-#~" or text.startswith("%%"):
+        return False
+    word = text.split(" ", 1)[0]
+    if word == "direction":
+        return True
+    grammar = GRAMMARS["class"]
+    return any(
+        kind in _CLASS_TOP_LEVEL and pattern.match(text)
+        for kind, pattern, _ in grammar.get(word) or grammar[DEFAULT]
+    )
+
+
+# usecaseDiagram -> flowchart
+
+def _flow_id(name: str) -> str:
+    return re.sub(r"\W+", "_", name).strip("_") or "node"
+
+
+def _flow_label(text: str) -> str:
+    return '"' + text.replace('"', "#quot;") + '"'
+
+
+def _usecase_to_flowchart(document: MermaidDocument) -> str:
+    """
+    Rewrite a parsed usecaseDiagram as a flowchart
+
+    Actors become circles, use cases stadiums, packages / rectangles
+    subgraphs and relations links (dotted for ..>, reversed for <--).
+    """
+    ids: Dict[str, str] = {}
+    direction = "LR"
+    for node in document.walk():
+        if node.kind == "directive" and node.args[0] == "top to bottom direction":
+            direction = "TB"
+
+    def resolve(name: str) -> str:
+        name = name.strip().strip('"')
+        return ids.get(name) or ids.setdefault(name, _flow_id(name))
+
+    def declare(node_id: str, *names: str) -> str:
+        for name in names:
+            if name:
+                ids[name] = node_id
+        return node_id
+
+    out = [f"flowchart {direction}"]
+
+    def emit(nodes: List[MermaidNode], depth: int) -> None:
+        pad = "    " * depth
+        for node in nodes:
+            if node.kind == "actor":
+                label = node.args[0].strip('"')
+                node_id = declare(node.args[1] or _flow_id(label), label, node.args[1])
+                out.append(f"{pad}{node_id}(({_flow_label(label)}))")
+            elif node.kind == "usecase":
+                label = node.args[0] or node.args[1]
+                node_id = declare(node.args[2] or _flow_id(label), label, node.args[1], node.args[2])
+                out.append(f"{pad}{node_id}([{_flow_label(label)}])")
+            elif node.kind == "package":
+                label = node.args[1].strip('"')
+                out.append(f"{pad}subgraph {_flow_id(label)} [{_flow_label(label)}]")
+                emit(node.children, depth + 1)
+                out.append(f"{pad}end")
+            elif node.kind == "relation":
+                source, arrow, target, label = node.args
+                if arrow.startswith("<"):
+                    source, target = target, source
+                link = {"--": "---", "..>": "-.->", "<..": "-.->"}.get(arrow, "-->")
+                if label:
+                    label = label.strip().replace("<<", "«").replace(">>", "»").replace("|", "/")
+                    link += f"|{label}|"
+                out.append(f"{pad}{resolve(source)} {link} {resolve(target)}")
+
+    emit(document.nodes, 1)
+    return "\n".join(out)
@@ -0,0 +1,345 @@
+"""
+Prometheus metrics - counters, gauges and histograms rendered in the text exposition format
+"""
+
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; covers fast DB-only routes through multi-second LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class: a named family of label-keyed series"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down
+
+    Either set/inc/dec explicitly, or pass `collect` returning
+    (labels, value) pairs to read the current state at scrape time.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        collect: Optional[Callable[[], Iterable[Tuple[Dict[str, str], float]]]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def track(self, **labels: str) -> "_GaugeTracker":
+        """Context manager: +1 on enter, -1 on exit"""
+        return _GaugeTracker(self, labels)
+
+    def render(self) -> List[str]:
+        if self._collect is not None:
+            items = sorted((self._key(labels), value) for labels, value in self._collect())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class _GaugeTracker:
+    __slots__ = ("gauge", "labels")
+
+    def __init__(self, gauge: Gauge, labels: Dict[str, str]):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.inc(**self.labels)
+        return self
+
+    def __exit__(self, *exc):
+        self.gauge.dec(**self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed distribution with _sum and _count"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts, sum, count]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = self._header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Set of metrics rendered together by /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status")
+))
+
+LLM_REQUEST_DURATION = registry.register(Histogram(
+    "llm_upstream_request_duration_seconds",
+    "Latency of individual upstream LLM calls",
+    ("provider", "outcome")
+))
+
+LLM_RESPONSES = registry.register(Counter(
+    "llm_upstream_responses_total",
+    "Upstream LLM calls by HTTP status (or timeout/error)",
+    ("provider", "status")
+))
+
+LLM_RETRIES = registry.register(Counter(
+    "llm_upstream_retries_total",
+    "Retry rounds started after a failed upstream attempt",
+    ("mode",)
+))
+
+LLM_HEDGES = registry.register(Counter(
+    "llm_upstream_hedges_total",
+    "Hedged requests launched because the first provider was slower than its p95",
+    ("provider",)
+))
+
+FALLBACKS_SERVED = registry.register(Counter(
+    "generation_fallbacks_total",
+    "Static offline diagrams served instead of an LLM result",
+    ("reason",)
+))
+
+MERMAID_REPAIRS = registry.register(Counter(
+    "mermaid_repairs_total",
+    "Local repair attempts on invalid or unrenderable model output",
+    ("outcome",)
+))
+
+MERMAID_REPAIRS_APPLIED = registry.register(Counter(
+    "mermaid_repairs_applied_total",
+    "Individual repairs in successful local repairs",
+    ("repair",)
+))
+
+PROMPT_TOKENS = registry.register(Histogram(
+    "llm_prompt_tokens",
+    "Estimated tokens of user prompts before compaction and as sent upstream",
+    ("stage",),
+    buckets=(50, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000)
+))
+
+PROMPT_COMPACTIONS = registry.register(Counter(
+    "llm_prompt_compactions_total",
+    "Compaction steps applied to prompts over the token budget",
+    ("step",)
+))
+
+GENERATIONS_IN_FLIGHT = registry.register(Gauge(
+    "generations_in_flight",
+    "Generations currently being processed",
+    ("mode",)
+))
+
+
+def fallback_reason(error: str) -> str:
+    """Collapse free-form upstream errors into a bounded label set"""
+    if not error:
+        return "unknown"
+    lowered = error.lower()
+    if "api key" in lowered:
+        return "missing_api_key"
+    if "429" in lowered:
+        return "rate_limited"
+    if "timeout" in lowered:
+        return "timeout"
+    if "circuit" in lowered:
+        return "circuit_open"
+    if lowered.startswith("status"):
+        return "upstream_status"
+    if "mermaid" in lowered or "content" in lowered or "empty" in lowered:
+        return "invalid_output"
+    return "error"
+
+
+def register_pool_metrics(engines: Dict[str, object]) -> None:
+    """SQLAlchemy connection pool gauges per engine, read from the pools at scrape time"""
+
+    def read(attr: str):
+        def collect():
+            samples = []
+            for label, engine in engines.items():
+                method = getattr(engine.pool, attr, None)
+                if callable(method):
+                    samples.append(({"engine": label}, float(method())))
+            return samples
+        return collect
+
+    registry.register(Gauge(
+        "db_pool_checked_out", "Connections currently checked out of the pool",
+        ("engine",), collect=read("checkedout")
+    ))
+    registry.register(Gauge(
+        "db_pool_overflow", "Connections open beyond pool_size (negative while below it)",
+        ("engine",), collect=read("overflow")
+    ))
+    registry.register(Gauge(
+        "db_pool_size", "Configured pool size",
+        ("engine",), collect=read("size")
+    ))
+
+
+def render_metrics() -> str:
+    return registry.render()
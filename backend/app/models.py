@@ -2,10 +2,11 @@
 SQLAlchemy database models
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Enum, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text, Enum, Boolean, Float, Index, LargeBinary, event, func, select
+from sqlalchemy.orm import attributes, column_property, relationship
 from datetime import datetime
 import enum
+from . import blobs
 from .database import Base
 
 
@@ -15,6 +16,10 @@ class SubscriptionPlan(str, enum.Enum):
     PRO = "pro"
 
 
+# Characters of the prompt returned as the list preview
+PREVIEW_LENGTH = 160
+
+
 class DiagramType(str, enum.Enum):
     """UML diagram types"""
     CLASS = "class"
@@ -23,6 +28,14 @@ class DiagramType(str, enum.Enum):
     ACTIVITY = "activity"
 
 
+class JobStatus(str, enum.Enum):
+    """Background generation job states"""
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
 class User(Base):
     """User model for authentication and profile"""
     
@@ -41,21 +54,52 @@ class User(Base):
     
     # Relationships
     diagrams = relationship("Diagram", back_populates="user", cascade="all, delete-orphan")
+    jobs = relationship("GenerationJob", back_populates="user", cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<User(id={self.id}, email={self.email}, plan={self.subscription_plan})>"
 
 
+class Blob(Base):
+    """Deduplicated, compressed text shared by diagrams (see blobs.py)"""
+    
+    __tablename__ = "blobs"
+    
+    hash = Column(String(64), primary_key=True)  # SHA-256 of the uncompressed text
+    codec = Column(String(8), nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)  # Uncompressed length in characters
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    @property
+    def text(self) -> str:
+        return blobs.decode(self.codec, self.data)
+    
+    def __repr__(self):
+        return f"<Blob(hash={self.hash[:12]}, size={self.size}, refs={self.refcount})>"
+
+
 class Diagram(Base):
-    """Diagram model for storing generated UML diagrams"""
+    """
+    Diagram model for storing generated UML diagrams
+    
+    `prompt` and `mermaid_code` live in the blobs table, referenced by
+    prompt_hash / code_hash and decompressed transparently on access. The
+    inline columns only hold text for rows not yet moved by
+    blobs.migrate_diagram_storage.
+    """
     
     __tablename__ = "diagrams"
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(String(255), nullable=False)
-    prompt = Column(Text, nullable=False)
-    mermaid_code = Column(Text, nullable=False)
+    prompt_inline = Column("prompt", Text, nullable=False, default="")
+    code_inline = Column("mermaid_code", Text, nullable=False, default="")
+    prompt_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True)
+    code_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True)
+    preview = Column(String(PREVIEW_LENGTH), nullable=True)
     diagram_type = Column(
         Enum(DiagramType),
         default=DiagramType.CLASS,
@@ -63,8 +107,151 @@ class Diagram(Base):
     )
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
+    # List projection: sizes come from the blob rows, only loaded when undeferred
+    prompt_size = column_property(
+        func.coalesce(select(Blob.size).where(Blob.hash == prompt_hash).scalar_subquery(), func.length(prompt_inline)),
+        deferred=True
+    )
+    code_size = column_property(
+        func.coalesce(select(Blob.size).where(Blob.hash == code_hash).scalar_subquery(), func.length(code_inline)),
+        deferred=True
+    )
+    
     # Relationships
     user = relationship("User", back_populates="diagrams")
+    prompt_blob = relationship(Blob, foreign_keys=[prompt_hash], lazy="joined", viewonly=True)
+    code_blob = relationship(Blob, foreign_keys=[code_hash], lazy="joined", viewonly=True)
+    
+    @property
+    def prompt(self) -> str:
+        return self._get_text("prompt")
+    
+    @prompt.setter
+    def prompt(self, value: str) -> None:
+        self._set_text("prompt", value)
+    
+    @property
+    def mermaid_code(self) -> str:
+        return self._get_text("code")
+    
+    @mermaid_code.setter
+    def mermaid_code(self, value: str) -> None:
+        self._set_text("code", value)
+    
+    def _get_text(self, field: str) -> str:
+        value = self.__dict__.get(f"_{field}_text")
+        if value is None:
+            blob = getattr(self, f"{field}_blob")
+            value = blob.text if blob is not None else getattr(self, f"{field}_inline")
+            self.__dict__[f"_{field}_text"] = value
+        return value
+    
+    def _set_text(self, field: str, value: str) -> None:
+        self.__dict__[f"_{field}_text"] = value
+        self.__dict__.setdefault("_dirty_texts", set()).add(field)
+        if attributes.instance_state(self).persistent:
+            getattr(self, f"{field}_hash")  # reload if expired (e.g. after commit) so it can be flagged
+            attributes.flag_modified(self, f"{field}_hash")
     
     def __repr__(self):
         return f"<Diagram(id={self.id}, title={self.title}, type={self.diagram_type})>"
+
+
+@event.listens_for(Diagram, "before_insert")
+@event.listens_for(Diagram, "before_update")
+def _store_diagram_texts(mapper, connection, diagram):
+    """Swap newly assigned prompt / mermaid_code text for blob references"""
+    replaced = []
+    for field in diagram.__dict__.pop("_dirty_texts", ()):
+        value = diagram.__dict__[f"_{field}_text"]
+        replaced.append(getattr(diagram, f"{field}_hash"))
+        setattr(diagram, f"{field}_hash", blobs.acquire(connection, value))
+        setattr(diagram, f"{field}_inline", "")
+        if field == "prompt":
+            diagram.preview = value[:PREVIEW_LENGTH]
+    # Released once the row no longer points at them (see _release_replaced_texts)
+    diagram.__dict__["_replaced_hashes"] = replaced
+
+
+@event.listens_for(Diagram, "after_update")
+def _release_replaced_texts(mapper, connection, diagram):
+    """Drop references to the texts an update replaced, after the row stopped using them"""
+    for digest in diagram.__dict__.pop("_replaced_hashes", ()):
+        blobs.release(connection, digest)
+
+
+@event.listens_for(Diagram, "after_delete")
+def _release_diagram_texts(mapper, connection, diagram):
+    blobs.release(connection, diagram.prompt_hash)
+    blobs.release(connection, diagram.code_hash)
+
+
+# Serves the per-user listing (newest first, id as tie-breaker) and its keyset cursor
+Index("ix_diagrams_user_created_id", Diagram.user_id, Diagram.created_at.desc(), Diagram.id)
+
+
+class GenerationCacheEntry(Base):
+    """Persistent tier of the generation result cache"""
+    
+    __tablename__ = "generation_cache"
+    
+    key = Column(String(64), primary_key=True)
+    mermaid_code = Column(Text, nullable=False)
+    diagram_type = Column(String(20), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<GenerationCacheEntry(key={self.key[:12]}, type={self.diagram_type})>"
+
+
+class GenerationJob(Base):
+    """Queued diagram generation, polled by the client until it finishes"""
+    
+    __tablename__ = "generation_jobs"
+    
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(Enum(JobStatus), default=JobStatus.PENDING, nullable=False, index=True)
+    prompt = Column(Text, nullable=False)
+    title = Column(String(255), nullable=True)
+    requested_type = Column(String(20), nullable=True)
+    use_cache = Column(Boolean, default=True, nullable=False)
+    mermaid_code = Column(Text, nullable=True)
+    diagram_type = Column(String(20), nullable=True)
+    note = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    # Relationships
+    user = relationship("User", back_populates="jobs")
+    
+    def __repr__(self):
+        return f"<GenerationJob(id={self.id}, status={self.status})>"
+
+
+class RateLimitBucket(Base):
+    """Persisted generation quota bucket (see rate_limit.RateLimiter)"""
+    
+    __tablename__ = "rate_limit_buckets"
+    
+    user_id = Column(Integer, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # Unix timestamp of last refill
+    
+    def __repr__(self):
+        return f"<RateLimitBucket(user_id={self.user_id}, tokens={self.tokens:.2f})>"
+
+
+class DailyRollup(Base):
+    """Per-day counters behind the admin dashboard (see stats.AdminStats)"""
+    
+    __tablename__ = "daily_rollups"
+    
+    day = Column(Date, primary_key=True)
+    metric = Column(String(20), primary_key=True)  # "diagrams" | "signups"
+    dimension = Column(String(20), primary_key=True)  # diagram type or subscription plan
+    count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<DailyRollup(day={self.day}, {self.metric}/{self.dimension}={self.count})>"
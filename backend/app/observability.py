@@ -0,0 +1,243 @@
+"""
+Structured logging, request ids and per-request stage timing
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import HTTP_REQUEST_DURATION
+
+load_dotenv()
+
+# Configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+logger = logging.getLogger("app.request")
+sql_logger = logging.getLogger("app.sql")
+
+# Attributes present on every LogRecord; anything else came in via `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class RequestContext:
+    """Per-request state shared by every stage timer running for that request"""
+
+    __slots__ = ("request_id", "stages", "endpoint_done_at")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.stages: Dict[str, float] = {}
+        self.endpoint_done_at: Optional[float] = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+
+_request_ctx: ContextVar[Optional[RequestContext]] = ContextVar("request_ctx", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    ctx = _request_ctx.get()
+    return ctx.request_id if ctx else None
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Add time to a stage of the current request (no-op outside a request)"""
+    ctx = _request_ctx.get()
+    if ctx is not None:
+        ctx.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as a stage of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including request_id and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = current_request_id()
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging() -> None:
+    """Install a single stdout handler on the root logger"""
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+    # Per-call client logs duplicate what the request summary already carries
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def instrument_engine(engine: Engine, slow_query_ms: float = SLOW_QUERY_MS) -> None:
+    """
+    Attach query timing to an engine
+
+    Every statement's duration is added to the request's "db" stage and
+    statements slower than slow_query_ms are logged (replaces echo=True).
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        record_stage("db", elapsed)
+        if elapsed * 1000 >= slow_query_ms:
+            sql_logger.warning(
+                "Slow query",
+                extra={"duration_ms": round(elapsed * 1000, 2), "statement": statement[:500]}
+            )
+
+
+class RequestTimingMiddleware:
+    """
+    Pure ASGI middleware: assigns a request id, times the request and emits
+    one JSON summary line with per-stage durations
+
+    Summaries are sampled at LOG_SAMPLE_RATE; 5xx responses and requests
+    slower than SLOW_REQUEST_MS are always logged.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        ctx = RequestContext(request_id)
+        token = _request_ctx.set(ctx)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners can't blow up cardinality
+            HTTP_REQUEST_DURATION.observe(
+                duration_ms / 1000,
+                method=scope.get("method"),
+                route=getattr(route, "path", "unmatched"),
+                status=str(status_code)
+            )
+            if (
+                status_code >= 500
+                or duration_ms >= SLOW_REQUEST_MS
+                or random.random() < LOG_SAMPLE_RATE
+            ):
+                logger.info(
+                    "request",
+                    extra={
+                        "method": scope.get("method"),
+                        "path": getattr(route, "path", scope.get("path")),
+                        "status": status_code,
+                        "duration_ms": round(duration_ms, 2),
+                        "stages_ms": {name: round(value * 1000, 2) for name, value in ctx.stages.items()},
+                    }
+                )
+            _request_ctx.reset(token)
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute that records the endpoint body as the "handler" stage and the
+    time from the endpoint returning to the response being built (response
+    model validation + JSON encoding) as the "serialization" stage
+    """
+
+    def get_route_handler(self):
+        call = self.dependant.call
+
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def timed_call(*args, **kwargs):
+                with stage("handler"):
+                    try:
+                        return await call(*args, **kwargs)
+                    finally:
+                        _mark_endpoint_done()
+        else:
+            @functools.wraps(call)
+            def timed_call(*args, **kwargs):
+                with stage("handler"):
+                    try:
+                        return call(*args, **kwargs)
+                    finally:
+                        _mark_endpoint_done()
+
+        self.dependant.call = timed_call
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            ctx = _request_ctx.get()
+            if ctx is not None and ctx.endpoint_done_at is not None:
+                ctx.add("serialization", time.perf_counter() - ctx.endpoint_done_at)
+            return response
+
+        return timed_handler
+
+
+def _mark_endpoint_done() -> None:
+    ctx = _request_ctx.get()
+    if ctx is not None:
+        ctx.endpoint_done_at = time.perf_counter()
@@ -0,0 +1,271 @@
+"""
+Prompt templates and budgeting - precompiled per-type system prompts and user prompt compaction
+"""
+
+import logging
+import os
+import re
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Estimated tokens for system prompt + user prompt; 0 disables compaction. The
+# default fits a full-length prompt (DiagramCreate allows 10000 characters)
+AI_PROMPT_TOKEN_BUDGET = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "3000"))
+
+# Bump whenever a template or compaction step below changes so cached results are not reused
+PROMPT_TEMPLATE_VERSION = "3"
+# Cache key component: templates and budget both change what is sent upstream
+PROMPT_VERSION = f"{PROMPT_TEMPLATE_VERSION}.{AI_PROMPT_TOKEN_BUDGET}"
+
+_BASE = (
+    "You are a UML diagram code generator. Output ONLY valid Mermaid code: "
+    "no explanations, no markdown code blocks, no text before or after the code. "
+    "Start IMMEDIATELY with the diagram keyword."
+)
+
+# diagram type -> (instructions, short example)
+_TEMPLATES: Dict[Optional[str], tuple] = {
+    "class": (
+        "Generate a Class Diagram starting with classDiagram. Use `class Name {` blocks with "
+        "+public / -private / #protected members and relations such as `A --> B : label`, "
+        "`A <|-- B` (inheritance) and `A *-- B` (composition).",
+        """classDiagram
+    class Customer {
+        +String name
+        +placeOrder() Order
+    }
+    class Order {
+        +int id
+        -Date created
+    }
+    Customer "1" --> "*" Order : places""",
+    ),
+    "sequence": (
+        "Generate a Sequence Diagram starting with sequenceDiagram. Declare participants, then "
+        "messages `A->>B: text` and replies `B-->>A: text`; use alt / loop / opt blocks closed with end.",
+        """sequenceDiagram
+    participant User
+    participant API
+    User->>API: login(credentials)
+    alt valid
+        API-->>User: token
+    else invalid
+        API-->>User: error
+    end""",
+    ),
+    "usecase": (
+        "Generate a Use Case Diagram. Mermaid has no use case type: use flowchart LR with actors "
+        "as circles `U((\"User\"))`, use cases as stadiums `L([\"Log in\"])` inside a "
+        "`subgraph System [\"System\"] ... end`, and links `U --> L`.",
+        """flowchart LR
+    C(("Customer"))
+    subgraph Shop ["Shop"]
+        B(["Browse products"])
+        P(["Checkout"])
+    end
+    C --> B
+    C --> P""",
+    ),
+    "activity": (
+        "Generate an Activity Diagram starting with flowchart TD. Use `S([Start])`, actions "
+        "`A[Do something]`, decisions `D{Question?}` and labelled links `D -->|yes| A`.",
+        """flowchart TD
+    S([Start]) --> L[Enter credentials]
+    L --> V{Valid?}
+    V -->|yes| D[Open dashboard]
+    V -->|no| L
+    D --> E([End])""",
+    ),
+    None: (
+        "Determine the diagram type from the user prompt: classDiagram, sequenceDiagram, "
+        "flowchart TD for activities, or flowchart LR for use cases (Mermaid has no use case type).",
+        None,
+    ),
+}
+
+# Rough BPE-style token count: one per short word or punctuation mark,
+# long words add one per further 6 characters
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of `text` (within ~15% of common BPE tokenizers on English prose)"""
+    return sum(1 + (len(token) - 1) // 6 for token in _TOKEN.findall(text))
+
+
+def _compile(diagram_type: Optional[str]) -> str:
+    instructions, example = _TEMPLATES[diagram_type]
+    parts = [_BASE, instructions]
+    if example:
+        parts.append("Example:\n" + example)
+    return "\n\n".join(parts)
+
+
+SYSTEM_PROMPTS: Dict[Optional[str], str] = {diagram_type: _compile(diagram_type) for diagram_type in _TEMPLATES}
+SYSTEM_PROMPT_TOKENS: Dict[Optional[str], int] = {
+    diagram_type: estimate_tokens(prompt) for diagram_type, prompt in SYSTEM_PROMPTS.items()
+}
+
+
+def get_system_prompt(diagram_type: Optional[str] = None) -> str:
+    """Precompiled system prompt for a diagram type (None / unknown: auto-detect)"""
+    return SYSTEM_PROMPTS.get(diagram_type) or SYSTEM_PROMPTS[None]
+
+
+# Compaction
+
+WHITESPACE = "whitespace"
+BOILERPLATE = "boilerplate"
+DUPLICATES = "duplicates"
+TRUNCATED = "truncated"
+
+_SPACES = re.compile(r"[ \t\f\v ]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+# A sentence with the whitespace after it, so kept sentences join back unchanged
+_SENTENCE = re.compile(r"[^.!?\n]+(?:[.!?]+\s*|\n\s*|$)")
+_MARKER_TOKENS = 16
+# Politeness leading or closing the prompt; phrases inside it may be requirements
+# ("checkout must make sure that stock is reserved"), so they are left alone
+_POLITE_PREFIX = re.compile(
+    r"^\s*(?:(?:please|kindly|hi|hello|i would like(?: you)? to|i want you to|i need you to"
+    r"|(?:can|could|would) you(?: please)?|help me(?: to)?)\b[,!]?\s*)+",
+    re.IGNORECASE,
+)
+_POLITE_SUFFIX = re.compile(
+    r"[\s,]*\b(?:thanks?(?: you)?(?: (?:so|very) much)?(?: in advance)?|please)[.!]*\s*$",
+    re.IGNORECASE,
+)
+# Leading "create a UML class diagram for" when the type is already known
+_TYPE_REQUEST = re.compile(
+    r"^\s*(?:create|generate|draw|make|build|design|produce|give me|show me)\s+(?:me\s+)?(?:an?\s+|the\s+)?"
+    r"(?:uml\s+|mermaid\s+|detailed\s+|simple\s+|complete\s+)*"
+    r"(?:class|sequence|use[ -]?case|activity|flowchart)?\s*(?:diagram|chart)\s*(?:of|for|showing|that shows)?\s*",
+    re.IGNORECASE,
+)
+
+
+class CompactedPrompt:
+    """
+    A user prompt fitted to the token budget
+
+    Attributes:
+        text: Prompt to send upstream
+        tokens: Estimated tokens of `text`
+        original_tokens: Estimated tokens before compaction
+        steps: Compaction steps applied, in order (empty when it already fit)
+    """
+
+    __slots__ = ("text", "tokens", "original_tokens", "steps")
+
+    def __init__(self, text: str, tokens: int, original_tokens: int, steps: List[str]):
+        self.text = text
+        self.tokens = tokens
+        self.original_tokens = original_tokens
+        self.steps = steps
+
+
+def fit_prompt(user_prompt: str, diagram_type: Optional[str] = None, budget: int = AI_PROMPT_TOKEN_BUDGET) -> CompactedPrompt:
+    """
+    Compact a user prompt so system prompt + user prompt fit `budget` estimated tokens
+
+    Cheapest first, stopping once it fits: whitespace normalisation,
+    leading / closing politeness removal (plus "create a ... diagram"
+    phrasing when the type is known), repeated sentences dropped, and
+    finally truncation at a sentence boundary with a marker saying how
+    much was left out.
+
+    Args:
+        user_prompt: Raw user prompt
+        diagram_type: Requested type (selects the system prompt)
+        budget: Total estimated tokens; 0 disables compaction
+
+    Returns:
+        CompactedPrompt
+    """
+    original = estimate_tokens(user_prompt)
+    if budget <= 0:
+        return CompactedPrompt(user_prompt, original, original, [])
+    available = max(budget - SYSTEM_PROMPT_TOKENS.get(diagram_type, SYSTEM_PROMPT_TOKENS[None]), 0)
+    if original <= available:
+        return CompactedPrompt(user_prompt, original, original, [])
+
+    steps: List[str] = []
+    text = user_prompt
+    stages = [
+        (WHITESPACE, _collapse_whitespace),
+        (BOILERPLATE, lambda value: _drop_filler(value, diagram_type)),
+        (DUPLICATES, _drop_repeated_sentences),
+    ]
+    for name, compact in stages:
+        compacted = compact(text)
+        if compacted != text:
+            text = compacted
+            steps.append(name)
+        tokens = estimate_tokens(text)
+        if tokens <= available:
+            return CompactedPrompt(text, tokens, original, steps)
+
+    text = _truncate(text, available)
+    steps.append(TRUNCATED)
+    return CompactedPrompt(text, estimate_tokens(text), original, steps)
+
+
+def _collapse_whitespace(text: str) -> str:
+    lines = (_SPACES.sub(" ", line).strip() for line in text.strip().split("\n"))
+    return _BLANK_LINES.sub("\n", "\n".join(lines))
+
+
+def _drop_filler(text: str, diagram_type: Optional[str]) -> str:
+    text = _POLITE_SUFFIX.sub("", _POLITE_PREFIX.sub("", text, count=1), count=1)
+    if diagram_type is not None:
+        text = _TYPE_REQUEST.sub("", text, count=1)
+    return _SPACES.sub(" ", text).strip()
+
+
+def _sentences(text: str) -> List[str]:
+    return [sentence for sentence in _SENTENCE.findall(text) if sentence.strip()]
+
+
+def _drop_repeated_sentences(text: str) -> str:
+    seen = set()
+    kept = []
+    for sentence in _sentences(text):
+        key = " ".join(sentence.casefold().split()).rstrip(".!?")
+        if key in seen:
+            continue
+        seen.add(key)
+        kept.append(sentence)
+    return "".join(kept).strip()
+
+
+def _truncate(text: str, available: int) -> str:
+    """Leading whole sentences that fit, then a marker; cuts inside the first sentence only if it alone is too long"""
+    limit = max(available - _MARKER_TOKENS, 0)
+    kept, used = [], 0
+    for sentence in _sentences(text):
+        tokens = estimate_tokens(sentence)
+        if used + tokens > limit:
+            if not kept:
+                kept.append(_truncate_words(sentence, limit))
+                used = estimate_tokens(kept[0])
+            break
+        kept.append(sentence)
+        used += tokens
+    return "".join(kept).strip() + f"\n[~{estimate_tokens(text) - used} tokens omitted to fit the size budget]"
+
+
+def _truncate_words(sentence: str, limit: int) -> str:
+    words, used = [], 0
+    for word in sentence.split():
+        used += estimate_tokens(word)
+        if used > limit:
+            break
+        words.append(word)
+    # One oversized "word" (e.g. pasted data without spaces): cut by characters
+    return " ".join(words) + " ..." if words else sentence[:limit * 6] + " ..."
@@ -0,0 +1,186 @@
+"""
+Upstream LLM provider registry and latency-aware selection
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .circuit_breaker import CircuitBreaker, OPEN
+
+load_dotenv()
+
+# Configuration
+AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+AI_HEDGE_DEFAULT_DELAY = float(os.getenv("AI_HEDGE_DEFAULT_DELAY", "10"))
+AI_HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", "1"))
+AI_HEDGE_MAX_DELAY = float(os.getenv("AI_HEDGE_MAX_DELAY", "30"))
+AI_HEDGE_MAX_PARALLEL = int(os.getenv("AI_HEDGE_MAX_PARALLEL", "2"))
+
+EWMA_ALPHA = 0.2
+LATENCY_WINDOW = 100
+MIN_SAMPLES_FOR_P95 = 5
+
+
+class Provider:
+    """
+    One OpenAI-compatible or ApiFreeLLM-style chat endpoint
+
+    style="apifreellm": body {"message": ...}, reply {"success", "response"}
+    style="openai":     body {"model", "messages"}, reply {"choices": [...]}
+
+    Tracks EWMA latency, EWMA error rate and a window of recent latencies
+    (for p95), and owns its circuit breaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        api_key: Optional[str] = None,
+        style: str = "apifreellm",
+        model: Optional[str] = None
+    ):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.style = style
+        self.model = model
+        self.breaker = CircuitBreaker()
+        self.latency_ewma = AI_HEDGE_DEFAULT_DELAY
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def build_request(self, system_prompt: str, user_prompt: str, stream: bool = False) -> Tuple[Dict, Dict]:
+        """Payload and headers in this provider's wire format"""
+        if self.style == "openai":
+            payload = {
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ]
+            }
+            if self.model:
+                payload["model"] = self.model
+        else:
+            payload = {"message": f"{system_prompt}\n\nUSER REQUEST:\n{user_prompt}"}
+        if stream:
+            payload["stream"] = True
+
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return payload, headers
+
+    def extract_content(self, body: Dict) -> Tuple[str, str]:
+        """
+        Pull the generated text out of a response body
+
+        Returns:
+            (content, error) - content is empty when the body is unusable
+        """
+        if not body.get("success", True):
+            return "", f"API success=false: {body}"
+        if "choices" in body:
+            choices = body.get("choices") or [{}]
+            content = (choices[0].get("message") or {}).get("content") or ""
+        else:
+            content = body.get("response", "")
+        return content, "" if content else "Empty response"
+
+    def record(self, latency: float, ok: bool) -> None:
+        """Fold one completed call into the latency/error statistics"""
+        with self._lock:
+            self.requests += 1
+            if ok:
+                self._latencies.append(latency)
+                self.latency_ewma += EWMA_ALPHA * (latency - self.latency_ewma)
+            else:
+                self.errors += 1
+            self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+
+    def p95(self) -> float:
+        """95th percentile of recent successful latencies"""
+        with self._lock:
+            if len(self._latencies) < MIN_SAMPLES_FOR_P95:
+                return AI_HEDGE_DEFAULT_DELAY
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        """How long to wait on this provider before hedging to the next one"""
+        return min(AI_HEDGE_MAX_DELAY, max(AI_HEDGE_MIN_DELAY, self.p95()))
+
+    def score(self) -> float:
+        """Lower is better: expected latency inflated by recent error rate"""
+        return self.latency_ewma * (1.0 + 4.0 * self.error_rate)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "style": self.style,
+            "latency_ewma_seconds": round(self.latency_ewma, 3),
+            "p95_seconds": round(self.p95(), 3),
+            "error_rate": round(self.error_rate, 3),
+            "requests": self.requests,
+            "errors": self.errors,
+            "circuit": self.breaker.snapshot(),
+        }
+
+
+class ProviderSelector:
+    """Orders providers by score, skipping those whose breaker is open"""
+
+    def __init__(self, providers: List[Provider]):
+        self.providers = providers
+
+    def ranked(self) -> List[Provider]:
+        """Providers to try, best first (config order breaks ties)"""
+        order = sorted(enumerate(self.providers), key=lambda item: (item[1].score(), item[0]))
+        return [provider for _, provider in order if provider.breaker.state != OPEN]
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        return [provider.snapshot() for provider in self.providers]
+
+
+def load_providers() -> List[Provider]:
+    """
+    Build the provider registry from the environment
+
+    AI_PROVIDERS is a JSON list of {"name", "url", "api_key" or "api_key_env",
+    "style", "model"} objects. Without it, the single legacy endpoint from
+    OPENROUTER_API_URL / OPENROUTER_API_KEY is used (if a key is set).
+    """
+    raw = os.getenv("AI_PROVIDERS")
+    if raw:
+        providers = []
+        for index, spec in enumerate(json.loads(raw)):
+            api_key = spec.get("api_key")
+            if not api_key and spec.get("api_key_env"):
+                api_key = os.getenv(spec["api_key_env"])
+            providers.append(Provider(
+                name=spec.get("name", f"provider{index}"),
+                url=spec["url"],
+                api_key=api_key,
+                style=spec.get("style", "openai"),
+                model=spec.get("model")
+            ))
+        return providers
+
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        return []
+    return [Provider(
+        name="default",
+        url=os.getenv("OPENROUTER_API_URL", "https://apifreellm.com/api/v1/chat"),
+        api_key=api_key,
+        style=os.getenv("OPENROUTER_API_STYLE", "apifreellm"),
+        model=os.getenv("OPENROUTER_MODEL")
+    )]
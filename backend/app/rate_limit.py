@@ -0,0 +1,202 @@
+"""
+Per-user generation quota - in-memory token buckets with periodic persistence
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException, status
+
+from . import models
+from .auth import get_current_user
+from .database import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+GENERATION_LIMIT_FREE = int(os.getenv("GENERATION_LIMIT_FREE", "5"))
+GENERATION_LIMIT_PRO = int(os.getenv("GENERATION_LIMIT_PRO", "200"))
+GENERATION_LIMIT_WINDOW = int(os.getenv("GENERATION_LIMIT_WINDOW", "86400"))
+RATE_LIMIT_PERSIST_INTERVAL = int(os.getenv("RATE_LIMIT_PERSIST_INTERVAL", "60"))
+
+PLAN_LIMITS = {
+    models.SubscriptionPlan.FREE: GENERATION_LIMIT_FREE,
+    models.SubscriptionPlan.PRO: GENERATION_LIMIT_PRO,
+}
+
+
+class RateLimiter:
+    """
+    Token bucket per user, sized by subscription plan
+
+    A plan allowing N generations per window gets a bucket of capacity N
+    that refills continuously at N/window tokens per second, so checks are
+    O(1) with no COUNT over diagrams. Buckets touched since the last flush
+    are written to rate_limit_buckets periodically and reloaded on start.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[models.SubscriptionPlan, int] = PLAN_LIMITS,
+        window: int = GENERATION_LIMIT_WINDOW,
+        session_factory: Optional[Callable] = None,
+        persist_interval: int = RATE_LIMIT_PERSIST_INTERVAL
+    ):
+        self.limits = limits
+        self.window = window
+        self.session_factory = session_factory
+        self.persist_interval = persist_interval
+        self._buckets: Dict[int, list] = {}  # user_id -> [tokens, updated_at]
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def acquire(self, user_id: int, plan: models.SubscriptionPlan, cost: int = 1) -> Tuple[bool, int, float]:
+        """
+        Take `cost` tokens from the user's bucket if available
+
+        Returns:
+            (allowed, remaining, retry_after_seconds)
+        """
+        capacity = self.limits.get(plan, GENERATION_LIMIT_FREE)
+        rate = capacity / self.window
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = [float(capacity), now]
+            tokens = min(float(capacity), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                self._dirty.add(user_id)
+                return True, int(bucket[0]), 0.0
+            bucket[0] = tokens
+            if cost > capacity:
+                return False, int(tokens), float(self.window)
+            return False, int(tokens), (cost - tokens) / rate
+
+    def refund(self, user_id: int, plan: models.SubscriptionPlan, cost: int = 1) -> None:
+        """Give back tokens taken for a generation that was rejected before it ran"""
+        capacity = self.limits.get(plan, GENERATION_LIMIT_FREE)
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                return
+            bucket[0] = min(float(capacity), bucket[0] + cost)
+            self._dirty.add(user_id)
+
+    async def start(self) -> None:
+        """Load persisted buckets and start the flush loop"""
+        if self.session_factory is None:
+            return
+        await asyncio.to_thread(self.load)
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and persist outstanding buckets"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.session_factory is not None:
+            await asyncio.to_thread(self.flush)
+
+    def load(self) -> None:
+        db = self.session_factory()
+        try:
+            rows = db.query(models.RateLimitBucket).all()
+            with self._lock:
+                for row in rows:
+                    self._buckets[row.user_id] = [row.tokens, row.updated_at]
+        finally:
+            db.close()
+
+    def flush(self) -> None:
+        """Write buckets changed since the last flush"""
+        with self._lock:
+            dirty = {user_id: tuple(self._buckets[user_id]) for user_id in self._dirty}
+            self._dirty.clear()
+        if not dirty:
+            return
+        db = self.session_factory()
+        try:
+            for user_id, (tokens, updated_at) in dirty.items():
+                db.merge(models.RateLimitBucket(user_id=user_id, tokens=tokens, updated_at=updated_at))
+            db.commit()
+        except Exception as e:
+            logger.warning("Failed to persist rate limit buckets: %s", e)
+            db.rollback()
+            with self._lock:
+                self._dirty.update(dirty)
+        finally:
+            db.close()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            await asyncio.to_thread(self.flush)
+
+
+rate_limiter = RateLimiter(session_factory=SessionLocal)
+
+
+def enforce_generation_quota(user: models.User, cost: int = 1) -> None:
+    """
+    Consume `cost` generations from the user's quota
+
+    Raises:
+        HTTPException: 400 when `cost` exceeds the plan's whole quota (it
+            could never succeed), 429 with Retry-After when the quota is exhausted
+    """
+    limit = rate_limiter.limits.get(user.subscription_plan, GENERATION_LIMIT_FREE)
+    window = f"{rate_limiter.window // 3600}h" if rate_limiter.window >= 3600 else f"{rate_limiter.window}s"
+    if cost > limit:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=(
+                f"Request needs {cost} generations but the {user.subscription_plan.value} plan "
+                f"allows {limit} per {window}; split it into smaller batches"
+            ),
+        )
+    allowed, remaining, retry_after = rate_limiter.acquire(user.id, user.subscription_plan, cost)
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Generation limit reached ({limit} per {window} on the {user.subscription_plan.value} plan)",
+            headers={
+                "Retry-After": str(math.ceil(retry_after)),
+                "X-RateLimit-Limit": str(limit),
+                "X-RateLimit-Remaining": str(remaining),
+            },
+        )
+
+
+def is_unbilled(result: Dict) -> bool:
+    """Whether a generation result cost no upstream call: a cache / similar-prompt hit or the static fallback"""
+    return bool(result.get("cached") or result.get("fallback"))
+
+
+def refund_unbilled(user: models.User, results: Iterable[Dict]) -> None:
+    """Give back the quota taken for results that is_unbilled()"""
+    unbilled = sum(1 for result in results if is_unbilled(result))
+    if unbilled:
+        rate_limiter.refund(user.id, user.subscription_plan, unbilled)
+
+
+def generation_quota(current_user: models.User = Depends(get_current_user)) -> models.User:
+    """
+    Dependency: authenticated user with one generation taken from their quota
+
+    Routes give it back with refund_unbilled() when the result cost no upstream call.
+    """
+    enforce_generation_quota(current_user)
+    return current_user
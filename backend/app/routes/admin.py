@@ -1,14 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from typing import List
 from .. import models, schemas
 from ..database import get_db
-from ..auth import get_current_user
+from ..auth import get_current_user, invalidate_user_cache
+from ..observability import TimedRoute
+from ..stats import admin_stats, ADMIN_STATS_MAX_DAYS
+from ..search import search_index
+from .diagrams import ai_engine
 
 router = APIRouter(
     prefix="/admin",
-    tags=["admin"]
+    tags=["admin"],
+    route_class=TimedRoute
 )
 
 # Admin Dependency
@@ -21,43 +25,20 @@ def get_current_admin(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 @router.get("/stats")
-def get_admin_stats(
-    db: Session = Depends(get_db),
+async def get_admin_stats(
+    days: int = Query(30, ge=1, le=ADMIN_STATS_MAX_DAYS),
     current_user: models.User = Depends(get_current_admin)
 ):
-    total_users = db.query(models.User).count()
-    total_diagrams = db.query(models.Diagram).count()
-    pro_users = db.query(models.User).filter(models.User.subscription_plan == models.SubscriptionPlan.PRO).count()
-    
-    # Diagrams by type
-    diagrams_by_type = db.query(
-        models.Diagram.diagram_type, 
-        func.count(models.Diagram.id)
-    ).group_by(models.Diagram.diagram_type).all()
-    
-    # Recent activity (last 5 diagrams)
-    recent_diagrams = db.query(models.Diagram)\
-        .order_by(models.Diagram.created_at.desc())\
-        .limit(5)\
-        .all()
-    
-    recent_activity = []
-    for d in recent_diagrams:
-        user = db.query(models.User).filter(models.User.id == d.user_id).first()
-        recent_activity.append({
-            "id": d.id,
-            "title": d.title,
-            "type": d.diagram_type,
-            "created_at": d.created_at,
-            "user_email": user.email if user else "Unknown"
-        })
+    """Dashboard totals, recent activity and a `days`-long daily series (cached, see stats.AdminStats)"""
+    return await admin_stats.get(days)
 
+@router.get("/cache")
+def get_cache_stats(current_user: models.User = Depends(get_current_admin)):
+    """Generation cache hit/miss, similar-prompt matching and request coalescing counters"""
     return {
-        "total_users": total_users,
-        "total_diagrams": total_diagrams,
-        "pro_users": pro_users,
-        "diagrams_by_type": {type_: count for type_, count in diagrams_by_type},
-        "recent_activity": recent_activity
+        **ai_engine.cache.stats(),
+        "similar_prompts": ai_engine.similar.stats(),
+        "single_flight": ai_engine.inflight.stats()
     }
 
 @router.get("/users", response_model=List[schemas.UserResponse])
@@ -80,6 +61,25 @@ def delete_user(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
+    search_index.remove_user(db, user_id)
     db.delete(user)
     db.commit()
+    invalidate_user_cache(user_id)
     return {"message": "User deleted successfully"}
+
+@router.put("/users/{user_id}/plan", response_model=schemas.UserResponse)
+def update_user_plan(
+    user_id: int,
+    plan_data: schemas.UserPlanUpdate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_admin)
+):
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    user.subscription_plan = models.SubscriptionPlan(plan_data.subscription_plan.value)
+    db.commit()
+    db.refresh(user)
+    invalidate_user_cache(user_id)
+    return user
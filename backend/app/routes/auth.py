@@ -3,9 +3,11 @@ Authentication routes - Register, Login, User Info
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models import User
 from ..schemas import UserCreate, UserLogin, UserResponse, Token
 from ..auth import (
@@ -14,18 +16,19 @@ from ..auth import (
     create_access_token,
     get_current_user
 )
+from ..observability import TimedRoute
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+router = APIRouter(prefix="/auth", tags=["Authentication"], route_class=TimedRoute)
 
 
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Register a new user
     
     Args:
         user_data: User registration data (email, password)
-        db: Database session
+        db: Async database session
     
     Returns:
         JWT token and user information
@@ -34,7 +37,7 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         HTTPException: If email already exists
     """
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = (await db.execute(select(User).where(User.email == user_data.email))).scalar_one_or_none()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -42,15 +45,15 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
     new_user = User(
         email=user_data.email,
         password_hash=hashed_password
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     # Create access token
     access_token = create_access_token(data={"sub": new_user.id})
@@ -63,13 +66,13 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-def login(credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """
     Login user and return JWT token
     
     Args:
         credentials: User login credentials (email, password)
-        db: Database session
+        db: Async database session
     
     Returns:
         JWT token and user information
@@ -77,7 +80,7 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
     Raises:
         HTTPException: If credentials are invalid
     """
-    user = authenticate_user(db, credentials.email, credentials.password)
+    user = await authenticate_user(db, credentials.email, credentials.password)
     
     if not user:
         raise HTTPException(
@@ -97,7 +100,7 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: User = Depends(get_current_user)):
     """
     Get current authenticated user information
     
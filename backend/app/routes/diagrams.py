@@ -2,31 +2,54 @@
 Diagram routes - Generate, Save, List, Delete diagrams
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, noload, undefer
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+import base64
+import json
 
-from ..database import get_db
+from ..database import get_async_db, SessionLocal
 from ..models import User, Diagram
 from ..schemas import (
     DiagramCreate,
+    DiagramBatchCreate,
+    DiagramBatchItemResult,
+    DiagramBatchResponse,
     DiagramSave,
     DiagramResponse,
     DiagramGenerateResponse,
-    DiagramListResponse
+    DiagramExportFormat,
+    DiagramImportResponse,
+    DiagramListResponse,
+    DiagramListView,
+    DiagramSearchResponse,
+    DiagramSummary
 )
 from ..auth import get_current_user
+from ..rate_limit import generation_quota, enforce_generation_quota, refund_unbilled
 from ..ai_engine import AIEngine
+from ..cache import GenerationCache, GENERATION_CACHE_DB
+from ..observability import TimedRoute
+from ..search import search_index
+from ..transfer import ImportTooLarge, export_ndjson, export_zip, import_diagrams
 
-ai_engine = AIEngine()
+ai_engine = AIEngine(
+    cache=GenerationCache(session_factory=SessionLocal if GENERATION_CACHE_DB else None)
+)
+
+router = APIRouter(prefix="/diagrams", tags=["Diagrams"], route_class=TimedRoute)
 
-router = APIRouter(prefix="/diagrams", tags=["Diagrams"])
+MAX_PAGE_SIZE = 100
 
 
 @router.post("/generate", response_model=DiagramGenerateResponse)
-def generate_uml_diagram(
+async def generate_uml_diagram(
     diagram_data: DiagramCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(generation_quota)
 ):
     """
     Generate UML diagram from prompt using AI
@@ -38,12 +61,12 @@ def generate_uml_diagram(
     Returns:
         Generated Mermaid code and diagram type
     """
-    # TODO: Implement rate limiting for free users (5 diagrams per day)
-    
-    # Generate diagram using AI
-    result = ai_engine.generate_uml(
+    # Generate diagram using AI (non-blocking, pooled upstream connections)
+    result = await ai_engine.agenerate_uml(
         user_prompt=diagram_data.prompt,
-        diagram_type=diagram_data.diagram_type.value if diagram_data.diagram_type else None
+        diagram_type=diagram_data.diagram_type.value if diagram_data.diagram_type else None,
+        use_cache=not diagram_data.bypass_cache,
+        user_id=current_user.id
     )
     
     if not result.get("success", False):
@@ -51,28 +74,149 @@ def generate_uml_diagram(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to generate diagram: {result.get('error', 'Unknown error')}"
         )
+    refund_unbilled(current_user, [result])
     
     return DiagramGenerateResponse(
         mermaid_code=result["mermaid_code"],
         diagram_type=result["diagram_type"],
-        success=True
+        success=True,
+        cached=result.get("cached", False),
+        match_score=result.get("match_score"),
+        repairs=result.get("repairs", []),
+        prompt_compaction=result.get("prompt_compaction", [])
+    )
+
+
+@router.post("/generate/batch", response_model=DiagramBatchResponse)
+async def generate_uml_diagram_batch(
+    batch: DiagramBatchCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Generate several diagrams concurrently (bounded by AI_BATCH_CONCURRENCY)
+    
+    Args:
+        batch: Items to generate and whether to save them
+        db: Async database session
+        current_user: Current authenticated user
+    
+    Returns:
+        Per-item results/errors in request order
+    """
+    enforce_generation_quota(current_user, cost=len(batch.items))
+    
+    outcomes = await ai_engine.agenerate_batch([
+        (
+            item.prompt,
+            item.diagram_type.value if item.diagram_type else None,
+            not item.bypass_cache
+        )
+        for item in batch.items
+    ], user_id=current_user.id)
+    refund_unbilled(current_user, [outcome for outcome in outcomes if isinstance(outcome, dict)])
+    
+    results = []
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, BaseException) or not outcome.get("success", False):
+            error = str(outcome) if isinstance(outcome, BaseException) else outcome.get("error", "Unknown error")
+            results.append(DiagramBatchItemResult(index=index, success=False, error=error))
+            continue
+        results.append(DiagramBatchItemResult(
+            index=index,
+            success=True,
+            mermaid_code=outcome["mermaid_code"],
+            diagram_type=outcome["diagram_type"],
+            cached=outcome.get("cached", False),
+            match_score=outcome.get("match_score"),
+            note=outcome.get("note")
+        ))
+    
+    if batch.save:
+        await _save_batch_results(db, current_user.id, batch.items, results)
+    
+    succeeded = sum(1 for r in results if r.success)
+    return DiagramBatchResponse(results=results, succeeded=succeeded, failed=len(results) - succeeded)
+
+
+async def _save_batch_results(db: AsyncSession, user_id: int, items: list, results: list) -> None:
+    """Persist successful batch results as Diagram rows in one transaction"""
+    saved = []
+    for item, result in zip(items, results):
+        if not result.success:
+            continue
+        diagram = Diagram(
+            user_id=user_id,
+            title=item.title or f"Diagram - {item.prompt[:50]}",
+            prompt=item.prompt,
+            mermaid_code=result.mermaid_code,
+            diagram_type=result.diagram_type
+        )
+        db.add(diagram)
+        saved.append((result, diagram))
+    
+    await db.flush()
+    for _, diagram in saved:
+        await search_index.aindex_diagram(db, diagram)
+    await db.commit()
+    for result, diagram in saved:
+        result.diagram_id = diagram.id
+        ai_engine.similar.add_diagram(diagram.id, user_id, diagram.prompt, diagram.diagram_type)
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/generate/stream")
+async def generate_uml_diagram_stream(
+    diagram_data: DiagramCreate,
+    current_user: User = Depends(generation_quota)
+):
+    """
+    Generate UML diagram and stream Mermaid lines as Server-Sent Events
+    
+    Emits one `line` event per Mermaid line as soon as it is available and a
+    final `done` event with the full code and detected diagram_type.
+    
+    Args:
+        diagram_data: Diagram creation data (prompt, optional diagram_type)
+        current_user: Current authenticated user
+    
+    Returns:
+        text/event-stream response
+    """
+    async def event_stream():
+        async for event, data in ai_engine.astream_uml(
+            user_prompt=diagram_data.prompt,
+            diagram_type=diagram_data.diagram_type.value if diagram_data.diagram_type else None,
+            use_cache=not diagram_data.bypass_cache,
+            user_id=current_user.id
+        ):
+            if event == "done":
+                refund_unbilled(current_user, [data])
+            yield _sse(event, data)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
 @router.post("/save", response_model=DiagramResponse, status_code=status.HTTP_201_CREATED)
-def save_diagram(
+async def save_diagram(
     diagram_data: DiagramSave,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Save a generated diagram to database
     
     Args:
-        diagram_data: Original diagram creation data
-        mermaid_code: Generated Mermaid code
-        diagram_type: Detected diagram type
-        db: Database session
+        diagram_data: Prompt, generated Mermaid code, diagram type and optional title
+        db: Async database session
         current_user: Current authenticated user
     
     Returns:
@@ -91,51 +235,238 @@ def save_diagram(
     )
     
     db.add(new_diagram)
-    db.commit()
-    db.refresh(new_diagram)
+    await db.flush()
+    await search_index.aindex_diagram(db, new_diagram)
+    await db.commit()
+    await db.refresh(new_diagram)
+    ai_engine.similar.add_diagram(new_diagram.id, current_user.id, diagram_data.prompt, diagram_data.diagram_type)
     
     return new_diagram
 
 
 @router.get("/", response_model=DiagramListResponse)
-def list_diagrams(
-    page: int = 1,
-    page_size: int = 10,
-    db: Session = Depends(get_db),
+async def list_diagrams(
+    cursor: Optional[str] = None,
+    page: Optional[int] = Query(None, ge=1),
+    page_size: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    include_total: bool = False,
+    view: DiagramListView = DiagramListView.SUMMARY,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    List all diagrams for current user with pagination
+    List diagrams for current user, newest first
+    
+    Cursor mode (default) seeks on (created_at, id) through the
+    ix_diagrams_user_created_id index, so every page costs the same however
+    deep it is. Pass the returned `next_cursor` to get the following page.
+    Passing `page` switches to legacy OFFSET pagination with an exact total.
+    
+    By default rows are summaries (sizes and a short prompt preview computed
+    in SQL) so prompt and mermaid_code bodies are never read; `view=full`
+    returns complete diagrams.
     
     Args:
-        page: Page number (1-indexed)
+        cursor: Opaque cursor from a previous response
+        page: Page number (1-indexed, legacy offset mode)
         page_size: Number of items per page
-        db: Database session
+        include_total: Also COUNT the user's diagrams in cursor mode
+        view: summary (default) or full rows
+        db: Async database session
         current_user: Current authenticated user
     
     Returns:
         List of diagrams with pagination info
     """
-    # Calculate offset
-    offset = (page - 1) * page_size
+    owned = Diagram.user_id == current_user.id
+    ordered = select(Diagram).where(owned).order_by(Diagram.created_at.desc(), Diagram.id)
+    if view == DiagramListView.SUMMARY:
+        ordered = ordered.options(
+            load_only(Diagram.id, Diagram.title, Diagram.diagram_type, Diagram.created_at, Diagram.preview),
+            undefer(Diagram.prompt_size),
+            undefer(Diagram.code_size),
+            noload(Diagram.prompt_blob),
+            noload(Diagram.code_blob)
+        )
+    
+    if page is not None:
+        total = await _count_diagrams(db, current_user.id)
+        diagrams = (await db.scalars(ordered.offset((page - 1) * page_size).limit(page_size))).all()
+        return DiagramListResponse(
+            diagrams=_list_rows(diagrams, view),
+            total=total,
+            page=page,
+            page_size=page_size,
+            has_more=page * page_size < total
+        )
+    
+    if cursor:
+        created_at, last_id = _decode_cursor(cursor)
+        ordered = ordered.where(or_(
+            Diagram.created_at < created_at,
+            and_(Diagram.created_at == created_at, Diagram.id > last_id)
+        ))
+    
+    # One extra row tells us whether another page exists without counting
+    rows = (await db.scalars(ordered.limit(page_size + 1))).all()
+    has_more = len(rows) > page_size
+    diagrams = rows[:page_size]
     
-    # Query diagrams
-    query = db.query(Diagram).filter(Diagram.user_id == current_user.id)
-    total = query.count()
-    diagrams = query.order_by(Diagram.created_at.desc()).offset(offset).limit(page_size).all()
+    total = None
+    if include_total:
+        total = await _count_diagrams(db, current_user.id)
+    elif not cursor and not has_more:
+        total = len(diagrams)  # First page holds everything
     
     return DiagramListResponse(
-        diagrams=diagrams,
+        diagrams=_list_rows(diagrams, view),
         total=total,
+        page_size=page_size,
+        next_cursor=_encode_cursor(diagrams[-1]) if has_more else None,
+        has_more=has_more
+    )
+
+
+@router.get("/search", response_model=DiagramSearchResponse)
+async def search_diagrams(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Full-text search over the current user's diagrams
+    
+    Matches title, prompt and names declared in the Mermaid code (classes,
+    participants, entities...), best matches first. Declared before
+    /{diagram_id} so "search" is not parsed as an id.
+    
+    Args:
+        q: Search terms
+        page: Page number (1-indexed)
+        page_size: Number of results per page
+        db: Async database session
+        current_user: Current authenticated user
+    
+    Returns:
+        Ranked results with highlighted title and prompt snippet
+    """
+    rows = await search_index.asearch(
+        db, current_user.id, q, limit=page_size + 1, offset=(page - 1) * page_size
+    )
+    return DiagramSearchResponse(
+        query=q,
+        results=rows[:page_size],
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        has_more=len(rows) > page_size
+    )
+
+
+@router.get("/export")
+async def export_diagrams(
+    request: Request,
+    format: DiagramExportFormat = DiagramExportFormat.NDJSON,
+    since: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stream all of the current user's diagrams as NDJSON or a ZIP of .mmd files
+    
+    Rows are read through a server-side cursor and written as they arrive,
+    so memory use does not grow with the number of diagrams. NDJSON is
+    gzip-compressed on the fly when the client accepts it; ZIP entries are
+    deflated individually.
+    
+    For incremental exports pass the previous response's X-Export-Until
+    header back as `since`: each export covers diagrams created in
+    [since, until).
+    
+    Args:
+        request: Incoming request (for Accept-Encoding)
+        format: ndjson (one DiagramResponse per line) or zip
+        since: Only export diagrams created at or after this time
+        current_user: Current authenticated user
+    
+    Returns:
+        Streamed attachment
+    """
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)  # created_at is naive UTC
+    until = datetime.utcnow()
+    headers = {
+        "Content-Disposition": f'attachment; filename="diagrams-{until:%Y%m%d%H%M%S}.{format.value}"',
+        "X-Export-Until": until.isoformat(),
+    }
+    if format == DiagramExportFormat.ZIP:
+        return StreamingResponse(
+            export_zip(current_user.id, since, until),
+            media_type="application/zip",
+            headers=headers
+        )
+    
+    gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_ndjson(current_user.id, since, until, gzip=gzip),
+        media_type="application/x-ndjson",
+        headers={**headers, "Vary": "Accept-Encoding"}
     )
 
 
+@router.post("/import", response_model=DiagramImportResponse)
+async def import_diagrams_upload(
+    request: Request,
+    format: Optional[DiagramExportFormat] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Bulk-import diagrams from a streamed NDJSON or ZIP upload
+    
+    The raw request body is either NDJSON (one DiagramSave object per line,
+    e.g. an NDJSON export) or a ZIP of .mmd files (e.g. a ZIP export; files
+    without the export header are titled after their file name). A
+    gzip Content-Encoding is decompressed on the fly. Records missing
+    diagram_type get it detected from the Mermaid code.
+    
+    Args:
+        request: Incoming request, whose body is read as a stream
+        format: ndjson or zip; defaults from Content-Type (application/zip -> zip)
+        db: Async database session
+        current_user: Current authenticated user
+    
+    Returns:
+        Imported / failed counts and per-record errors
+    
+    Raises:
+        HTTPException: If a ZIP upload exceeds IMPORT_MAX_BYTES
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = DiagramExportFormat.ZIP if "zip" in content_type else DiagramExportFormat.NDJSON
+    try:
+        return await import_diagrams(
+            db,
+            current_user.id,
+            request.stream(),
+            archive_format=format.value,
+            gzip="gzip" in request.headers.get("content-encoding", "").lower(),
+            detect_type=ai_engine._detect_diagram_type
+        )
+    except ImportTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+
+
 @router.get("/{diagram_id}", response_model=DiagramResponse)
-def get_diagram(
+async def get_diagram(
     diagram_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -143,7 +474,7 @@ def get_diagram(
     
     Args:
         diagram_id: Diagram ID
-        db: Database session
+        db: Async database session
         current_user: Current authenticated user
     
     Returns:
@@ -152,10 +483,7 @@ def get_diagram(
     Raises:
         HTTPException: If diagram not found or unauthorized
     """
-    diagram = db.query(Diagram).filter(
-        Diagram.id == diagram_id,
-        Diagram.user_id == current_user.id
-    ).first()
+    diagram = await _get_owned_diagram(db, diagram_id, current_user.id)
     
     if not diagram:
         raise HTTPException(
@@ -167,9 +495,9 @@ def get_diagram(
 
 
 @router.delete("/{diagram_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_diagram(
+async def delete_diagram(
     diagram_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -177,16 +505,13 @@ def delete_diagram(
     
     Args:
         diagram_id: Diagram ID
-        db: Database session
+        db: Async database session
         current_user: Current authenticated user
     
     Raises:
         HTTPException: If diagram not found or unauthorized
     """
-    diagram = db.query(Diagram).filter(
-        Diagram.id == diagram_id,
-        Diagram.user_id == current_user.id
-    ).first()
+    diagram = await _get_owned_diagram(db, diagram_id, current_user.id)
     
     if not diagram:
         raise HTTPException(
@@ -194,7 +519,48 @@ def delete_diagram(
             detail="Diagram not found"
         )
     
-    db.delete(diagram)
-    db.commit()
+    await search_index.aremove_diagram(db, diagram.id)
+    await db.delete(diagram)
+    await db.commit()
+    ai_engine.similar.remove_diagram(diagram_id)
     
     return None
+
+
+async def _get_owned_diagram(db: AsyncSession, diagram_id: int, user_id: int) -> Optional[Diagram]:
+    """Load a diagram only if it belongs to user_id"""
+    return (await db.execute(
+        select(Diagram).where(Diagram.id == diagram_id, Diagram.user_id == user_id)
+    )).scalar_one_or_none()
+
+
+def _list_rows(diagrams: list, view: DiagramListView) -> list:
+    """Validate rows against the schema matching the loaded columns"""
+    schema = DiagramSummary if view == DiagramListView.SUMMARY else DiagramResponse
+    return [schema.model_validate(diagram) for diagram in diagrams]
+
+
+async def _count_diagrams(db: AsyncSession, user_id: int) -> int:
+    return await db.scalar(select(func.count()).select_from(Diagram).where(Diagram.user_id == user_id))
+
+
+def _encode_cursor(diagram: Diagram) -> str:
+    """Opaque keyset cursor pointing just after `diagram`"""
+    raw = json.dumps([diagram.created_at.isoformat(), diagram.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Raises:
+        HTTPException: 400 if the cursor was not produced by _encode_cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, last_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(last_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
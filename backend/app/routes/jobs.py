@@ -0,0 +1,88 @@
+"""
+Generation job routes - Submit and poll background diagram generation
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from ..database import SessionLocal
+from ..models import User
+from ..schemas import DiagramCreate, JobResponse
+from ..auth import get_current_user
+from ..rate_limit import generation_quota, rate_limiter
+from ..jobs import JobQueue, JobLimitExceeded
+from ..observability import TimedRoute
+from .diagrams import ai_engine
+
+job_queue = JobQueue(ai_engine, SessionLocal)
+
+router = APIRouter(prefix="/diagrams/jobs", tags=["Jobs"], route_class=TimedRoute)
+
+
+@router.post("", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_generation_job(
+    diagram_data: DiagramCreate,
+    current_user: User = Depends(generation_quota)
+):
+    """
+    Queue a diagram generation and return immediately
+    
+    Args:
+        diagram_data: Diagram creation data (prompt, optional diagram_type)
+        current_user: Current authenticated user
+    
+    Returns:
+        The pending job; poll GET /diagrams/jobs/{id} for the result
+    
+    Raises:
+        HTTPException: If the user already has too many active jobs
+    """
+    try:
+        job = await job_queue.submit(
+            user_id=current_user.id,
+            prompt=diagram_data.prompt,
+            diagram_type=diagram_data.diagram_type.value if diagram_data.diagram_type else None,
+            title=diagram_data.title,
+            use_cache=not diagram_data.bypass_cache
+        )
+    except JobLimitExceeded as e:
+        # The job never runs, so it should not count against the quota
+        rate_limiter.refund(current_user.id, current_user.subscription_plan)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
+    
+    return job
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_generation_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=30),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a generation job, optionally long-polling until it finishes
+    
+    Args:
+        job_id: Job ID
+        wait: Seconds to wait for a pending/running job to finish (0 = return immediately)
+        current_user: Current authenticated user
+    
+    Returns:
+        Job state, including the result once succeeded
+    
+    Raises:
+        HTTPException: If job not found or unauthorized
+    """
+    job = await job_queue.get(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    if wait > 0:
+        job = await job_queue.wait(job_id, wait)
+    
+    return job
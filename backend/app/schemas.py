@@ -3,7 +3,7 @@ Pydantic schemas for request/response validation
 """
 
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import List, Optional, Union
 from datetime import datetime
 from enum import Enum
 
@@ -50,6 +50,11 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+class UserPlanUpdate(BaseModel):
+    """Schema for changing a user's subscription plan"""
+    subscription_plan: SubscriptionPlan
+
+
 class Token(BaseModel):
     """Schema for JWT token response"""
     access_token: str
@@ -63,6 +68,13 @@ class DiagramCreate(BaseModel):
     prompt: str = Field(..., min_length=10, max_length=10000)
     diagram_type: Optional[DiagramType] = None
     title: Optional[str] = Field(None, max_length=255)
+    bypass_cache: bool = False
+
+
+class DiagramBatchCreate(BaseModel):
+    """Schema for generating several diagrams in one request"""
+    items: list[DiagramCreate] = Field(..., min_length=1, max_length=50)
+    save: bool = False
 
 
 class DiagramSave(BaseModel):
@@ -87,17 +99,136 @@ class DiagramResponse(BaseModel):
         from_attributes = True
 
 
+class DiagramSummary(BaseModel):
+    """Schema for a diagram in list views (no prompt or code bodies)"""
+    id: int
+    title: str
+    diagram_type: DiagramType
+    created_at: datetime
+    prompt_size: int
+    code_size: int
+    preview: str
+    
+    class Config:
+        from_attributes = True
+
+
+class DiagramSearchHit(BaseModel):
+    """One ranked search match; highlights wrap matches in <mark>...</mark>"""
+    id: int
+    title: str
+    diagram_type: DiagramType
+    created_at: datetime
+    rank: float
+    title_highlight: str
+    snippet: str
+
+
+class DiagramSearchResponse(BaseModel):
+    """Schema for a page of search results"""
+    query: str
+    results: list[DiagramSearchHit]
+    page: int
+    page_size: int
+    has_more: bool = False
+
+
+class DiagramListView(str, Enum):
+    """Row shape returned by GET /diagrams/"""
+    SUMMARY = "summary"
+    FULL = "full"
+
+
+class DiagramExportFormat(str, Enum):
+    """Archive format of GET /diagrams/export and POST /diagrams/import"""
+    NDJSON = "ndjson"
+    ZIP = "zip"
+
+
+class DiagramImportError(BaseModel):
+    """A record rejected by POST /diagrams/import"""
+    record: int  # 1-based position in the upload (NDJSON line / ZIP entry)
+    source: Optional[str] = None  # ZIP entry name
+    error: str
+
+
+class DiagramImportResponse(BaseModel):
+    """Outcome of a bulk import"""
+    imported: int
+    failed: int
+    errors: list[DiagramImportError]
+    errors_truncated: bool = False
+
+
 class DiagramGenerateResponse(BaseModel):
     """Schema for AI generation response"""
     mermaid_code: str
     diagram_type: DiagramType
     success: bool
     error: Optional[str] = None
+    cached: bool = False
+    match_score: Optional[float] = None
+    repairs: List[str] = []
+    prompt_compaction: List[str] = []  # steps applied to fit AI_PROMPT_TOKEN_BUDGET; "truncated" drops text
+
+
+class DiagramBatchItemResult(BaseModel):
+    """Result of one item in a batch generation, in request order"""
+    index: int
+    success: bool
+    mermaid_code: Optional[str] = None
+    diagram_type: Optional[DiagramType] = None
+    cached: bool = False
+    match_score: Optional[float] = None
+    note: Optional[str] = None
+    diagram_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class DiagramBatchResponse(BaseModel):
+    """Schema for batch generation response"""
+    results: list[DiagramBatchItemResult]
+    succeeded: int
+    failed: int
+
+
+class JobStatus(str, Enum):
+    """Background generation job states"""
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class JobResponse(BaseModel):
+    """Schema for a background generation job"""
+    id: str
+    status: JobStatus
+    prompt: str
+    title: Optional[str] = None
+    mermaid_code: Optional[str] = None
+    diagram_type: Optional[DiagramType] = None
+    note: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
 
 
 class DiagramListResponse(BaseModel):
-    """Schema for list of diagrams"""
-    diagrams: list[DiagramResponse]
-    total: int
-    page: int
+    """
+    Schema for list of diagrams
+
+    Rows are DiagramSummary unless `view=full` was requested. In cursor
+    mode (default) `next_cursor` fetches the following page and
+    `total` is only set when requested or already known; legacy offset mode
+    (`page=`) always reports `page` and `total`.
+    """
+    diagrams: list[Union[DiagramResponse, DiagramSummary]]
+    total: Optional[int] = None
+    page: Optional[int] = None
     page_size: int
+    next_cursor: Optional[str] = None
+    has_more: bool = False
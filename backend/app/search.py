@@ -0,0 +1,321 @@
+"""
+Full-text search over saved diagrams - Postgres tsvector + GIN, SQLite FTS5 for local/dev
+"""
+
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, select, text
+from sqlalchemy.exc import OperationalError
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+BACKFILL_BATCH = 500
+
+POSTGRES = "postgresql"
+SQLITE = "sqlite"
+
+# Names declared in Mermaid source: classes, participants/actors, states,
+# ER entities and relationships, use case labels, flowchart node labels,
+# sequence message endpoints
+_IDENTIFIER_PATTERNS = [
+    re.compile(r"^\s*class\s+([A-Za-z_][\w]*)", re.MULTILINE),
+    re.compile(r"^\s*(?:participant|actor|state|entity)\s+\"?([\w ]+?)\"?(?:\s+as\b|\s*$|\s*\{)", re.MULTILINE),
+    re.compile(r"^\s*([A-Za-z_][\w-]*)\s*\{", re.MULTILINE),
+    re.compile(r"usecase\s+\"([^\"]+)\"", re.MULTILINE),
+    re.compile(r"\w+\s*[\[\(]{1,2}\"?([^\]\)\"]+)\"?[\]\)]{1,2}"),
+    re.compile(r"^\s*(\w+)\s*-[->x)]+\+?-?\s*(\w+)\s*:", re.MULTILINE),
+    re.compile(r"^\s*([A-Za-z_][\w-]*)\s+[|}o][|o](?:--|\.\.)[|o][|{o]\s+([A-Za-z_][\w-]*)\s*:", re.MULTILINE),
+]
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_MERMAID_KEYWORDS = {"class", "classDiagram", "sequenceDiagram", "erDiagram", "flowchart", "graph", "usecaseDiagram"}
+
+
+def extract_identifiers(mermaid_code: str) -> str:
+    """
+    Space-separated names declared in a diagram, with CamelCase names also
+    split into words so "ShoppingCart" matches a search for "cart"
+    """
+    names: List[str] = []
+    for pattern in _IDENTIFIER_PATTERNS:
+        for match in pattern.finditer(mermaid_code or ""):
+            names.extend(group.strip() for group in match.groups() if group)
+
+    words, seen = [], set()
+    for name in names:
+        if name in _MERMAID_KEYWORDS or name in seen:
+            continue
+        seen.add(name)
+        words.append(name)
+        split = _CAMEL_BOUNDARY.sub(" ", name)
+        if split != name:
+            words.append(split)
+    return " ".join(words)
+
+
+def highlight_snippet(value: str, query: str, words: int = 20) -> str:
+    """
+    Window of `words` words around the first query term in `value`, with
+    words starting with a query term wrapped in HIGHLIGHT_START/END
+    """
+    terms = [term.lower() for term in re.findall(r"\w+", query)]
+    tokens = value.split()
+    if not tokens:
+        return ""
+
+    def matches(token: str) -> bool:
+        word = re.sub(r"^\W+", "", token).lower()
+        return any(word.startswith(term) for term in terms)
+
+    first = next((i for i, token in enumerate(tokens) if matches(token)), 0)
+    start = max(0, first - words // 4)
+    window = tokens[start:start + words]
+    snippet = " ".join(f"{HIGHLIGHT_START}{token}{HIGHLIGHT_END}" if matches(token) else token for token in window)
+    if start > 0:
+        snippet = "…" + snippet
+    if start + words < len(tokens):
+        snippet += "…"
+    return snippet
+
+
+class SearchIndex:
+    """
+    Per-user diagram search index maintained by the application
+
+    Postgres: diagram_search(diagram_id, user_id, document tsvector) with a
+    GIN index; title, identifiers and prompt are weighted A/B/C and queries
+    go through websearch_to_tsquery, ranked with ts_rank_cd; titles are
+    highlighted with ts_headline and prompt snippets in Python, since
+    prompts are stored compressed (see blobs.py).
+    SQLite: an FTS5 table keyed by diagram id, ranked with bm25 and
+    highlighted with highlight()/snippet().
+    Other databases (or SQLite builds without FTS5) fall back to LIKE
+    matching on title and preview without ranking.
+
+    Rows are written in the caller's session, so an index update commits or
+    rolls back together with the diagram change that caused it.
+    """
+
+    def __init__(self, bind=engine):
+        self.bind = bind
+        self.dialect = bind.dialect.name
+        self.enabled = self.dialect in (POSTGRES, SQLITE)
+
+    # Schema
+
+    def init(self) -> None:
+        """Create the index if needed and backfill it from existing diagrams"""
+        if not self.enabled:
+            return
+        try:
+            with self.bind.begin() as conn:
+                for statement in self._ddl():
+                    conn.execute(text(statement))
+        except OperationalError as e:
+            logger.warning("Full-text index unavailable, falling back to LIKE search: %s", e)
+            self.enabled = False
+            return
+        self._backfill()
+
+    def _ddl(self) -> List[str]:
+        if self.dialect == POSTGRES:
+            return [
+                "CREATE TABLE IF NOT EXISTS diagram_search ("
+                " diagram_id INTEGER PRIMARY KEY REFERENCES diagrams(id) ON DELETE CASCADE,"
+                " user_id INTEGER NOT NULL,"
+                " document tsvector NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS ix_diagram_search_document ON diagram_search USING GIN (document)",
+                "CREATE INDEX IF NOT EXISTS ix_diagram_search_user_id ON diagram_search (user_id)",
+            ]
+        return [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS diagram_search USING fts5("
+            " title, prompt, identifiers, user_id UNINDEXED, tokenize = 'porter unicode61')",
+        ]
+
+    def _backfill(self) -> None:
+        from .database import SessionLocal
+        from .models import Diagram
+
+        db = SessionLocal()
+        try:
+            if db.execute(text("SELECT 1 FROM diagram_search LIMIT 1")).first() is not None:
+                return
+            indexed = 0
+            for diagram in db.scalars(select(Diagram).execution_options(yield_per=BACKFILL_BATCH)):
+                self.index_diagram(db, diagram)
+                indexed += 1
+            db.commit()
+            if indexed:
+                logger.info("Backfilled search index with %d diagrams", indexed)
+        finally:
+            db.close()
+
+    # Writes
+
+    def _upsert_statements(self, diagram) -> List[Tuple[str, Dict]]:
+        params = {
+            "id": diagram.id,
+            "user_id": diagram.user_id,
+            "title": diagram.title,
+            "prompt": diagram.prompt,
+            "identifiers": extract_identifiers(diagram.mermaid_code),
+        }
+        if self.dialect == POSTGRES:
+            return [(
+                "INSERT INTO diagram_search (diagram_id, user_id, document) VALUES (:id, :user_id,"
+                " setweight(to_tsvector('english', :title), 'A')"
+                " || setweight(to_tsvector('english', :identifiers), 'B')"
+                " || setweight(to_tsvector('english', :prompt), 'C'))"
+                " ON CONFLICT (diagram_id) DO UPDATE"
+                " SET user_id = excluded.user_id, document = excluded.document",
+                params
+            )]
+        return [
+            ("DELETE FROM diagram_search WHERE rowid = :id", {"id": diagram.id}),
+            (
+                "INSERT INTO diagram_search (rowid, title, prompt, identifiers, user_id)"
+                " VALUES (:id, :title, :prompt, :identifiers, :user_id)",
+                params
+            ),
+        ]
+
+    def _delete_statements(self, diagram_id: Optional[int] = None, user_id: Optional[int] = None) -> List[Tuple[str, Dict]]:
+        key = "diagram_id" if self.dialect == POSTGRES else "rowid"
+        if diagram_id is not None:
+            return [(f"DELETE FROM diagram_search WHERE {key} = :id", {"id": diagram_id})]
+        return [("DELETE FROM diagram_search WHERE user_id = :user_id", {"user_id": user_id})]
+
+    def index_diagram(self, db, diagram) -> None:
+        """Add or refresh a diagram (diagram.id must be assigned, i.e. flushed)"""
+        if self.enabled:
+            for statement, params in self._upsert_statements(diagram):
+                db.execute(text(statement), params)
+
+    def index_many(self, db, diagrams: List) -> None:
+        """index_diagram for a batch, one executemany per statement"""
+        if not self.enabled or not diagrams:
+            return
+        batches = [self._upsert_statements(diagram) for diagram in diagrams]
+        for position, (statement, _) in enumerate(batches[0]):
+            db.execute(text(statement), [statements[position][1] for statements in batches])
+
+    async def aindex_diagram(self, db, diagram) -> None:
+        if self.enabled:
+            for statement, params in self._upsert_statements(diagram):
+                await db.execute(text(statement), params)
+
+    def remove_diagram(self, db, diagram_id: int) -> None:
+        if self.enabled:
+            for statement, params in self._delete_statements(diagram_id=diagram_id):
+                db.execute(text(statement), params)
+
+    async def aremove_diagram(self, db, diagram_id: int) -> None:
+        if self.enabled:
+            for statement, params in self._delete_statements(diagram_id=diagram_id):
+                await db.execute(text(statement), params)
+
+    def remove_user(self, db, user_id: int) -> None:
+        """Drop every indexed diagram of a user (Postgres also cascades via the FK)"""
+        if self.enabled:
+            for statement, params in self._delete_statements(user_id=user_id):
+                db.execute(text(statement), params)
+
+    # Queries
+
+    async def asearch(self, db, user_id: int, query: str, limit: int, offset: int) -> List[Dict]:
+        """
+        Ranked matches among the user's diagrams
+
+        Returns:
+            Dicts with id, title, diagram_type, created_at, rank,
+            title_highlight and snippet (matches wrapped in HIGHLIGHT_START/END)
+        """
+        if not self.enabled:
+            return await self._alike_search(db, user_id, query, limit, offset)
+        if self.dialect == POSTGRES:
+            sql = (
+                "SELECT d.id, d.title, d.diagram_type, d.created_at,"
+                " ts_rank_cd(s.document, q) AS rank,"
+                " ts_headline('english', d.title, q, :title_options) AS title_highlight"
+                " FROM diagram_search s"
+                " JOIN diagrams d ON d.id = s.diagram_id,"
+                " websearch_to_tsquery('english', :query) q"
+                " WHERE s.user_id = :user_id AND s.document @@ q"
+                " ORDER BY rank DESC, d.id DESC LIMIT :limit OFFSET :offset"
+            )
+            params = {
+                "query": query,
+                "title_options": f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, HighlightAll=true",
+            }
+        else:
+            match = self._fts5_query(query)
+            if not match:
+                return []
+            sql = (
+                "SELECT d.id, d.title, d.diagram_type, d.created_at,"
+                " -bm25(diagram_search, 10.0, 1.0, 5.0) AS rank,"
+                " highlight(diagram_search, 0, :start, :end) AS title_highlight,"
+                " snippet(diagram_search, -1, :start, :end, '…', 16) AS snippet"
+                " FROM diagram_search"
+                " JOIN diagrams d ON d.id = diagram_search.rowid"
+                " WHERE diagram_search MATCH :query AND diagram_search.user_id = :user_id"
+                " ORDER BY rank DESC, d.id DESC LIMIT :limit OFFSET :offset"
+            )
+            params = {"query": match, "start": HIGHLIGHT_START, "end": HIGHLIGHT_END}
+
+        from .models import Diagram
+
+        # Type the raw columns so enums and timestamps decode as they do through the ORM
+        statement = text(sql).columns(diagram_type=Diagram.__table__.c.diagram_type.type, created_at=DateTime)
+        rows = await db.execute(statement, {**params, "user_id": user_id, "limit": limit, "offset": offset})
+        hits = [dict(row._mapping) for row in rows]
+        if self.dialect == POSTGRES and hits:
+            prompts = {
+                diagram.id: diagram.prompt
+                for diagram in await db.scalars(select(Diagram).where(Diagram.id.in_([hit["id"] for hit in hits])))
+            }
+            for hit in hits:
+                hit["snippet"] = highlight_snippet(prompts.get(hit["id"], ""), query)
+        return hits
+
+    @staticmethod
+    def _fts5_query(query: str) -> str:
+        """Quote every term (FTS5 syntax is not user-safe); the last one matches as a prefix"""
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return ""
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    async def _alike_search(self, db, user_id: int, query: str, limit: int, offset: int) -> List[Dict]:
+        from .models import Diagram
+
+        pattern = f"%{query.strip()}%"
+        rows = await db.execute(
+            select(Diagram.id, Diagram.title, Diagram.diagram_type, Diagram.created_at, Diagram.preview)
+            .where(Diagram.user_id == user_id, (Diagram.title.ilike(pattern)) | (Diagram.preview.ilike(pattern)))
+            .order_by(Diagram.created_at.desc(), Diagram.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        return [
+            {
+                "id": row.id,
+                "title": row.title,
+                "diagram_type": row.diagram_type,
+                "created_at": row.created_at,
+                "rank": 0.0,
+                "title_highlight": row.title,
+                "snippet": row.preview,
+            }
+            for row in rows
+        ]
+
+
+search_index = SearchIndex()
@@ -0,0 +1,368 @@
+"""
+Near-duplicate prompt index - serves a previous diagram for a paraphrased prompt
+
+Prompts are reduced to content words (stop words, diagram boilerplate and
+plural endings removed; words after "without" / "no" / "not" / "except"
+kept apart from the same words used positively) and compared by sparse
+TF-IDF cosine similarity. Diagram type words are dropped from the words
+but still restrict a lookup without an explicit type to entries of the
+type the prompt names.
+An inverted index over the words finds candidates, so a lookup touches
+only prompts sharing a reasonably rare word with the query. CPU-only and
+in-process; no embedding service.
+
+Two kinds of entries are indexed:
+  - successful upstream generations (shared by all users, like the exact
+    generation cache), holding their result
+  - saved diagrams (Diagram prompt history), visible to their owner only
+    and loaded from the database on a hit
+"""
+
+import asyncio
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SIMILAR_PROMPT_ENABLED = os.getenv("SIMILAR_PROMPT_ENABLED", "true").lower() in ("1", "true", "yes")
+SIMILAR_PROMPT_INDEX_SIZE = int(os.getenv("SIMILAR_PROMPT_INDEX_SIZE", "50000"))
+SIMILAR_PROMPT_SEED_LIMIT = int(os.getenv("SIMILAR_PROMPT_SEED_LIMIT", "20000"))
+SIMILAR_PROMPT_MIN_WORDS = int(os.getenv("SIMILAR_PROMPT_MIN_WORDS", "2"))
+SIMILAR_PROMPT_MAX_POSTINGS = int(os.getenv("SIMILAR_PROMPT_MAX_POSTINGS", "2000"))
+SIMILAR_PROMPT_THRESHOLD = float(os.getenv("SIMILAR_PROMPT_THRESHOLD", "0.85"))
+# Per diagram type, e.g. "class:0.8,sequence:0.9"; sequences are stricter since message order matters
+SIMILAR_PROMPT_THRESHOLDS = os.getenv("SIMILAR_PROMPT_THRESHOLDS", "class:0.8,usecase:0.8,activity:0.85,sequence:0.9")
+
+_WORD = re.compile(r"[a-z0-9]+")
+# A negation covers the rest of its clause: "without doctors and patients"
+_CLAUSE = re.compile(r"[.,;:!?()]|\b(?:but|with)\b")
+_NEGATIONS = frozenset(("no", "not", "without", "except"))
+# Diagram type words (also stop words), as (diagram_type, pattern)
+_TYPE_WORDS = (
+    ("usecase", re.compile(r"\buse[\s-]*cases?\b")),
+    ("sequence", re.compile(r"\bsequence\b")),
+    ("activity", re.compile(r"\b(?:activity|flowchart|flow\s*chart|flow)\b")),
+    ("class", re.compile(r"\bclass\b")),
+)
+_DIAGRAM_NOUN = re.compile(r"\s+(?:uml\s+)?(?:diagram|chart)\b")
+_STOP_WORDS = frozenset("""
+    a an the and or of for to in on at by with from into about as is are be been that this these those
+    it its i me my we our you your please can could would should will want need some all each every
+    create generate draw make show build design model give produce write represent depicting showing
+    uml diagram diagrams chart class sequence use case usecase activity flowchart flow
+    simple basic detailed complete full small
+""".split())
+
+
+def parse_thresholds(spec: str) -> Dict[str, float]:
+    """'class:0.8,sequence:0.9' -> {"class": 0.8, "sequence": 0.9}"""
+    thresholds = {}
+    for item in spec.split(","):
+        if ":" in item:
+            name, value = item.split(":", 1)
+            thresholds[name.strip()] = float(value)
+    return thresholds
+
+
+def prompt_words(prompt: str) -> FrozenSet[str]:
+    """
+    Content words of a prompt, singularised
+
+    Words following a negation in the same clause are prefixed with "!",
+    so "without patients" does not count as a mention of patients.
+    """
+    words = set()
+    for clause in _CLAUSE.split(prompt.casefold()):
+        negated = False
+        for word in _WORD.findall(clause):
+            if word in _NEGATIONS:
+                negated = True
+                words.add(word)
+                continue
+            if word in _STOP_WORDS:
+                continue
+            if len(word) > 4 and word.endswith("ies"):
+                word = word[:-3] + "y"
+            elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            words.add("!" + word if negated else word)
+    return frozenset(words)
+
+
+def prompt_types(prompt: str) -> FrozenSet[str]:
+    """
+    Diagram types a prompt asks for, from the type words prompt_words() drops
+
+    A type word followed by "diagram" / "chart" wins ("sequence diagram of
+    class registration" -> sequence); otherwise every type mentioned
+    counts. Empty when the prompt names no type.
+    """
+    text = prompt.casefold()
+    mentioned = set()
+    for diagram_type, pattern in _TYPE_WORDS:
+        for found in pattern.finditer(text):
+            if _DIAGRAM_NOUN.match(text, found.end()):
+                return frozenset((diagram_type,))
+            mentioned.add(diagram_type)
+    return frozenset(mentioned)
+
+
+class _Entry:
+    __slots__ = ("key", "words", "diagram_type", "result", "diagram_id", "user_id")
+
+    def __init__(self, key, words, diagram_type, result=None, diagram_id=None, user_id=None):
+        self.key = key
+        self.words = words
+        self.diagram_type = diagram_type
+        self.result = result
+        self.diagram_id = diagram_id
+        self.user_id = user_id
+
+
+class SimilarPromptIndex:
+    """
+    Thread-safe TF-IDF index of prompts with bounded size (oldest entries evicted first)
+
+    A match must reach the threshold of the matched entry's diagram type;
+    a request for a specific type only considers entries of that type, and
+    one without a type only entries of the type(s) its prompt names.
+    """
+
+    def __init__(
+        self,
+        max_size: int = SIMILAR_PROMPT_INDEX_SIZE,
+        thresholds: Optional[Dict[str, float]] = None,
+        default_threshold: float = SIMILAR_PROMPT_THRESHOLD,
+        enabled: bool = SIMILAR_PROMPT_ENABLED
+    ):
+        self.max_size = max_size
+        self.thresholds = parse_thresholds(SIMILAR_PROMPT_THRESHOLDS) if thresholds is None else thresholds
+        self.default_threshold = default_threshold
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._postings: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def threshold(self, diagram_type: Optional[str]) -> float:
+        return self.thresholds.get(diagram_type, self.default_threshold)
+
+    def add_result(self, key: str, prompt: str, result: Dict[str, str]) -> None:
+        """Index a successful generation under its cache key"""
+        self._add(_Entry(
+            key, prompt_words(prompt), result["diagram_type"],
+            result={"mermaid_code": result["mermaid_code"], "diagram_type": result["diagram_type"]}
+        ))
+
+    def add_diagram(self, diagram_id: int, user_id: int, prompt: str, diagram_type: str) -> None:
+        """Index a saved diagram for its owner"""
+        self._add(_Entry(
+            f"diagram:{diagram_id}", prompt_words(prompt), getattr(diagram_type, "value", diagram_type),
+            diagram_id=diagram_id, user_id=user_id
+        ))
+
+    def remove_diagram(self, diagram_id: int) -> None:
+        self.remove(f"diagram:{diagram_id}")
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def match(
+        self,
+        prompt: str,
+        diagram_type: Optional[str] = None,
+        user_id: Optional[int] = None
+    ) -> Optional[Tuple[_Entry, float]]:
+        """
+        Best entry for a prompt, if it reaches its type's threshold
+
+        Args:
+            prompt: Raw user prompt
+            diagram_type: Requested type; None considers the types the
+                prompt names (see prompt_types), or every type if it names none
+            user_id: Requesting user, whose saved diagrams are also considered
+
+        Returns:
+            (entry, cosine similarity) or None
+        """
+        words = prompt_words(prompt)
+        if not self.enabled or len(words) < SIMILAR_PROMPT_MIN_WORDS:
+            return None
+        types = frozenset((diagram_type,)) if diagram_type is not None else prompt_types(prompt)
+
+        with self._lock:
+            total = len(self._entries)
+            if not total:
+                return None
+            idf = {word: self._idf(word, total) for word in words}
+            query_norm = math.sqrt(sum(weight * weight for weight in idf.values()))
+
+            # Candidates come from the query's rarer words; very common words
+            # still count towards the score of candidates found another way
+            postings = sorted((self._postings.get(word, ()) for word in words), key=len)
+            candidates = set()
+            for posting in postings:
+                if candidates and len(posting) > SIMILAR_PROMPT_MAX_POSTINGS:
+                    break
+                candidates.update(posting)
+
+            best, best_score = None, 0.0
+            for key in candidates:
+                entry = self._entries[key]
+                if types and entry.diagram_type not in types:
+                    continue
+                if entry.user_id is not None and entry.user_id != user_id:
+                    continue
+                shared = sum(idf[word] ** 2 for word in words & entry.words)
+                norm = math.sqrt(sum(self._idf(word, total) ** 2 for word in entry.words))
+                score = shared / (query_norm * norm)
+                if score >= self.threshold(entry.diagram_type) and score > best_score:
+                    best, best_score = entry, score
+        return (best, round(best_score, 4)) if best is not None else None
+
+    def lookup(
+        self,
+        prompt: str,
+        diagram_type: Optional[str] = None,
+        user_id: Optional[int] = None,
+        session_factory: Optional[Callable] = None
+    ) -> Optional[Tuple[Dict[str, str], float]]:
+        """
+        match() and load the matched result
+
+        Saved diagrams are read through session_factory (defaults to
+        SessionLocal); one that no longer exists is dropped from the index.
+
+        Returns:
+            (result, score) or None
+        """
+        found = self.match(prompt, diagram_type, user_id)
+        if found is None:
+            return self._record(None, 0.0)
+        entry, score = found
+        return self._record(entry.result or self._load_diagram(entry, session_factory), score)
+
+    async def alookup(
+        self,
+        prompt: str,
+        diagram_type: Optional[str] = None,
+        user_id: Optional[int] = None
+    ) -> Optional[Tuple[Dict[str, str], float]]:
+        """Async lookup; saved diagrams are loaded off the event loop"""
+        found = self.match(prompt, diagram_type, user_id)
+        if found is None:
+            return self._record(None, 0.0)
+        entry, score = found
+        result = entry.result or await asyncio.to_thread(self._load_diagram, entry, None)
+        return self._record(result, score)
+
+    def seed_history(self, limit: int = SIMILAR_PROMPT_SEED_LIMIT, bind=None) -> int:
+        """
+        Index the most recent saved diagrams (called on app startup)
+
+        Returns:
+            Number of diagrams indexed
+        """
+        if not self.enabled or limit <= 0:
+            return 0
+        from .blobs import decode
+        from .database import engine
+        from .models import Blob, Diagram
+
+        with (bind or engine).connect() as conn:
+            rows = conn.execute(
+                select(
+                    Diagram.id, Diagram.user_id, Diagram.diagram_type,
+                    Diagram.prompt_inline, Blob.codec, Blob.data
+                )
+                .outerjoin(Blob, Blob.hash == Diagram.prompt_hash)
+                .order_by(Diagram.id.desc())
+                .limit(limit)
+            ).all()
+        for row in reversed(rows):
+            prompt = decode(row.codec, row.data) if row.data is not None else row.prompt_inline
+            self.add_diagram(row.id, row.user_id, prompt or "", row.diagram_type)
+        logger.info("Indexed %d saved diagram prompts for similar-prompt matching", len(rows))
+        return len(rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "words": len(self._postings),
+                "thresholds": {**self.thresholds, "default": self.default_threshold},
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _add(self, entry: _Entry) -> None:
+        if not self.enabled or len(entry.words) < SIMILAR_PROMPT_MIN_WORDS:
+            return
+        with self._lock:
+            self._remove(entry.key)
+            self._entries[entry.key] = entry
+            for word in entry.words:
+                self._postings.setdefault(word, set()).add(entry.key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for word in entry.words:
+            posting = self._postings.get(word)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[word]
+
+    def _idf(self, word: str, total: int) -> float:
+        return math.log((total + 1) / (len(self._postings.get(word, ())) + 1)) + 1
+
+    def _record(self, result: Optional[Dict[str, str]], score: float) -> Optional[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return dict(result), score
+
+    def _load_diagram(self, entry: _Entry, session_factory) -> Optional[Dict[str, str]]:
+        from .database import SessionLocal
+        from .models import Diagram
+
+        db = (session_factory or SessionLocal)()
+        try:
+            diagram = db.get(Diagram, entry.diagram_id)
+            if diagram is None:
+                self.remove(entry.key)
+                return None
+            return {"mermaid_code": diagram.mermaid_code, "diagram_type": entry.diagram_type}
+        except Exception as e:
+            logger.warning("Similar prompt lookup failed to load diagram %s: %s", entry.diagram_id, e)
+            return None
+        finally:
+            db.close()
@@ -0,0 +1,230 @@
+"""
+Admin dashboard statistics - aggregated queries and daily rollups refreshed in the background
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import load_only
+
+from . import models
+from .database import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+ADMIN_STATS_STALENESS = int(os.getenv("ADMIN_STATS_STALENESS", "60"))
+ADMIN_STATS_MAX_DAYS = int(os.getenv("ADMIN_STATS_MAX_DAYS", "90"))
+ADMIN_STATS_LOOKBACK_DAYS = int(os.getenv("ADMIN_STATS_LOOKBACK_DAYS", "2"))
+ADMIN_STATS_RECENT = 5
+
+DIAGRAMS = "diagrams"
+SIGNUPS = "signups"
+
+
+def _as_date(value) -> date:
+    """func.date() returns a date on Postgres and an ISO string on SQLite"""
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _label(value) -> str:
+    return getattr(value, "value", value)
+
+
+class AdminStats:
+    """
+    Cached dashboard snapshot plus incrementally maintained daily rollups
+
+    Each refresh runs a handful of GROUP BY queries (totals by type and
+    plan, recent activity joined to users) and recomputes daily_rollups
+    only for days since the previous refresh (minus a small lookback for
+    late rows); older days are served from the rollup table. Snapshots are
+    at most `staleness` seconds old: a background loop refreshes them, and
+    a request finding a stale snapshot refreshes it inline.
+
+    Daily series count rows created per day (signups by current plan), so
+    deleting a user does not rewrite past days.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        staleness: int = ADMIN_STATS_STALENESS,
+        max_days: int = ADMIN_STATS_MAX_DAYS,
+        lookback_days: int = ADMIN_STATS_LOOKBACK_DAYS
+    ):
+        self.session_factory = session_factory
+        self.staleness = staleness
+        self.max_days = max_days
+        self.lookback_days = lookback_days
+        self._snapshot: Optional[Dict] = None
+        self._refreshed_at = 0.0
+        self._rolled_up_to: Optional[date] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Build the first snapshot and start the refresh loop"""
+        await asyncio.to_thread(self.refresh)
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def get(self, days: int = 30) -> Dict:
+        """
+        Dashboard payload with a `days`-long daily series, refreshing if stale
+
+        A failed refresh serves the stale snapshot; it only raises when
+        there has never been one.
+        """
+        if self._snapshot is None or time.monotonic() - self._refreshed_at > self.staleness:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                if self._snapshot is None:
+                    raise
+                logger.warning("Admin stats refresh failed, serving stale snapshot: %s", e)
+        snapshot = self._snapshot
+        days = max(1, min(days, self.max_days))
+        return {**snapshot, "timeseries": snapshot["timeseries"][-days:]}
+
+    def refresh(self) -> None:
+        """Recompute totals, recent activity and the rollups for recent days"""
+        with self._lock:
+            db = self.session_factory()
+            try:
+                self._refresh_rollups(db)
+                snapshot = self._build_snapshot(db)
+            finally:
+                db.close()
+            self._snapshot = snapshot
+            self._refreshed_at = time.monotonic()
+
+    def _refresh_rollups(self, db) -> None:
+        today = datetime.utcnow().date()
+        if self._rolled_up_to is None:
+            last = db.scalar(select(func.max(models.DailyRollup.day)))
+            self._rolled_up_to = _as_date(last) if last is not None else None
+
+        # First run backfills everything; afterwards only recent days are recomputed
+        since = None
+        if self._rolled_up_to is not None:
+            since = min(self._rolled_up_to, today) - timedelta(days=self.lookback_days)
+
+        counts = self._count_by_day(db, models.Diagram, models.Diagram.diagram_type, DIAGRAMS, since)
+        counts += self._count_by_day(db, models.User, models.User.subscription_plan, SIGNUPS, since)
+
+        try:
+            if since is not None:
+                db.execute(delete(models.DailyRollup).where(models.DailyRollup.day >= since))
+            db.add_all(counts)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        self._rolled_up_to = today
+
+    def _count_by_day(self, db, model, dimension, metric: str, since: Optional[date]) -> List[models.DailyRollup]:
+        day = func.date(model.created_at)
+        query = select(day, dimension, func.count()).group_by(day, dimension)
+        if since is not None:
+            query = query.where(model.created_at >= datetime.combine(since, datetime.min.time()))
+        return [
+            models.DailyRollup(day=_as_date(row_day), metric=metric, dimension=_label(value), count=count)
+            for row_day, value, count in db.execute(query)
+        ]
+
+    def _build_snapshot(self, db) -> Dict:
+        diagrams_by_type = {
+            _label(type_): count
+            for type_, count in db.execute(
+                select(models.Diagram.diagram_type, func.count()).group_by(models.Diagram.diagram_type)
+            )
+        }
+        users_by_plan = {
+            _label(plan): count
+            for plan, count in db.execute(
+                select(models.User.subscription_plan, func.count()).group_by(models.User.subscription_plan)
+            )
+        }
+
+        recent = db.execute(
+            select(models.Diagram, models.User.email)
+            .outerjoin(models.User, models.User.id == models.Diagram.user_id)
+            .options(load_only(
+                models.Diagram.id, models.Diagram.title, models.Diagram.diagram_type, models.Diagram.created_at
+            ))
+            .order_by(models.Diagram.created_at.desc())
+            .limit(ADMIN_STATS_RECENT)
+        ).all()
+
+        return {
+            "total_users": sum(users_by_plan.values()),
+            "total_diagrams": sum(diagrams_by_type.values()),
+            "pro_users": users_by_plan.get(models.SubscriptionPlan.PRO.value, 0),
+            "diagrams_by_type": diagrams_by_type,
+            "users_by_plan": users_by_plan,
+            "recent_activity": [
+                {
+                    "id": diagram.id,
+                    "title": diagram.title,
+                    "type": diagram.diagram_type,
+                    "created_at": diagram.created_at,
+                    "user_email": email or "Unknown"
+                }
+                for diagram, email in recent
+            ],
+            "timeseries": self._timeseries(db),
+            "generated_at": datetime.utcnow(),
+            "staleness_seconds": self.staleness,
+        }
+
+    def _timeseries(self, db) -> List[Dict]:
+        """One entry per day for the last max_days days, zero-filled"""
+        today = datetime.utcnow().date()
+        first = today - timedelta(days=self.max_days - 1)
+        series = {
+            first + timedelta(days=offset): {DIAGRAMS: {}, SIGNUPS: {}}
+            for offset in range(self.max_days)
+        }
+        rows = db.scalars(select(models.DailyRollup).where(models.DailyRollup.day >= first))
+        for row in rows:
+            bucket = series.get(_as_date(row.day))
+            if bucket is not None:
+                bucket[row.metric][row.dimension] = row.count
+        return [
+            {
+                "date": day.isoformat(),
+                "diagrams": sum(bucket[DIAGRAMS].values()),
+                "diagrams_by_type": bucket[DIAGRAMS],
+                "signups": sum(bucket[SIGNUPS].values()),
+                "signups_by_plan": bucket[SIGNUPS],
+            }
+            for day, bucket in sorted(series.items())
+        ]
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.staleness)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.warning("Admin stats refresh failed: %s", e)
+
+
+admin_stats = AdminStats(session_factory=SessionLocal)
@@ -0,0 +1,417 @@
+"""
+Bulk diagram transfer - streaming NDJSON / ZIP export and batched import
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import zipfile
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+
+from . import blobs
+from .database import AsyncSessionLocal, get_async_engine
+from .models import Diagram, DiagramType, PREVIEW_LENGTH
+from .schemas import DiagramImportError, DiagramImportResponse, DiagramResponse, DiagramSave
+from .search import search_index
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "200"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_RECORDS = int(os.getenv("IMPORT_MAX_RECORDS", "50000"))
+IMPORT_MAX_RECORD_BYTES = int(os.getenv("IMPORT_MAX_RECORD_BYTES", "1000000"))
+IMPORT_SPOOL_BYTES = int(os.getenv("IMPORT_SPOOL_BYTES", str(8 * 1024 * 1024)))
+# Largest ZIP upload (after gzip decoding) spooled for import
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+IMPORT_MAX_ERRORS = 100
+# Most bytes one decompress() call may produce, so a gzip bomb is inflated piece by piece
+IMPORT_DECOMPRESS_CHUNK = 64 * 1024
+
+
+class ImportTooLarge(Exception):
+    """Raised when a ZIP upload exceeds IMPORT_MAX_BYTES"""
+
+# First line of each exported .mmd file; a Mermaid comment, so the file
+# still renders as-is (not "%%{", which Mermaid parses as a directive)
+MMD_HEADER_PREFIX = "%% aiuml: "
+
+
+def _slug(title: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "-", title).strip("-").lower()[:60] or "diagram"
+
+
+def mmd_filename(diagram: Diagram) -> str:
+    return f"{diagram.id}-{_slug(diagram.title)}.mmd"
+
+
+def mmd_document(diagram: Diagram) -> str:
+    """Mermaid source preceded by a one-line comment carrying the metadata"""
+    meta = {
+        "title": diagram.title,
+        "prompt": diagram.prompt,
+        "diagram_type": diagram.diagram_type.value,
+        "created_at": diagram.created_at.isoformat(),
+    }
+    return f"{MMD_HEADER_PREFIX}{json.dumps(meta)}\n{diagram.mermaid_code}\n"
+
+
+async def _iter_batches(user_id: int, since: Optional[datetime], until: datetime) -> AsyncIterator[List[Diagram]]:
+    """
+    The user's diagrams created in [since, until), oldest first, in batches
+
+    Opens its own session: a streaming body outlives the request's
+    dependencies. Rows come through a server-side cursor (yield_per) and
+    each batch is expunged once handed out, so memory stays flat however
+    many diagrams the user has.
+    """
+    query = (
+        select(Diagram)
+        .where(Diagram.user_id == user_id, Diagram.created_at < until)
+        .order_by(Diagram.created_at, Diagram.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    if since is not None:
+        query = query.where(Diagram.created_at >= since)
+
+    async with AsyncSessionLocal(bind=get_async_engine()) as db:
+        result = await db.stream_scalars(query)
+        async for batch in result.partitions():
+            yield batch
+            for diagram in batch:
+                for obj in (diagram, diagram.prompt_blob, diagram.code_blob):
+                    if obj is not None and obj in db:
+                        db.expunge(obj)
+
+
+async def export_ndjson(
+    user_id: int,
+    since: Optional[datetime],
+    until: datetime,
+    gzip: bool = False
+) -> AsyncIterator[bytes]:
+    """One DiagramResponse JSON object per line, optionally gzip-compressed as it is produced"""
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if gzip else None
+    async for batch in _iter_batches(user_id, since, until):
+        chunk = "".join(DiagramResponse.model_validate(d).model_dump_json() + "\n" for d in batch).encode()
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+
+
+class _ZipSink:
+    """Write-only, non-seekable file object; zipfile then streams entries with data descriptors"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def export_zip(user_id: int, since: Optional[datetime], until: datetime) -> AsyncIterator[bytes]:
+    """
+    ZIP archive with one deflated .mmd file per diagram
+
+    Entries are emitted as soon as they are written; only the central
+    directory (one small record per file) is held until the end.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        async for batch in _iter_batches(user_id, since, until):
+            for diagram in batch:
+                entry = zipfile.ZipInfo(mmd_filename(diagram), date_time=diagram.created_at.timetuple()[:6])
+                entry.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(entry, mmd_document(diagram))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# Import
+#
+# Both readers yield (record number, source, raw dict or None, error or None)
+
+Record = Tuple[int, Optional[str], Optional[Dict], Optional[str]]
+
+
+async def _decompressed(chunks: AsyncIterator[bytes], gzip: bool) -> AsyncIterator[bytes]:
+    """The body, gzip-decoded in pieces of at most IMPORT_DECOMPRESS_CHUNK bytes"""
+    if not gzip:
+        async for chunk in chunks:
+            yield chunk
+        return
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk, IMPORT_DECOMPRESS_CHUNK)
+            if data:
+                yield data
+            chunk = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+
+async def _ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    """Parse lines as they arrive; a line longer than IMPORT_MAX_RECORD_BYTES is rejected and skipped"""
+    buffer = b""
+    number = 0
+    skipping = False
+
+    def parse(line: bytes) -> Record:
+        if len(line) > IMPORT_MAX_RECORD_BYTES:
+            return number, None, None, f"Record exceeds {IMPORT_MAX_RECORD_BYTES} bytes"
+        try:
+            raw = json.loads(line)
+        except ValueError as e:
+            return number, None, None, f"Invalid JSON: {e}"
+        if not isinstance(raw, dict):
+            return number, None, None, "Expected a JSON object"
+        return number, None, raw, None
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if skipping:
+                skipping = False
+                continue
+            if line.strip():
+                number += 1
+                yield parse(line)
+        if len(buffer) > IMPORT_MAX_RECORD_BYTES and not skipping:
+            number += 1
+            yield number, None, None, f"Record exceeds {IMPORT_MAX_RECORD_BYTES} bytes"
+            skipping = True
+        if skipping:
+            buffer = b""
+    if buffer.strip() and not skipping:
+        number += 1
+        yield parse(buffer)
+
+
+def _mmd_record(name: str, content: str) -> Dict:
+    """Raw record for an .mmd file, using the export header when present"""
+    meta: Dict = {}
+    first, _, rest = content.partition("\n")
+    if first.startswith(MMD_HEADER_PREFIX):
+        try:
+            meta = json.loads(first[len(MMD_HEADER_PREFIX):])
+        except ValueError:
+            meta = {}
+        content = rest
+    title = os.path.splitext(os.path.basename(name))[0]
+    return {
+        "title": meta.get("title") or title,
+        "prompt": meta.get("prompt") or f"Imported from {name}",
+        "mermaid_code": content.strip(),
+        "diagram_type": meta.get("diagram_type"),
+    }
+
+
+async def _zip_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    """
+    Read .mmd entries from an uploaded ZIP
+
+    The central directory sits at the end of the archive, so the upload is
+    spooled first: in memory up to IMPORT_SPOOL_BYTES, on disk beyond.
+
+    Raises:
+        ImportTooLarge: If the upload exceeds IMPORT_MAX_BYTES
+    """
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as spool:
+        size = 0
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > IMPORT_MAX_BYTES:
+                raise ImportTooLarge(f"ZIP uploads are limited to {IMPORT_MAX_BYTES} bytes")
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            archive = zipfile.ZipFile(spool)
+        except zipfile.BadZipFile:
+            yield 1, None, None, "Not a valid ZIP archive"
+            return
+
+        number = 0
+        with archive:
+            for entry in archive.infolist():
+                if entry.is_dir() or not entry.filename.lower().endswith(".mmd"):
+                    continue
+                number += 1
+                if entry.file_size > IMPORT_MAX_RECORD_BYTES:
+                    yield number, entry.filename, None, f"Record exceeds {IMPORT_MAX_RECORD_BYTES} bytes"
+                    continue
+                try:
+                    content = archive.read(entry).decode("utf-8")
+                except (zipfile.BadZipFile, UnicodeDecodeError, zlib.error) as e:
+                    yield number, entry.filename, None, f"Unreadable entry: {e}"
+                    continue
+                yield number, entry.filename, _mmd_record(entry.filename, content), None
+
+
+def _validate(raw: Dict, detect_type: Callable[[str], str]) -> DiagramSave:
+    """
+    Raises:
+        ValueError: With a message suitable for the per-record error list
+    """
+    raw = dict(raw)
+    if not raw.get("diagram_type") and isinstance(raw.get("mermaid_code"), str):
+        raw["diagram_type"] = detect_type(raw["mermaid_code"])
+    try:
+        record = DiagramSave.model_validate(raw)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        ))
+    if not record.mermaid_code.strip():
+        raise ValueError("mermaid_code: must not be empty")
+    try:
+        DiagramType(record.diagram_type)
+    except ValueError:
+        raise ValueError(f"diagram_type: unknown type '{record.diagram_type}'")
+    return record
+
+
+def _insert_batch(session, user_id: int, records: List[DiagramSave]) -> None:
+    """
+    Insert a batch with executemany statements on the session's connection
+
+    Blobs are upserted once per distinct text, diagrams go in with one
+    multi-row INSERT ... RETURNING, and their search rows follow in one
+    executemany per statement. The caller commits.
+    """
+    connection = session.connection()
+    prompt_hashes = blobs.acquire_many(connection, [record.prompt for record in records])
+    code_hashes = blobs.acquire_many(connection, [record.mermaid_code for record in records])
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": user_id,
+            "title": (record.title or f"Diagram - {record.prompt[:50]}")[:255],
+            "prompt": "",
+            "mermaid_code": "",
+            "prompt_hash": prompt_hash,
+            "code_hash": code_hash,
+            "preview": record.prompt[:PREVIEW_LENGTH],
+            "diagram_type": DiagramType(record.diagram_type),
+            "created_at": now,
+        }
+        for record, prompt_hash, code_hash in zip(records, prompt_hashes, code_hashes)
+    ]
+    table = Diagram.__table__
+    if connection.dialect.insert_executemany_returning_sort_by_parameter_order:
+        ids = connection.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+    else:
+        ids = [connection.execute(insert(table).values(**row)).inserted_primary_key[0] for row in rows]
+
+    search_index.index_many(session, [
+        SimpleNamespace(id=id_, user_id=user_id, title=row["title"], prompt=record.prompt, mermaid_code=record.mermaid_code)
+        for id_, row, record in zip(ids, rows, records)
+    ])
+
+
+async def import_diagrams(
+    db,
+    user_id: int,
+    chunks: AsyncIterator[bytes],
+    archive_format: str,
+    gzip: bool,
+    detect_type: Callable[[str], str]
+) -> DiagramImportResponse:
+    """
+    Validate and insert an uploaded NDJSON / ZIP stream
+
+    Records are validated against DiagramSave as they are parsed (the type
+    is detected from the code when missing) and inserted in transactions
+    of IMPORT_BATCH_SIZE, so a bad record only fails itself and a failed
+    batch does not undo the ones before it.
+
+    Args:
+        db: Async database session
+        user_id: Owner of the imported diagrams
+        chunks: Raw request body
+        archive_format: "ndjson" or "zip"
+        gzip: Whether the body is gzip-encoded
+        detect_type: Maps Mermaid code to a diagram type
+
+    Raises:
+        ImportTooLarge: If a ZIP upload exceeds IMPORT_MAX_BYTES (nothing is imported)
+    """
+    body = _decompressed(chunks, gzip)
+    records = _zip_records(body) if archive_format == "zip" else _ndjson_records(body)
+    imported = 0
+    errors: List[DiagramImportError] = []
+    failed = 0
+    batch: List[Tuple[int, Optional[str], DiagramSave]] = []
+
+    def fail(number: int, source: Optional[str], message: str) -> None:
+        nonlocal failed
+        failed += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append(DiagramImportError(record=number, source=source, error=message))
+
+    async def flush() -> None:
+        nonlocal imported
+        try:
+            await db.run_sync(_insert_batch, user_id, [record for _, _, record in batch])
+            await db.commit()
+            imported += len(batch)
+        except Exception as e:
+            await db.rollback()
+            logger.warning("Import batch of %d failed: %s", len(batch), e)
+            for number, source, _ in batch:
+                fail(number, source, "Database error while saving this batch")
+        batch.clear()
+
+    number = 0
+    try:
+        async for number, source, raw, error in records:
+            if number > IMPORT_MAX_RECORDS:
+                fail(number, source, f"Import limit of {IMPORT_MAX_RECORDS} records reached; remaining records skipped")
+                break
+            if error is None:
+                try:
+                    batch.append((number, source, _validate(raw, detect_type)))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                fail(number, source, error)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await flush()
+    except zlib.error as e:
+        fail(number + 1, None, f"Invalid gzip body: {e}; remaining records skipped")
+    if batch:
+        await flush()
+
+    return DiagramImportResponse(
+        imported=imported,
+        failed=failed,
+        errors=errors,
+        errors_truncated=failed > len(errors)
+    )
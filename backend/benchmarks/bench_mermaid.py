@@ -0,0 +1,168 @@
+"""
+Benchmark: Mermaid parsing/validation vs. the previous regex/line-scan cleaning
+
+Compares the work _parse_result does per upstream response:
+
+  legacy  - the former _clean_mermaid_code + _looks_like_mermaid +
+            _detect_diagram_type (cleaning only, no validation)
+  scan    - parse_mermaid(content, ast=False), what _parse_result runs:
+            whole-line statement regexes for well-formed class, sequence
+            and activity diagrams, falling back to the parser otherwise
+  parser  - parse_mermaid(content) (cleaning, AST and validation)
+
+on synthetic model outputs of increasing size: diagram-heavy outputs
+(short preamble, fenced diagram, trailing prose) and reasoning-heavy ones
+(a long explanation before a small diagram). Outputs longer than
+AI_PARSE_OFFLOAD_CHARS are validated in a worker thread, so only shorter
+ones cost event-loop time.
+
+Usage (from backend/):
+    python -m benchmarks.bench_mermaid [--repeat 20]
+"""
+
+import argparse
+import re
+import statistics
+import time
+
+from app.mermaid import parse_mermaid
+
+LEGACY_KEYWORDS = ['classDiagram', 'sequenceDiagram', 'erDiagram', 'flowchart', 'graph', 'gantt', 'pie', 'stateDiagram', 'journey', 'usecaseDiagram']
+
+
+def legacy_clean(code: str) -> str:
+    """AIEngine._clean_mermaid_code before the parser replaced it"""
+    code = re.sub(r'```mermaid\s*', '', code)
+    code = re.sub(r'```', '', code)
+    lines = code.split('\n')
+    vm_code_lines = []
+    started = False
+    for line in lines:
+        stripped = line.strip()
+        if not started:
+            for kw in LEGACY_KEYWORDS:
+                if stripped.startswith(kw) or (kw == 'graph' and 'graph' in stripped):
+                    started = True
+                    vm_code_lines.append(line)
+                    break
+        else:
+            vm_code_lines.append(line)
+    if vm_code_lines:
+        return '\n'.join(vm_code_lines)
+    return code.strip()
+
+
+def legacy_pipeline(content: str):
+    code = legacy_clean(content)
+    first_line = code.lstrip().split("\n", 1)[0]
+    ok = any(first_line.startswith(kw) for kw in LEGACY_KEYWORDS)
+    if "classDiagram" in code:
+        detected = "class"
+    elif "sequenceDiagram" in code:
+        detected = "sequence"
+    elif "usecase" in code or "usecaseDiagram" in code:
+        detected = "usecase"
+    elif "flowchart" in code or "graph" in code:
+        detected = "activity"
+    else:
+        detected = "class"
+    return code, ok, detected
+
+
+def scan_pipeline(content: str):
+    document = parse_mermaid(content, ast=False)
+    return document.code, document.valid, document.diagram_type
+
+
+def parser_pipeline(content: str):
+    document = parse_mermaid(content)
+    return document.code, document.valid, document.diagram_type
+
+
+def class_output(classes: int) -> str:
+    body = []
+    for i in range(classes):
+        body.append(f"    class Entity{i} {{\n        +int id\n        +String name{i}\n        +save() bool\n    }}")
+        if i:
+            body.append(f"    Entity{i - 1} \"1\" --> \"*\" Entity{i} : owns")
+    return "Here is your diagram:\n\n```mermaid\nclassDiagram\n" + "\n".join(body) + "\n```\n\nThis diagram shows the entities."
+
+
+def sequence_output(messages: int) -> str:
+    body = ["    participant User", "    participant API", "    participant DB"]
+    for i in range(messages):
+        body.append(f"    User->>API: request {i}")
+        body.append("    alt cached")
+        body.append(f"        API-->>User: hit {i}")
+        body.append("    else miss")
+        body.append(f"        API->>DB: query {i}")
+        body.append(f"        DB-->>API: rows {i}")
+        body.append("    end")
+    return "sequenceDiagram\n" + "\n".join(body) + "\n\nLet me know if you need changes."
+
+
+def flowchart_output(nodes: int) -> str:
+    body = [f"    N{i}[Step {i}] -->|next| N{i + 1}{{Check {i}}}" for i in range(nodes)]
+    return "```mermaid\nflowchart TD\n" + "\n".join(body) + "\n```"
+
+
+def reasoning_output(paragraphs: int) -> str:
+    """Long explanation before a small diagram, as reasoning-style models emit despite the prompt"""
+    prose = [
+        "First I need to work out which entities the user is describing and how they relate.",
+        "The customer places orders, each order has line items, and payments settle orders.",
+        "I'll model these as classes with the obvious attributes and one-to-many associations.",
+        "",
+    ]
+    diagram = class_output(5).split("```mermaid\n", 1)[1]
+    return "\n".join(prose * paragraphs) + "\n```mermaid\n" + diagram
+
+
+def truncated_output(classes: int) -> str:
+    """Diagram cut off mid class body, as when the model hits its token limit"""
+    content = class_output(classes)
+    return content[:int(len(content) * 0.6)]
+
+
+def measure(fn, content: str, repeat: int) -> float:
+    """Median seconds per call"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(content)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = [
+        ("class", class_output, (20, 200, 2000)),
+        ("sequence", sequence_output, (20, 200, 2000)),
+        ("flowchart", flowchart_output, (20, 200, 2000)),
+        ("reasoning", reasoning_output, (20, 200, 2000)),
+        ("truncated", truncated_output, (20, 200)),
+    ]
+    print(
+        f"{'case':<16}{'lines':>8}{'chars':>9}{'legacy ms':>12}{'scan ms':>10}{'parser ms':>12}{'ratio':>8}"
+        "  accepted (legacy/scan)"
+    )
+    for name, build, sizes in cases:
+        for size in sizes:
+            content = build(size)
+            legacy = measure(legacy_pipeline, content, args.repeat)
+            scanned = measure(scan_pipeline, content, args.repeat)
+            parsed = measure(parser_pipeline, content, args.repeat)
+            accepted = f"{legacy_pipeline(content)[1]}/{scan_pipeline(content)[1]}"
+            print(
+                f"{name + ' x' + str(size):<16}{content.count(chr(10)) + 1:>8}{len(content):>9}"
+                f"{legacy * 1000:>12.3f}{scanned * 1000:>10.3f}{parsed * 1000:>12.3f}"
+                f"{scanned / legacy:>8.2f}  {accepted}"
+            )
+
+
+if __name__ == "__main__":
+    main()
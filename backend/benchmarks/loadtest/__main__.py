@@ -0,0 +1,5 @@
+"""python -m benchmarks.loadtest - see runner.py"""
+
+from .runner import main
+
+main()
@@ -0,0 +1,184 @@
+"""
+Stub LLM endpoint for load tests - stands in for OPENROUTER_API_URL without spending quota
+
+Answers both wire formats the app speaks (see app/providers.py):
+apifreellm ({"message"} -> {"success", "response"}) and OpenAI chat
+completions ({"messages"} -> {"choices"}, SSE when "stream" is set).
+Each request draws a latency, may be rejected with 429 / 500, may hang
+past the client timeout, and otherwise returns a diagram of the
+requested type with a drawn number of elements.
+
+Distributions are given as specs:
+    fixed:S              always S
+    uniform:LO:HI        uniform between LO and HI
+    lognormal:MEDIAN:SIGMA   log-normal with that median (heavy tail)
+
+Usage (from backend/):
+    python -m benchmarks.loadtest.stub_llm --port 8765 --latency lognormal:1.5:0.6 --rate-429 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def parse_distribution(spec: str) -> Callable[[random.Random], float]:
+    """Sampler for a distribution spec (see module docstring)"""
+    kind, _, rest = spec.partition(":")
+    params = [float(value) for value in rest.split(":")] if rest else []
+    if kind == "fixed" and len(params) == 1:
+        return lambda rng: params[0]
+    if kind == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "lognormal" and len(params) == 2:
+        mu = math.log(params[0])
+        return lambda rng: rng.lognormvariate(mu, params[1])
+    raise ValueError(f"Invalid distribution spec '{spec}' (fixed:S | uniform:LO:HI | lognormal:MEDIAN:SIGMA)")
+
+
+def diagram_for(prompt: str, size: int) -> str:
+    """A valid diagram of the type the system prompt asks for, with `size` elements"""
+    size = max(size, 1)
+    if "Sequence Diagram" in prompt:
+        lines = ["sequenceDiagram", "    participant User", "    participant API", "    participant DB"]
+        for i in range(size):
+            lines += [f"    User->>API: request {i}", f"    API->>DB: query {i}", f"    DB-->>API: rows {i}", f"    API-->>User: response {i}"]
+    elif "Use Case Diagram" in prompt:
+        lines = ["flowchart LR", '    U(("User"))', '    subgraph System ["System"]']
+        lines += [f'        UC{i}(["Use case {i}"])' for i in range(size)]
+        lines += ["    end"] + [f"    U --> UC{i}" for i in range(size)]
+    elif "Activity Diagram" in prompt:
+        lines = ["flowchart TD", "    S([Start]) --> A0[Step 0]"]
+        lines += [f"    A{i}[Step {i}] --> A{i + 1}[Step {i + 1}]" for i in range(size)]
+        lines += [f"    A{size} --> E([End])"]
+    else:
+        lines = ["classDiagram"]
+        for i in range(size):
+            lines += [f"    class Entity{i} {{", "        +int id", f"        +String name{i}", "        +save() bool", "    }"]
+            if i:
+                lines.append(f"    Entity{i - 1} --> Entity{i} : owns")
+    return "\n".join(lines)
+
+
+class StubBehaviour:
+    """Per-request outcome draws and counters"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.latency = parse_distribution(args.latency)
+        self.size = parse_distribution(args.size)
+        self.rate_429 = args.rate_429
+        self.error_rate = args.error_rate
+        self.timeout_rate = args.timeout_rate
+        self.invalid_rate = args.invalid_rate
+        self.hang_seconds = args.hang_seconds
+        self.retry_after = args.retry_after
+        self.rng = random.Random(args.seed)
+        self.outcomes: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def draw(self) -> Dict:
+        with self._lock:
+            roll = self.rng.random()
+            latency = self.latency(self.rng)
+            size = int(round(self.size(self.rng)))
+        if roll < self.rate_429:
+            outcome = "429"
+        elif roll < self.rate_429 + self.error_rate:
+            outcome = "500"
+        elif roll < self.rate_429 + self.error_rate + self.timeout_rate:
+            outcome = "timeout"
+        elif roll < self.rate_429 + self.error_rate + self.timeout_rate + self.invalid_rate:
+            outcome = "invalid"
+        else:
+            outcome = "ok"
+        with self._lock:
+            self.outcomes[outcome] += 1
+        return {"outcome": outcome, "latency": latency, "size": size}
+
+
+def create_app(behaviour: StubBehaviour) -> FastAPI:
+    app = FastAPI(title="Stub LLM")
+
+    @app.get("/stats")
+    def stats():
+        with behaviour._lock:
+            return {"requests": sum(behaviour.outcomes.values()), "outcomes": dict(behaviour.outcomes)}
+
+    @app.post("/{path:path}")
+    async def complete(path: str, request: Request):
+        body = await request.json()
+        draw = behaviour.draw()
+        outcome = draw["outcome"]
+
+        if outcome == "429":
+            await asyncio.sleep(min(draw["latency"], 0.05))
+            return JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": str(behaviour.retry_after)})
+        if outcome == "timeout":
+            await asyncio.sleep(behaviour.hang_seconds)
+        if outcome == "500":
+            await asyncio.sleep(draw["latency"])
+            return JSONResponse({"error": "upstream exploded"}, status_code=500)
+
+        if "messages" in body:
+            prompt = " ".join(message.get("content", "") for message in body["messages"])
+        else:
+            prompt = body.get("message", "")
+        content = "I could not draw that, sorry." if outcome == "invalid" else diagram_for(prompt, draw["size"])
+
+        if "messages" in body and body.get("stream"):
+            return StreamingResponse(_sse(content, draw["latency"]), media_type="text/event-stream")
+
+        await asyncio.sleep(draw["latency"])
+        if "messages" in body:
+            return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+        return {"success": True, "response": content}
+
+    return app
+
+
+async def _sse(content: str, latency: float):
+    """Stream content line by line, spreading the latency over the lines"""
+    lines = content.split("\n")
+    delay = latency / max(len(lines), 1)
+    for line in lines:
+        await asyncio.sleep(delay)
+        event = {"choices": [{"delta": {"content": line + "\n"}}]}
+        yield f"data: {json.dumps(event)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Stub options, shared with the load test runner"""
+    group = parser.add_argument_group("stub LLM")
+    group.add_argument("--latency", default="lognormal:1.0:0.5", help="Upstream latency distribution in seconds")
+    group.add_argument("--size", default="uniform:3:15", help="Elements (classes / messages / steps) per diagram")
+    group.add_argument("--rate-429", type=float, default=0.0, help="Fraction of calls answered with 429")
+    group.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    group.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 500")
+    group.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of calls that hang for --hang-seconds")
+    group.add_argument("--hang-seconds", type=float, default=300.0, help="How long a timing-out call hangs")
+    group.add_argument("--invalid-rate", type=float, default=0.0, help="Fraction of calls answered with prose instead of a diagram")
+    group.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(StubBehaviour(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
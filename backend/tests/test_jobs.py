@@ -0,0 +1,41 @@
+"""
+Tests for the background job queue (app/jobs.py)
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.jobs import JobLimitExceeded, JobQueue
+from app.models import GenerationJob, User
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add(User(id=1, email="a@example.com", password_hash="x"))
+        db.commit()
+    yield factory
+    engine.dispose()
+
+
+def test_concurrent_submits_respect_the_active_job_cap(session_factory):
+    queue = JobQueue(engine=None, session_factory=session_factory, max_active_per_user=3)
+
+    async def submit_many():
+        return await asyncio.gather(
+            *(queue.submit(user_id=1, prompt=f"prompt {i}") for i in range(10)),
+            return_exceptions=True
+        )
+
+    outcomes = asyncio.run(submit_many())
+
+    assert sum(isinstance(outcome, GenerationJob) for outcome in outcomes) == 3
+    assert sum(isinstance(outcome, JobLimitExceeded) for outcome in outcomes) == 7
+    assert queue._submit_locks == {} and queue._submitters == {}
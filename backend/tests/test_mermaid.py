@@ -0,0 +1,117 @@
+"""
+Tests for the Mermaid parser (app/mermaid.py)
+"""
+
+import pytest
+
+from app.mermaid import MermaidParser, parse_mermaid, scan_mermaid
+
+
+@pytest.mark.parametrize("member", [
+    "-int count = 0",
+    '+String status = "active"',
+    "+List~Order~ orders",
+    "+find(String name, int limit = 10) Order[]",
+    "<<interface>>",
+])
+def test_class_members_are_free_text(member):
+    document = parse_mermaid(f"classDiagram\n    class A {{\n        {member}\n    }}")
+
+    assert document.valid, document.errors
+    assert document.nodes[0].children[0].args == (member,)
+
+
+def test_class_body_rejects_braces():
+    document = parse_mermaid("classDiagram\n    class A {\n        +x {\n    }\n    A --> B")
+
+    assert not document.valid
+
+
+@pytest.mark.parametrize("statement", [
+    'A["Check (x)"] --> B("Step (y)")',
+    'E(("Done (ok)"))',
+    'D{"Is [it] valid?"} -->|yes| F[["Run {job}"]]',
+    "A[Start] -->|yes| B{Valid?} & C",
+])
+def test_flowchart_shapes_allow_quoted_brackets(statement):
+    document = parse_mermaid(f"flowchart TD\n    {statement}")
+
+    assert document.valid, document.errors
+
+
+def test_unquoted_bracket_in_label_is_rejected():
+    document = parse_mermaid("flowchart TD\n    A[Check (x)] --> B(Step (y))\n    B --> C")
+
+    assert not document.valid
+
+
+def test_preamble_fence_and_trailing_prose_are_removed():
+    content = "Here you go:\n```mermaid\nsequenceDiagram\n    A->>B: hi\n```\nHope this helps!"
+
+    document = parse_mermaid(content)
+
+    assert document.valid
+    assert document.diagram_type == "sequence"
+    assert document.code == "sequenceDiagram\n    A->>B: hi"
+
+
+def test_unclosed_block_is_an_error():
+    document = parse_mermaid("sequenceDiagram\n    loop forever\n        A->>B: hi")
+
+    assert document.errors == ["line 2: 'block' block is never closed with 'end'"]
+
+
+def test_incremental_feed_matches_parse():
+    content = "classDiagram\n    class A {\n        +int id\n    }\n    A --> B : owns\nThat's all."
+    parser = MermaidParser()
+    confirmed = [line for raw in content.split("\n") for line in parser.feed(raw)]
+
+    assert "\n".join(confirmed) == parse_mermaid(content).code
+
+
+@pytest.mark.parametrize("content", [
+    "Here you go:\n```mermaid\nclassDiagram\n    class A {\n        +int id\n    }\n    A <|-- B\n```\nDone.",
+    "sequenceDiagram\n    alt ok\n        A->>B: hi\n    else\n        B-->>A: no\n    end\nLet me know if you need changes.",
+    'flowchart TD\n    A["Check (x)"] --> B{Valid?}\n    %% comment\n    B -->|yes| C',
+])
+def test_scan_agrees_with_parse(content):
+    scanned = scan_mermaid(content)
+    parsed = parse_mermaid(content)
+
+    assert scanned is not None
+    assert scanned.code == parsed.code
+    assert scanned.diagram_type == parsed.diagram_type
+    assert scanned.rejected == parsed.rejected
+    assert scanned.valid
+
+
+@pytest.mark.parametrize("content", [
+    "sequenceDiagram\n    loop forever\n        A->>B: hi",
+    "classDiagram\n    class A {\n        +x {\n    }\n    A --> B",
+    "flowchart TD\n    A[Check (x)] --> B(Step (y))\n    B --> C",
+    "flowchart TD\n    A --> B;",
+])
+def test_scan_defers_to_parser(content):
+    assert scan_mermaid(content) is None
+    assert parse_mermaid(content, ast=False).code == parse_mermaid(content).code
+
+
+@pytest.mark.parametrize("content, line", [
+    ("classDiagram\n    class classC\n    classC --> X\n    classC --() classD\n\nThis shows the classes.", 4),
+    ("sequenceDiagram\n    participant A\n    A->>B: hi\n    User#1->>A: request\n    A-->>User#1: reply", 4),
+])
+def test_trailing_statements_are_not_dropped_as_prose(content, line):
+    document = parse_mermaid(content, ast=False)
+
+    assert not document.valid
+    assert document.errors[0].startswith(f"line {line}: unrecognised statement")
+    assert scan_mermaid(content) is None
+
+
+def test_trailing_prose_is_still_dropped():
+    content = "classDiagram\n    A --> B\n\nSo... this shows A owns B.\nHope this helps!"
+
+    document = parse_mermaid(content, ast=False)
+
+    assert document.valid
+    assert document.code == "classDiagram\n    A --> B"
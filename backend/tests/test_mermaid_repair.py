@@ -0,0 +1,72 @@
+"""
+Tests for local Mermaid repair (app/mermaid_repair.py)
+"""
+
+from app.mermaid import parse_mermaid
+from app.mermaid_repair import UNBALANCED_BLOCKS, USECASE_FLOWCHART, repair_mermaid
+
+
+def repair(content):
+    return repair_mermaid(content, parse_mermaid(content))
+
+
+def test_repair_never_drops_class_members():
+    content = 'classDiagram\n    class A {\n        +String status = "active"\n    }'
+
+    document, repairs = repair(content)
+
+    assert 'status = "active"' in document.code
+    assert document.code.count("}") == 1
+    assert UNBALANCED_BLOCKS not in repairs
+
+
+def test_unclosed_class_body_is_closed_before_next_class():
+    content = "classDiagram\n    class A {\n        +int id\n    class B {\n        +int x\n    }"
+
+    document, repairs = repair(content)
+
+    assert document.valid
+    assert repairs == [UNBALANCED_BLOCKS]
+    assert [node.args[0] for node in document.nodes] == ["A", "B"]
+    assert [child.args[0] for child in document.nodes[0].children] == ["+int id"]
+
+
+
+def test_unclosed_class_body_is_closed_before_top_level_statement():
+    content = "classDiagram\n    class A {\n        +x\n    A --> B\n    note for A \"root\""
+
+    document, repairs = repair(content)
+
+    assert document.valid
+    assert repairs == [UNBALANCED_BLOCKS]
+    assert [child.args[0] for child in document.nodes[0].children] == ["+x"]
+    assert [node.kind for node in document.nodes] == ["class", "relation", "note"]
+
+def test_truncated_sequence_block_is_closed():
+    content = "sequenceDiagram\n    A->>B: hi\n    loop every minute\n        B-->>A: pong"
+
+    document, repairs = repair(content)
+
+    assert document.valid
+    assert repairs == [UNBALANCED_BLOCKS]
+    assert document.code.endswith("end")
+
+
+def test_stray_closer_is_dropped_without_losing_statements():
+    content = "classDiagram\n    class A {\n        +int id\n    }\n    }\n    A --> B"
+
+    document, repairs = repair(content)
+
+    assert document.valid
+    assert "A --> B" in document.code
+
+
+def test_usecase_diagram_becomes_flowchart():
+    content = 'usecaseDiagram\n    actor User\n    usecase "Log in" as L\n    User --> L'
+
+    document, repairs = repair(content)
+
+    assert document.valid
+    assert repairs == [USECASE_FLOWCHART]
+    assert document.diagram_type == "usecase"
+    assert document.code.startswith("flowchart LR")
@@ -0,0 +1,44 @@
+"""
+Tests for prompt budgeting (app/prompts.py)
+"""
+
+from app.prompts import AI_PROMPT_TOKEN_BUDGET, BOILERPLATE, SYSTEM_PROMPT_TOKENS, TRUNCATED, estimate_tokens, fit_prompt
+
+
+def long_prompt(characters: int) -> str:
+    sentences = [
+        f"The {name} service stores {name} records and notifies the audit log when one changes."
+        for name in ("order", "invoice", "customer", "payment", "shipment", "inventory", "warehouse", "supplier")
+    ]
+    text = ""
+    while len(text) < characters:
+        text += " ".join(f"{sentence[:-1]} ({len(text)})." for sentence in sentences) + "\n"
+    return text[:characters]
+
+
+def test_default_budget_fits_a_full_length_prompt():
+    prompt = long_prompt(10000)
+
+    fitted = fit_prompt(prompt, "class", AI_PROMPT_TOKEN_BUDGET)
+
+    assert fitted.text == prompt
+    assert fitted.steps == []
+
+
+def test_truncation_is_reported():
+    fitted = fit_prompt(long_prompt(10000), "class", budget=600)
+
+    assert fitted.steps[-1] == TRUNCATED
+    assert len(fitted.text) < 10000
+
+
+def test_politeness_removal_keeps_requirement_text():
+    requirements = "Checkout must make sure that stock is reserved. I need to track refunds. Could you add audit logs?"
+    prompt = "Please could you create a class diagram for a shop. " + requirements + " Thanks so much!"
+    budget = SYSTEM_PROMPT_TOKENS["class"] + estimate_tokens(prompt) - 1
+
+    fitted = fit_prompt(prompt, "class", budget)
+
+    assert fitted.steps == [BOILERPLATE]
+    assert requirements in fitted.text
+    assert "Please" not in fitted.text and "Thanks" not in fitted.text
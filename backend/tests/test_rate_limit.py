@@ -0,0 +1,49 @@
+"""
+Tests for the generation quota (app/rate_limit.py)
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app import rate_limit
+from app.models import SubscriptionPlan
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = rate_limit.RateLimiter(limits={SubscriptionPlan.FREE: 5}, window=86400)
+    monkeypatch.setattr(rate_limit, "rate_limiter", limiter)
+    return limiter
+
+
+def user(user_id=1):
+    return SimpleNamespace(id=user_id, subscription_plan=SubscriptionPlan.FREE)
+
+
+def test_request_larger_than_the_plan_is_rejected_up_front(limiter):
+    with pytest.raises(HTTPException) as raised:
+        rate_limit.enforce_generation_quota(user(), cost=6)
+
+    assert raised.value.status_code == 400
+    assert limiter.acquire(1, SubscriptionPlan.FREE, 5)[0]
+
+
+def test_exhausted_quota_is_a_429(limiter):
+    rate_limit.enforce_generation_quota(user(), cost=5)
+
+    with pytest.raises(HTTPException) as raised:
+        rate_limit.enforce_generation_quota(user())
+
+    assert raised.value.status_code == 429
+    assert "Retry-After" in raised.value.headers
+
+
+def test_cache_hits_and_fallbacks_are_refunded(limiter):
+    rate_limit.enforce_generation_quota(user(), cost=4)
+
+    rate_limit.refund_unbilled(user(), [{"cached": True}, {"fallback": True}, {"success": True}])
+
+    assert limiter.acquire(1, SubscriptionPlan.FREE, 3)[0]
+    assert not limiter.acquire(1, SubscriptionPlan.FREE, 1)[0]
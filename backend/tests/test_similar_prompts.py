@@ -0,0 +1,52 @@
+"""
+Tests for the near-duplicate prompt index (app/similar_prompts.py)
+"""
+
+from app.similar_prompts import SimilarPromptIndex, prompt_types, prompt_words
+
+
+def make_index(*entries):
+    index = SimilarPromptIndex(thresholds={}, default_threshold=0.85, enabled=True)
+    for key, (prompt, diagram_type) in enumerate(entries):
+        index.add_result(str(key), prompt, {"mermaid_code": f"{diagram_type}Diagram", "diagram_type": diagram_type})
+    return index
+
+
+def test_untyped_lookup_only_matches_the_named_type():
+    index = make_index(
+        ("sequence diagram for a library management system", "sequence"),
+        ("online shop checkout with payment gateway", "class"),
+    )
+
+    assert index.match("class diagram for a library management system") is None
+    entry, score = index.match("sequence diagram for library management systems")
+    assert entry.diagram_type == "sequence"
+    assert score == 1.0
+
+
+def test_untyped_lookup_without_type_words_matches_any_type():
+    index = make_index(("sequence diagram for a library management system", "sequence"))
+
+    assert index.match("library management system") is not None
+
+
+def test_prompt_types():
+    assert prompt_types("Class diagram for a school") == {"class"}
+    assert prompt_types("sequence diagram of class registration") == {"sequence"}
+    assert prompt_types("use-case model of an ATM") == {"usecase"}
+    assert prompt_types("login flow and the user class") == {"activity", "class"}
+    assert prompt_types("library management system") == frozenset()
+
+
+def test_negated_words_do_not_match_positive_mentions():
+    index = make_index(
+        ("system for doctors and patients", "class"),
+        ("inventory tracking for a warehouse", "class"),
+    )
+
+    assert index.match("hospital system without doctors and patients") is None
+    assert index.match("a system for patients and doctors") is not None
+
+
+def test_negation_covers_its_clause_only():
+    assert prompt_words("shop without payments, with customers") == {"shop", "without", "!payment", "customer"}
@@ -0,0 +1,52 @@
+"""
+Tests for bulk import reading (app/transfer.py)
+"""
+
+import asyncio
+import gzip
+import io
+import zipfile
+
+import pytest
+
+from app import transfer
+
+
+async def chunked(data: bytes, size: int = 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+def test_gzip_body_is_inflated_in_bounded_pieces():
+    body = gzip.compress(b"\n" * (8 * transfer.IMPORT_DECOMPRESS_CHUNK))
+
+    pieces = asyncio.run(collect(transfer._decompressed(chunked(body), gzip=True)))
+
+    assert b"".join(pieces) == b"\n" * (8 * transfer.IMPORT_DECOMPRESS_CHUNK)
+    assert max(map(len, pieces)) <= transfer.IMPORT_DECOMPRESS_CHUNK
+
+
+def test_oversized_zip_upload_is_rejected(monkeypatch):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("a.mmd", "classDiagram\n    A --> B\n")
+    monkeypatch.setattr(transfer, "IMPORT_MAX_BYTES", len(archive.getvalue()) - 1)
+
+    with pytest.raises(transfer.ImportTooLarge):
+        asyncio.run(collect(transfer._zip_records(chunked(archive.getvalue(), 16))))
+
+
+def test_zip_upload_within_limit_is_read():
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("a.mmd", "classDiagram\n    A --> B\n")
+
+    records = asyncio.run(collect(transfer._zip_records(chunked(archive.getvalue(), 16))))
+
+    assert [(number, source, raw["mermaid_code"]) for number, source, raw, _ in records] == [
+        (1, "a.mmd", "classDiagram\n    A --> B")
+    ]
@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
 import { adminAPI } from '../services/api';
 import DashboardLayout from '../components/DashboardLayout';
-import { Users, FileText, Crown, Activity, Trash2, Search, Zap, Clock, PieChart } from 'lucide-react';
+import { Users, FileText, Crown, Activity, Trash2, Search, Zap, Clock, PieChart, BarChart2 } from 'lucide-react';
 
 const AdminDashboardPage = () => {
     const [stats, setStats] = useState(null);
@@ -134,6 +134,34 @@ const AdminDashboardPage = () => {
                     </div>
                 )}
 
+                {/* Daily Activity */}
+                {stats?.timeseries?.length > 0 && (
+                    <div className="card mb-8">
+                        <div className="flex items-center justify-between mb-6">
+                            <h2 className="text-xl font-bold flex items-center gap-2">
+                                <BarChart2 className="w-5 h-5 text-primary-600" />
+                                Diagrams per Day
+                            </h2>
+                            <span className="text-xs text-dark-400">
+                                Last {stats.timeseries.length} days · updated {new Date(stats.generated_at + 'Z').toLocaleTimeString()}
+                            </span>
+                        </div>
+                        <div className="flex items-end gap-1 h-32">
+                            {(() => {
+                                const peak = Math.max(1, ...stats.timeseries.map(d => d.diagrams));
+                                return stats.timeseries.map((day) => (
+                                    <div
+                                        key={day.date}
+                                        className="flex-1 bg-primary-500 rounded-t"
+                                        style={{ height: `${(day.diagrams / peak) * 100}%`, minHeight: day.diagrams ? '2px' : '0' }}
+                                        title={`${day.date}: ${day.diagrams} diagrams, ${day.signups} signups`}
+                                    ></div>
+                                ));
+                            })()}
+                        </div>
+                    </div>
+                )}
+
                 <div className="grid lg:grid-cols-3 gap-8 mb-8">
                     {/* Recent Activity */}
                     <div className="lg:col-span-2 card">
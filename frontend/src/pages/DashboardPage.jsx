@@ -17,7 +17,7 @@ const DashboardPage = () => {
 
     const loadDiagrams = async () => {
         try {
-            const data = await diagramAPI.list(1, 20);
+            const data = await diagramAPI.list(20);
             setDiagrams(data.diagrams);
             setError('');
         } catch (err) {
@@ -179,7 +179,7 @@ const DashboardPage = () => {
                                             {diagram.title}
                                         </h3>
                                         <p className="text-sm text-dark-600 dark:text-dark-400 truncate">
-                                            {diagram.prompt}
+                                            {diagram.preview ?? diagram.prompt}
                                         </p>
                                     </div>
                                     <div className="flex items-center space-x-4 ml-4">
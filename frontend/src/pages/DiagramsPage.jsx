@@ -13,15 +13,38 @@ const DiagramsPage = () => {
     const [searchTerm, setSearchTerm] = useState('');
     const [filterType, setFilterType] = useState('all');
     const [viewMode, setViewMode] = useState('grid'); // 'grid' or 'list'
+    const [nextCursor, setNextCursor] = useState(null);
+    const [searchResults, setSearchResults] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         loadDiagrams();
     }, []);
 
+    // Server-side full-text search, debounced while typing
+    useEffect(() => {
+        const query = searchTerm.trim();
+        if (query.length < 2) {
+            setSearchResults(null);
+            return;
+        }
+        const timer = setTimeout(async () => {
+            try {
+                const data = await diagramAPI.search(query, 1, 50);
+                setSearchResults(data.results);
+            } catch (err) {
+                console.error('Search failed:', err);
+                setSearchResults(null);
+            }
+        }, 300);
+        return () => clearTimeout(timer);
+    }, [searchTerm]);
+
     const loadDiagrams = async () => {
         try {
-            const data = await diagramAPI.list(1, 100);
+            const data = await diagramAPI.list(100);
             setDiagrams(data.diagrams);
+            setNextCursor(data.next_cursor);
             setError('');
         } catch (err) {
             console.error('Failed to load diagrams:', err);
@@ -33,20 +56,49 @@ const DiagramsPage = () => {
         }
     };
 
+    const loadMore = async () => {
+        setLoadingMore(true);
+        try {
+            const data = await diagramAPI.list(100, nextCursor);
+            setDiagrams([...diagrams, ...data.diagrams]);
+            setNextCursor(data.next_cursor);
+        } catch (err) {
+            console.error('Failed to load more diagrams:', err);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleDelete = async (id) => {
         if (!confirm('Are you sure you want to delete this diagram?')) return;
 
         try {
             await diagramAPI.delete(id);
             setDiagrams(diagrams.filter(d => d.id !== id));
+            if (searchResults) setSearchResults(searchResults.filter(d => d.id !== id));
         } catch (err) {
             alert('Failed to delete diagram');
         }
     };
 
-    const filteredDiagrams = diagrams.filter(diagram => {
-        const matchesSearch = diagram.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-            diagram.prompt.toLowerCase().includes(searchTerm.toLowerCase());
+    const handleExport = async () => {
+        try {
+            const blob = await diagramAPI.exportAll('zip');
+            const url = URL.createObjectURL(blob);
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = 'diagrams.zip';
+            link.click();
+            URL.revokeObjectURL(url);
+        } catch (err) {
+            alert('Failed to export diagrams');
+        }
+    };
+
+    const filteredDiagrams = (searchResults ?? diagrams).filter(diagram => {
+        const matchesSearch = searchResults !== null ||
+            diagram.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
+            (diagram.preview ?? diagram.prompt).toLowerCase().includes(searchTerm.toLowerCase());
         const matchesFilter = filterType === 'all' || diagram.diagram_type === filterType;
         return matchesSearch && matchesFilter;
     });
@@ -60,7 +112,7 @@ const DiagramsPage = () => {
                         My Diagrams
                     </h1>
                     <p className="text-dark-600 dark:text-dark-400">
-                        {diagrams.length} diagram{diagrams.length !== 1 ? 's' : ''} created
+                        {diagrams.length}{nextCursor ? '+' : ''} diagram{diagrams.length !== 1 ? 's' : ''} created
                     </p>
                 </div>
 
@@ -97,6 +149,12 @@ const DiagramsPage = () => {
                                 </select>
                             </div>
 
+                            {/* Export */}
+                            <button onClick={handleExport} className="btn-secondary flex items-center space-x-2">
+                                <Download className="w-4 h-4" />
+                                <span>Export</span>
+                            </button>
+
                             {/* View Mode Toggle */}
                             <div className="flex border border-dark-200 dark:border-dark-700 rounded-lg overflow-hidden">
                                 <button
@@ -148,20 +206,41 @@ const DiagramsPage = () => {
                         ))}
                     </div>
                 )}
+
+                {!loading && !error && nextCursor && !searchResults && (
+                    <div className="flex justify-center mt-8">
+                        <button onClick={loadMore} disabled={loadingMore} className="btn-secondary">
+                            {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                    </div>
+                )}
             </div>
         </DashboardLayout>
     );
 };
 
+// Renders <mark>...</mark> from search highlights as text nodes, never as HTML
+const Highlighted = ({ text }) => (
+    <>
+        {text.split(/(<mark>.*?<\/mark>)/g).map((part, i) =>
+            part.startsWith('<mark>') && part.endsWith('</mark>')
+                ? <mark key={i} className="bg-yellow-200 dark:bg-yellow-700/50 rounded px-0.5">{part.slice(6, -7)}</mark>
+                : part
+        )}
+    </>
+);
+
 const DiagramCard = ({ diagram, viewMode, onDelete }) => {
     if (viewMode === 'list') {
         return (
             <div className="card hover:shadow-lg transition-shadow">
                 <div className="flex items-center justify-between">
                     <div className="flex-1 min-w-0">
-                        <h3 className="font-bold text-lg mb-1 truncate">{diagram.title}</h3>
+                        <h3 className="font-bold text-lg mb-1 truncate">
+                            <Highlighted text={diagram.title_highlight ?? diagram.title} />
+                        </h3>
                         <p className="text-sm text-dark-600 dark:text-dark-400 mb-2 truncate">
-                            {diagram.prompt}
+                            <Highlighted text={diagram.snippet ?? diagram.preview ?? diagram.prompt} />
                         </p>
                         <div className="flex items-center space-x-4 text-xs text-dark-500">
                             <span className="px-2 py-1 bg-primary-100 dark:bg-primary-900/20 text-primary-700 dark:text-primary-400 rounded capitalize">
@@ -198,9 +277,11 @@ const DiagramCard = ({ diagram, viewMode, onDelete }) => {
     return (
         <div className="card hover:shadow-lg transition-shadow">
             <div className="mb-4">
-                <h3 className="font-bold text-lg mb-2 truncate">{diagram.title}</h3>
+                <h3 className="font-bold text-lg mb-2 truncate">
+                    <Highlighted text={diagram.title_highlight ?? diagram.title} />
+                </h3>
                 <p className="text-sm text-dark-600 dark:text-dark-400 line-clamp-2 mb-3">
-                    {diagram.prompt}
+                    <Highlighted text={diagram.snippet ?? diagram.preview ?? diagram.prompt} />
                 </p>
                 <div className="flex items-center justify-between text-xs text-dark-500">
                     <span className="px-2 py-1 bg-primary-100 dark:bg-primary-900/20 text-primary-700 dark:text-primary-400 rounded capitalize">
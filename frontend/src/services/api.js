@@ -63,14 +63,54 @@ export const authAPI = {
 
 // Diagram API
 export const diagramAPI = {
-    generate: async (prompt, diagramType = null) => {
+    generate: async (prompt, diagramType = null, bypassCache = false) => {
         const response = await api.post('/diagrams/generate', {
             prompt,
             diagram_type: diagramType,
+            bypass_cache: bypassCache,
         });
         return response.data;
     },
 
+    // Streams Mermaid lines via Server-Sent Events; onLine is called per line
+    // and the final `done` payload (full code + diagram_type) is returned.
+    generateStream: async (prompt, diagramType = null, onLine = () => {}) => {
+        const token = localStorage.getItem('token');
+        const response = await fetch(`${API_URL}/diagrams/generate/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                ...(token ? { Authorization: `Bearer ${token}` } : {}),
+            },
+            body: JSON.stringify({ prompt, diagram_type: diagramType }),
+        });
+        if (!response.ok) {
+            throw new Error(`Stream request failed with status ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let done = null;
+
+        while (true) {
+            const { value, done: finished } = await reader.read();
+            if (finished) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const raw of events) {
+                const event = raw.match(/^event: (.*)$/m)?.[1];
+                const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+                if (event === 'line') onLine(data.line);
+                else if (event === 'done') done = data;
+                else if (event === 'error') throw new Error(data.error);
+            }
+        }
+        return done;
+    },
+
     save: async (prompt, title, mermaidCode, diagramType) => {
         const response = await api.post('/diagrams/save', {
             prompt,
@@ -81,8 +121,22 @@ export const diagramAPI = {
         return response.data;
     },
 
-    list: async (page = 1, pageSize = 20) => {
-        const response = await api.get(`/diagrams/?page=${page}&page_size=${pageSize}`);
+    list: async (pageSize = 20, cursor = null) => {
+        const params = new URLSearchParams({ page_size: pageSize });
+        if (cursor) params.set('cursor', cursor);
+        const response = await api.get(`/diagrams/?${params}`);
+        return response.data;
+    },
+
+    search: async (query, page = 1, pageSize = 20) => {
+        const params = new URLSearchParams({ q: query, page, page_size: pageSize });
+        const response = await api.get(`/diagrams/search?${params}`);
+        return response.data;
+    },
+
+    // Whole library as a file download: 'zip' (one .mmd per diagram) or 'ndjson'
+    exportAll: async (format = 'zip') => {
+        const response = await api.get(`/diagrams/export?format=${format}`, { responseType: 'blob' });
         return response.data;
     },
 
@@ -98,8 +152,8 @@ export const diagramAPI = {
 };
 
 export const adminAPI = {
-    getStats: async () => {
-        const response = await api.get('/admin/stats');
+    getStats: async (days = 30) => {
+        const response = await api.get(`/admin/stats?days=${days}`);
         return response.data;
     },
     getUsers: async (skip = 0, limit = 100) => {
@@ -109,6 +163,12 @@ export const adminAPI = {
     deleteUser: async (userId) => {
         const response = await api.delete(`/admin/users/${userId}`);
         return response.data;
+    },
+    updateUserPlan: async (userId, subscriptionPlan) => {
+        const response = await api.put(`/admin/users/${userId}/plan`, {
+            subscription_plan: subscriptionPlan,
+        });
+        return response.data;
     }
 };
 